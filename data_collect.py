@@ -1,12 +1,17 @@
 # imports
-from selenium import webdriver
 import pandas as pd
 import time
 import requests
+from downloader import download_all, discover_files, filename_from_link, RECORD_ID, ZENODO_RECORD
 
 # start timer
 start = time.time()
 
+# link discovery reads the Zenodo record over plain HTTP; set USE_SELENIUM to collect the links with Chrome instead
+USE_SELENIUM = False
+# replace with path of chromedriver on your computer (only used with USE_SELENIUM)
+CHROMEDRIVER = '/Users/visheshnarayan/Documents/Autism Research/data/chromedriver'
+
 # ------------------------------------------------ functions ------------------------------------------------ #
 def get_links(button):
     '''List comprehension function for error handling'''
@@ -15,70 +20,54 @@ def get_links(button):
     except AttributeError:
         pass
 
-# progress bar function, credits to user Greenstick on StackOverflow
-# https://stackoverflow.com/questions/3173320/text-progress-bar-in-terminal-with-block-characters/13685020
-def printProgressBar (iteration, total, prefix = '', suffix = '', decimals = 1, length = 100, fill = '█', printEnd = "\r"):
-    """
-    Call in a loop to create terminal progress bar
-    @params:
-        iteration   - Required  : current iteration (Int)
-        total       - Required  : total iterations (Int)
-        prefix      - Optional  : prefix string (Str)
-        suffix      - Optional  : suffix string (Str)
-        decimals    - Optional  : positive number of decimals in percent complete (Int)
-        length      - Optional  : character length of bar (Int)
-        fill        - Optional  : bar fill character (Str)
-        printEnd    - Optional  : end character (e.g. "\r", "\r\n") (Str)
-    """
-    percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
-    filledLength = int(length * iteration // total)
-    bar = fill * filledLength + '-' * (length - filledLength)
-    print(f'\r{prefix} [{bar}] {percent}% {suffix}', end = printEnd)
-    # Print New Line on Complete
-    if iteration == total: 
-        print()
+def selenium_links(url, executable_path):
+    '''Collects the "Download" buttons of the record page in Chrome (selenium is only imported when this is used)'''
+    from selenium import webdriver
+    driver = webdriver.Chrome(executable_path=executable_path)
+    try:
+        driver.get(url)
+        buttons = driver.find_elements("link text", "Download")
+        links = [link for link in (get_links(button) for button in buttons) if link]
+    finally:
+        driver.quit()
+    return pd.DataFrame(data={'links': links, 'filename': [filename_from_link(link) for link in links], 'size': None, 'checksum': None})
 
 # ------------------------------------------------ collect links ------------------------------------------------ #
 
-# open website
-# replace executable_path to path of chromedriver on your computer
-driver = webdriver.Chrome(executable_path='/Users/visheshnarayan/Documents/Autism Research/data/chromedriver')
-driver.get("https://zenodo.org/record/5786860#.Y6VB_ezMKhc")
-
-# collect buttons
-buttons = driver.find_elements("link text", "Download")
+try:
+    if USE_SELENIUM:
+        df = selenium_links(ZENODO_RECORD + RECORD_ID, CHROMEDRIVER)
+    else:
+        df = discover_files(RECORD_ID)
 
-# update user in terminal
-print(f"Links retrieved::{len(list(buttons))}")
-print("Storing links in Pandas DataFrame")
+    # update user in terminal
+    print(f"Links retrieved::{len(df)}")
+    print("Storing links in Pandas DataFrame")
 
-# storing in dataframe
-# df = pd.DataFrame(data={'links': [get_links(button) for button in buttons]})
-# df.to_csv("/Users/visheshnarayan/Documents/Autism Research/data/data_links.csv")
-print("Created CSV with all download links")
+    # storing in dataframe
+    df.to_csv("data_links.csv", index=False)
+    print("Created CSV with all download links")
+except requests.RequestException as e:
+    # offline: fall back to the links saved by an earlier run
+    print(f"Couldn't retrieve links ({e}), using data_links.csv")
 
 # ------------------------------------------------ download files ------------------------------------------------ #
 
 # opens links file
 df = pd.read_csv("data_links.csv")
 links = list(df.links)
+# expected checksums from the records API (older links files don't have them)
+checksums = {}
+if 'checksum' in df.columns:
+    checksums = {filename_from_link(link): checksum for link, checksum in zip(df.links, df.checksum) if isinstance(checksum, str)}
 
 # number of links
 l = len(links)
 print(f"Downloading {l} files")
 
-# for link in links, download file
-for i, link in enumerate(links):
-    filename = link[link.find("files/")+6:link.find("?")]
-    response = requests.get(link)
-    try:
-        with open(filename, "wb") as f:
-            f.write(response.content)
-    except:
-        print("Couldn't download", filename)
-
-    # print progress
-    printProgressBar(i + 1, l, prefix = 'Progress:', suffix = 'Complete', length = 50, fill='=')
+# download files on a pool of workers, streaming each to disk and resuming partial downloads
+# files already recorded as valid in download_manifest.csv are skipped, so re-running only fetches missing or changed files
+failed = download_all(links, workers=4, checksums=checksums)
 
 print("[----------------------- Done -----------------------]")
 print("Execution Time::"+str(time.time()-start)+" seconds")
@@ -0,0 +1,272 @@
+# imports
+import os
+import re
+import time
+import hashlib
+import requests
+import pandas as pd
+from html.parser import HTMLParser
+from urllib.parse import urlparse, unquote, urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+# ------------------------------------------------ settings ------------------------------------------------ #
+CHUNK_SIZE = 1 << 20   # bytes written per streamed chunk
+TIMEOUT = 60           # seconds to wait for the server to connect/send data
+RETRIES = 5            # attempts per file before giving up
+BACKOFF = 1.0          # seconds before the first retry, doubled after every failed attempt
+RECORD_ID = "5786860"  # ReCANVo on Zenodo
+ZENODO_API = "https://zenodo.org/api/records/"
+ZENODO_RECORD = "https://zenodo.org/record/"
+MANIFEST_NAME = "download_manifest.csv"    # kept in the download folder
+MANIFEST_COLUMNS = ["filename", "size", "checksum", "status"]
+
+# ------------------------------------------------ functions ------------------------------------------------ #
+# progress bar function, credits to user Greenstick on StackOverflow
+# https://stackoverflow.com/questions/3173320/text-progress-bar-in-terminal-with-block-characters/13685020
+def printProgressBar (iteration, total, prefix = '', suffix = '', decimals = 1, length = 100, fill = '█', printEnd = "\r"):
+    """
+    Call in a loop to create terminal progress bar
+    @params:
+        iteration   - Required  : current iteration (Int)
+        total       - Required  : total iterations (Int)
+        prefix      - Optional  : prefix string (Str)
+        suffix      - Optional  : suffix string (Str)
+        decimals    - Optional  : positive number of decimals in percent complete (Int)
+        length      - Optional  : character length of bar (Int)
+        fill        - Optional  : bar fill character (Str)
+        printEnd    - Optional  : end character (e.g. "\r", "\r\n") (Str)
+    """
+    percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
+    filledLength = int(length * iteration // total)
+    bar = fill * filledLength + '-' * (length - filledLength)
+    print(f'\r{prefix} [{bar}] {percent}% {suffix}', end = printEnd)
+    # Print New Line on Complete
+    if iteration == total:
+        print()
+
+def filename_from_link(link):
+    '''Name of the file a Zenodo link points to, e.g. .../files/P01.zip?download=1 -> P01.zip'''
+    path = unquote(urlparse(link).path)
+    name = path[path.find("files/")+6:] if "files/" in path else os.path.basename(path)
+    if name.endswith("/content"):
+        name = name[:-len("/content")]
+    return os.path.basename(name)
+
+def make_session(pool_size=8):
+    '''One HTTP session shared by all workers, so connections to the server are kept open and reused'''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def download_file(session, link, path, chunk_size=CHUNK_SIZE, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+    '''
+    Streams link to path, writing to path + ".part" until the download is complete
+    If a .part file is left from an earlier attempt (or run), the download resumes from its end with an HTTP Range request
+    A .part file that doesn't match the length of the file on the server is deleted and the download starts again
+    Failed attempts are retried with exponential backoff; the last error is raised if every attempt fails
+    Returns the number of bytes received
+    '''
+    part = path + ".part"
+    received = 0
+    for attempt in range(retries):
+        try:
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+            with session.get(link, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416 and offset > 0:
+                    # the server has nothing after the end of the .part file: it is complete if it is as long as the file ("Content-Range: bytes */N"),
+                    # otherwise it is left from a different version of the file (or corrupt) and the download starts again from the beginning
+                    match = re.fullmatch(r"bytes \*/(\d+)", response.headers.get("Content-Range", "").strip())
+                    total = int(match.group(1)) if match else None
+                    if total == offset:
+                        break
+                    os.remove(part)
+                    raise IOError(f"the .part file holds {offset} bytes but the file has {total if total is not None else 'an unknown number of'}; restarting")
+                response.raise_for_status()
+                if offset > 0 and response.status_code != 206:
+                    # the server ignored the Range header and is sending the whole file
+                    offset = 0
+                expected = response.headers.get("Content-Length")
+                written = 0
+                with open(part, "ab" if offset > 0 else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        written += len(chunk)
+                received += written
+                if expected is not None and written < int(expected):
+                    raise IOError(f"connection closed after {written} of {expected} bytes")
+            break
+        except (requests.RequestException, IOError) as e:
+            status = e.response.status_code if isinstance(e, requests.HTTPError) and e.response is not None else None
+            if attempt == retries - 1 or (status is not None and 400 <= status < 500 and status not in (408, 429)):
+                # out of attempts, or the server refused the request (e.g. 404), which retrying won't fix
+                raise
+            wait = backoff * 2 ** attempt
+            print(f"\nRetrying {os.path.basename(path)} in {wait:.0f}s ({e})")
+            time.sleep(wait)
+    os.replace(part, path)
+    return received
+
+def file_checksum(path, algorithm="md5", chunk_size=CHUNK_SIZE):
+    '''Hashes a file in chunks, so large archives are never read into memory at once. Returns "<algorithm>:<hex digest>" (the format Zenodo lists checksums in)'''
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return f"{algorithm}:{digest.hexdigest()}"
+
+def load_manifest(path):
+    '''Reads the download manifest into a dictionary of rows keyed by filename (empty if there is no manifest yet)'''
+    if not os.path.exists(path):
+        return {}
+    df = pd.read_csv(path, dtype={"filename": str, "checksum": str, "status": str})
+    return {row["filename"]: row for row in df[MANIFEST_COLUMNS].to_dict("records")}
+
+def save_manifest(path, manifest):
+    '''Writes the manifest, replacing the old one in one step so an interrupted run can't leave it half written'''
+    df = pd.DataFrame([manifest[filename] for filename in sorted(manifest)], columns=MANIFEST_COLUMNS)
+    df.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+def is_valid(path, row, expected=None, verify=False):
+    '''
+    Checks whether a file already on disk can be skipped
+    The file must be marked ok in the manifest with the same size (and the expected checksum, if one is known)
+    With verify=True the file is also re-hashed, which catches files that changed without changing size
+    '''
+    if row is None or row["status"] != "ok" or not os.path.exists(path) or os.path.getsize(path) != row["size"]:
+        return False
+    if expected is not None and row["checksum"] != expected:
+        return False
+    return not verify or file_checksum(path, row["checksum"].split(":")[0]) == row["checksum"]
+
+def sync_file(session, link, path, row=None, expected=None, verify=False, **kwargs):
+    '''
+    Downloads link to path unless the manifest row shows a valid copy is already there, then hashes the file and checks it against expected
+    A file whose checksum doesn't match is removed, so the next run downloads it again
+    Returns (manifest row, bytes received, whether the download was skipped)
+    '''
+    if is_valid(path, row, expected, verify):
+        return dict(row), 0, True
+    received = download_file(session, link, path, **kwargs)
+    algorithm = expected.split(":")[0] if expected is not None else "md5"
+    checksum = file_checksum(path, algorithm)
+    status = "ok"
+    if expected is not None and checksum != expected:
+        os.remove(path)
+        status = "corrupt"
+    return {"filename": os.path.basename(path), "size": os.path.getsize(path) if status == "ok" else 0, "checksum": checksum, "status": status}, received, False
+
+def download_all(links, folder=".", workers=4, checksums=None, verify=False, **kwargs):
+    '''
+    Downloads links into folder with a pool of worker threads sharing one session
+    Files already listed as valid in the folder's manifest are skipped; every downloaded file is hashed and recorded in the manifest
+    checksums: optional dictionary of filename -> expected checksum ("md5:<hex>"); files that don't match are marked corrupt and deleted
+    verify: re-hash files that are already present instead of trusting their manifest entry
+    Extra keyword arguments are passed to download_file
+    Returns a list of (filename, error) for the files that could not be downloaded or failed their checksum
+    '''
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    checksums = checksums or {}
+    session = make_session(workers)
+    failed = []
+    counts = {"downloaded": 0, "skipped": 0, "corrupt": 0, "failed": 0}
+    total_bytes = 0
+    l = len(links)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for link in links:
+            filename = filename_from_link(link)
+            futures[pool.submit(sync_file, session, link, os.path.join(folder, filename), manifest.get(filename), checksums.get(filename),
+                                verify, **kwargs)] = filename
+        for i, future in enumerate(as_completed(futures)):
+            filename = futures[future]
+            try:
+                row, received, skipped = future.result()
+                total_bytes += received
+                if row["status"] == "corrupt":
+                    counts["corrupt"] += 1
+                    failed.append((filename, f"checksum {row['checksum']} does not match {checksums[filename]}"))
+                else:
+                    counts["skipped" if skipped else "downloaded"] += 1
+            except Exception as e:
+                row = {"filename": filename, "size": 0, "checksum": "", "status": "failed"}
+                counts["failed"] += 1
+                failed.append((filename, str(e)))
+            manifest[filename] = row
+            save_manifest(manifest_path, manifest)
+            # print progress
+            printProgressBar(i + 1, l, prefix = 'Progress:', suffix = 'Complete', length = 50, fill='=')
+    for filename, error in failed:
+        print("Couldn't download", filename, ":", error)
+    print(f"Downloaded {counts['downloaded']}, skipped {counts['skipped']} already valid, {counts['corrupt']} corrupt, {counts['failed']} failed "
+          f"({total_bytes/1e6:.1f} MB received)")
+    return failed
+
+# ------------------------------------------------ link discovery ------------------------------------------------ #
+def parse_record_json(record):
+    '''
+    Lists the files of a Zenodo record from its JSON (as returned by the records API)
+    Returns a DataFrame with the columns links, filename, size, checksum
+    '''
+    files = record.get("files", [])
+    if isinstance(files, dict):
+        # newer API versions nest the files under "entries", keyed by filename
+        files = files.get("entries", [])
+        files = list(files.values()) if isinstance(files, dict) else files
+    rows = []
+    for f in files:
+        links = f.get("links", {})
+        link = links.get("self") or links.get("content") or links.get("download")
+        if link is None:
+            continue
+        name = f.get("key") or f.get("filename") or filename_from_link(link)
+        rows.append({"links": link, "filename": name, "size": f.get("size", f.get("filesize")), "checksum": f.get("checksum")})
+    return pd.DataFrame(rows, columns=["links", "filename", "size", "checksum"])
+
+class DownloadLinkParser(HTMLParser):
+    '''Collects the file download anchors (the "Download" buttons) of a Zenodo record page'''
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        href = dict(attrs).get("href")
+        if tag != "a" or href is None or "/files/" not in href:
+            return
+        if "download=1" in href or href.rstrip("/").endswith("/content"):
+            link = urljoin(self.base_url, href)
+            if link not in self.links:
+                self.links.append(link)
+
+def parse_record_html(html, base_url=ZENODO_RECORD):
+    '''Lists the files of a Zenodo record from its HTML page. Returns the same columns as parse_record_json (size and checksum are not on the page)'''
+    parser = DownloadLinkParser(base_url)
+    parser.feed(html)
+    return pd.DataFrame({"links": parser.links, "filename": [filename_from_link(link) for link in parser.links],
+                         "size": None, "checksum": None}, columns=["links", "filename", "size", "checksum"])
+
+def discover_files(record_id=RECORD_ID, session=None, timeout=TIMEOUT):
+    '''
+    Finds the download links of a Zenodo record with plain HTTP requests (no browser)
+    The records API is tried first, since it also lists sizes and checksums; the record page is parsed if the API request fails
+    '''
+    session = session or make_session(1)
+    try:
+        response = session.get(ZENODO_API + record_id, timeout=timeout, headers={"Accept": "application/json"})
+        response.raise_for_status()
+        files = parse_record_json(response.json())
+        if len(files) > 0:
+            return files
+    except (requests.RequestException, ValueError) as e:
+        print(f"Records API unavailable ({e}), reading the record page instead")
+    url = ZENODO_RECORD + record_id
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return parse_record_html(response.text, url)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batches samples from a feature store (see feature_store) with length bucketing: segments are grouped by duration, and each batch is only padded
+to the longest segment of its bucket instead of the longest segment in the corpus.  Alternatively every sample is cropped, padded, or tiled to a fixed window
+"""
+
+import numpy as np
+from feature_store import *
+
+n_buckets = 4 #Number of duration buckets
+fit_modes = ('pad', 'crop', 'tile')
+
+#This function chooses the bucket boundaries from the distribution of segment durations, so each bucket holds about the same number of segments
+
+#Inputs
+#durations: array of segment durations (e.g. the 'Segment duration' column, in s)
+#n_buckets: number of buckets
+
+#Returns
+#boundaries: sorted array of up to n_buckets-1 durations; bucket k holds the durations between boundaries[k-1] and boundaries[k]
+def duration_boundaries(durations, n_buckets=n_buckets):
+    durations = np.asarray(durations, dtype=np.float64)
+    if len(durations) == 0 or n_buckets <= 1:
+        return np.zeros(0)
+    return np.unique(np.quantile(durations, np.linspace(0, 1, n_buckets+1)[1:-1]))
+
+#This function finds the bucket of each segment
+def bucket_index(durations, boundaries):
+    return np.searchsorted(boundaries, np.asarray(durations, dtype=np.float64), side='right')
+
+#This function returns the number of frames along the time (last) axis of every sample of a feature, read from the store's index without touching the data
+def sample_lengths(store, feature):
+    entry = store['features'][feature]
+    return entry['index'][:, -2] if entry['complex'] else entry['index'][:, -1] #Complex features have an extra (real, imaginary) dimension at the end
+
+#This function fits a sample to a given length along its time (last) axis
+
+#Inputs
+#value: the sample's array
+#length: number of frames to return
+#mode: what to do with samples shorter than length: 'pad' with zeros, or 'tile' (repeat the sample); 'crop' behaves like 'pad' for short samples.
+#Samples longer than length are always cropped
+
+#Returns
+#Array with the same leading dimensions as value and length frames
+def fit_length(value, length, mode='pad'):
+    n = value.shape[-1]
+    if n >= length:
+        return value[..., :length]
+    if mode == 'tile' and n > 0:
+        reps = -(-length // n) #ceil(length / n)
+        return np.concatenate([value]*reps, axis=-1)[..., :length]
+    out = np.zeros(value.shape[:-1] + (length,), dtype=value.dtype)
+    out[..., :n] = value
+    return out
+
+#This function stacks samples into one batch array, fitting each to length (see fit_length)
+def make_batch(store, feature, indices, length, mode='pad'):
+    return np.stack([fit_length(load_sample(store, feature, i), length, mode) for i in indices])
+
+#This function splits samples into batches by duration bucket
+
+#Inputs
+#store: feature store returned by open_feature_store
+#feature: name of the feature to batch
+#batch_size: number of samples per batch
+#indices: the samples to batch (e.g. the training split); all samples if None
+#durations: duration of every sample in the store, used to choose the buckets.  Defaults to the 'Segment duration' metadata column, or to the sample lengths
+#if there is no such column
+#n_buckets: number of duration buckets
+#window: if not None, every sample is fitted to this many frames and buckets are not used
+#mode: how samples are fitted to the bucket maximum or the window (see fit_length)
+#shuffle: shuffle the samples within each bucket, and the order of the batches
+#seed: random seed for the shuffle
+#drop_remainder: drop the last, smaller batch of each bucket
+
+#Returns (yields)
+#(batch_indices, batch): the store positions of the samples in the batch, and an array of shape (len(batch_indices), ..., length)
+def bucket_batches(store, feature, batch_size=32, indices=None, durations=None, n_buckets=n_buckets, window=None, mode='pad', shuffle=True, seed=None,
+                   drop_remainder=False):
+    if mode not in fit_modes:
+        raise ValueError('mode must be one of %s' % (fit_modes,))
+    lengths = sample_lengths(store, feature)
+    indices = np.arange(len(lengths)) if indices is None else np.asarray(indices)
+    if durations is None:
+        durations = store['metadata']['Segment duration'].to_numpy() if 'Segment duration' in store['metadata'].columns else lengths
+    durations = np.asarray(durations)[indices]
+    rng = np.random.default_rng(seed)
+
+    if window is not None:
+        buckets = np.zeros(len(indices), dtype=int)
+    else:
+        buckets = bucket_index(durations, duration_boundaries(durations, n_buckets))
+
+    batches = []
+    for bucket in np.unique(buckets):
+        members = indices[buckets == bucket]
+        length = window if window is not None else int(lengths[members].max()) #Pad to the longest sample of this bucket only
+        if shuffle:
+            members = rng.permutation(members)
+        for start in range(0, len(members), batch_size):
+            batch_indices = members[start:start+batch_size]
+            if drop_remainder and len(batch_indices) < batch_size:
+                continue
+            batches.append((batch_indices, length))
+    if shuffle:
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+
+    for batch_indices, length in batches:
+        yield batch_indices, make_batch(store, feature, batch_indices, length, mode)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Computes the classifier features (signal, FFT, spectrogram, log-spectrogram, MFCC, ...) for the audio segments listed in a segment .csv file
+(the AudioSegments_<token>_<day>.csv file written by segment_data, or the dataset's file directory).  Each segment is decoded once, the STFT is
+computed once and reused for every STFT-based feature, only the requested features are kept, and the segments are spread over a process pool.
+The STFT, log-mel, and MFCC features come from the inference engine's front end (inference/frontend.py), so a model trained on them sees the
+same features on the device
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import sys
+import librosa
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'inference')) #The front end is shared with the inference engine
+import frontend
+
+sr = 22050 #Sampling rate the segments are loaded at
+n_fft = 2048
+hop_length = 512
+n_mfcc = 13
+n_mels = frontend.n_mels
+
+all_features = ('signal', 'fft', 'mag', 'freq', 'l_mag', 'l_freq', 'stft', 'spectrogram', 'log_spec', 'log_mel', 'mfcc')
+feature_aliases = {'mffc': 'mfcc'} #Name used for the MFCC column in vocal_classification.ipynb
+fft_features = ('fft', 'mag', 'freq', 'l_mag', 'l_freq')
+stft_features = ('stft', 'spectrogram', 'log_spec', 'log_mel', 'mfcc')
+complex_features = ('fft', 'stft')
+feature_ranks = {'signal': 1, 'fft': 1, 'mag': 1, 'freq': 1, 'l_mag': 1, 'l_freq': 1, 'stft': 2, 'spectrogram': 2, 'log_spec': 2, 'log_mel': 2,
+                 'mfcc': 2} #Number of dimensions of each feature's array (for mono audio)
+
+#This function checks the requested feature names and returns them with any aliases resolved
+def resolve_features(features):
+    resolved = [feature_aliases.get(name, name) for name in features]
+    unknown = [name for name, feature in zip(features, resolved) if feature not in all_features]
+    if unknown:
+        raise ValueError('Unknown features %s; choose from %s' % (unknown, list(all_features) + list(feature_aliases)))
+    return resolved
+
+#This function computes the requested features of a single audio signal
+#Intermediate results are shared: the FFT magnitude is computed once for mag/l_mag, and the STFT once for the spectrogram, log-spectrogram, log-mel
+#spectrogram, and MFCC.  The STFT, log-mel, and MFCC are computed by the inference front end (frontend.stft, frontend.log_mel, frontend.mfcc), which
+#gives the same values as librosa.stft, librosa.power_to_db(librosa.feature.melspectrogram(...)), and librosa.feature.mfcc
+
+#Inputs
+#y: audio time series
+#features: list of feature names (see all_features)
+#sr, n_fft, hop_length, n_mfcc: analysis parameters
+
+#Returns
+#Dictionary mapping each requested feature name to its array
+def compute_features(y, features, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mfcc=n_mfcc):
+    out = {}
+    if 'signal' in features:
+        out['signal'] = y
+
+    if any(name in features for name in fft_features):
+        fft = np.fft.fft(y)
+        mag = np.abs(fft)
+        freq = np.linspace(0, sr, len(mag))
+        half = int(len(mag)/2)
+        for name, value in (('fft', fft), ('mag', mag), ('freq', freq), ('l_mag', mag[:half]), ('l_freq', freq[:half])):
+            if name in features:
+                out[name] = value
+
+    if any(name in features for name in stft_features):
+        stft = frontend.stft(y, n_fft=n_fft, hop_length=hop_length)
+        spectrogram = np.abs(stft)
+        if 'stft' in features:
+            out['stft'] = stft
+        if 'spectrogram' in features:
+            out['spectrogram'] = spectrogram
+        if 'log_spec' in features:
+            out['log_spec'] = librosa.amplitude_to_db(spectrogram)
+        if 'log_mel' in features or 'mfcc' in features:
+            mel = frontend.log_mel(sr=sr, n_fft=n_fft, S=spectrogram**2, n_mels=n_mels)
+            if 'log_mel' in features:
+                out['log_mel'] = mel
+            if 'mfcc' in features:
+                out['mfcc'] = frontend.dct_matrix(n_mfcc, n_mels) @ mel
+    return out
+
+#This function decodes one segment file and computes its features.  It is run on the worker processes by extract_features
+def file_features(path, features, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mfcc=n_mfcc):
+    y, file_sr = librosa.load(path, sr=sr)
+    return compute_features(y, features, file_sr, n_fft, hop_length, n_mfcc)
+
+#This function computes features for every segment listed in a segment .csv file
+
+#Inputs
+#segments: path to the segment .csv file, or a dataframe read from it
+#features: list of feature names to compute (see all_features; 'mffc' is accepted for 'mfcc')
+#path_column: column with the path of each segment's audio file ('Segment path' in the files written by segment_data, 'Filename' in the dataset's file directory)
+#audio_root: folder the paths in path_column are relative to (None if they are complete paths)
+#workers: number of processes (1 computes the features in this process)
+#chunksize: number of segments sent to a worker at a time; larger values cut the overhead of passing many short segments between processes
+#sr, n_fft, hop_length, n_mfcc: analysis parameters
+
+#Returns
+#featureDF: the segment dataframe with one added column per requested feature, holding that feature's array for each segment
+def extract_features(segments, features=('mfcc',), path_column='Segment path', audio_root=None, workers=1, chunksize=16, sr=sr, n_fft=n_fft,
+                     hop_length=hop_length, n_mfcc=n_mfcc):
+    featureDF = pd.read_csv(segments) if not isinstance(segments, pd.DataFrame) else segments.copy()
+    resolved = resolve_features(features)
+    paths = list(featureDF[path_column])
+    if audio_root is not None:
+        paths = [os.path.join(audio_root, path) for path in paths]
+
+    args = [resolved]*len(paths)
+    params = [[value]*len(paths) for value in (sr, n_fft, hop_length, n_mfcc)]
+    if workers is None or workers <= 1:
+        results = list(map(file_features, paths, args, *params))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(file_features, paths, args, *params, chunksize=chunksize)) #Results come back in the order of the rows
+
+    for name, feature in zip(features, resolved):
+        featureDF[name] = [result[feature] for result in results]
+    print('Computed %s for %d segments' % (', '.join(features), len(featureDF)))
+    return featureDF
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute classifier features for the audio segments in a segment .csv file')
+    parser.add_argument('segments', help='segment .csv file (AudioSegments_<token>_<day>.csv, or the dataset file directory)')
+    parser.add_argument('output', help='path to save the dataframe with the features to (pickle)')
+    parser.add_argument('-f', '--features', nargs='+', default=['mfcc'], help='features to compute: ' + ', '.join(all_features))
+    parser.add_argument('--path-column', default='Segment path', help='column with the path of each segment')
+    parser.add_argument('--audio-root', default=None, help='folder the segment paths are relative to')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='number of processes')
+    args = parser.parse_args()
+
+    featureDF = extract_features(args.segments, args.features, path_column=args.path_column, audio_root=args.audio_root, workers=args.workers)
+    featureDF.to_pickle(args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk store for segment features.  Each feature is kept as one contiguous float32 file with an index of where each segment's array starts
+and what shape it has, next to a metadata table with one row per segment.  The feature files are opened with np.memmap, so opening a store
+takes no time and reading a batch only touches the bytes of that batch
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from extract_features import *
+
+metadata_file_name = 'metadata.csv'
+info_file_name = 'store.json'
+
+#This function writes a feature store one segment at a time, so only one segment's features are in memory at once
+#Complex features (fft, stft) are stored as float32 (real, imaginary) pairs, i.e. with an extra last dimension of size 2
+
+#Inputs
+#store_path: folder to write the store to (created if needed; existing feature files in it are replaced)
+#metadataDF: dataframe with one row per segment (e.g. segment path, participant, label)
+#feature_rows: iterable with one dictionary of feature arrays per row of metadataDF, in the same order (as returned by compute_features)
+#features: names of the features to store
+#params: optional dictionary of analysis parameters to record with the store
+
+#Returns
+#store_path
+def write_feature_store(store_path, metadataDF, feature_rows, features, params=None):
+    os.makedirs(store_path, exist_ok=True)
+    files = {name: open(os.path.join(store_path, name + '.f32'), 'wb') for name in features}
+    index = {name: [] for name in features}
+    is_complex = {}
+    offsets = dict.fromkeys(features, 0)
+    try:
+        for row in feature_rows:
+            for name in features:
+                value = np.asarray(row[name])
+                if name not in is_complex:
+                    is_complex[name] = np.iscomplexobj(value)
+                if is_complex[name]:
+                    value = np.stack((value.real, value.imag), axis=-1)
+                value = np.ascontiguousarray(value, dtype=np.float32)
+                files[name].write(value.tobytes())
+                index[name].append((offsets[name],) + value.shape)
+                offsets[name] += value.size
+    finally:
+        for f in files.values():
+            f.close()
+
+    if any(len(index[name]) != len(metadataDF) for name in features):
+        raise ValueError('Got features for %d segments but metadata for %d' % (len(index[features[0]]), len(metadataDF)))
+    for name in features:
+        if name not in is_complex: #No segments; the feature's type comes from its name
+            is_complex[name] = name in complex_features
+        #Offset, then the shape (with the extra (real, imaginary) dimension for complex features).  The width is given explicitly so an empty store
+        #still gets a (0, width) index
+        width = 1 + feature_ranks.get(name, 1) + int(is_complex[name])
+        if index[name]:
+            width = len(index[name][0])
+        np.save(os.path.join(store_path, name + '.index.npy'), np.array(index[name], dtype=np.int64).reshape(len(metadataDF), width))
+    metadataDF.to_csv(os.path.join(store_path, metadata_file_name), index=None, header=True)
+    info = {'features': {name: {'complex': bool(is_complex[name])} for name in features}, 'params': params or {}}
+    with open(os.path.join(store_path, info_file_name), 'w') as f:
+        json.dump(info, f, indent=1, sort_keys=True)
+    return store_path
+
+#This function opens a feature store without reading the feature data
+
+#Inputs
+#store_path: folder the store was written to
+#features: names of the features to open (all the features in the store if None)
+
+#Returns
+#store: dictionary with 'metadata' (the metadata dataframe), 'params', and 'features', which maps each feature name to a dictionary with its
+#'data' (float32 memmap), 'index' (int64 array: offset then shape for each segment), and 'complex' flag
+def open_feature_store(store_path, features=None):
+    with open(os.path.join(store_path, info_file_name)) as f:
+        info = json.load(f)
+    if features is None:
+        features = list(info['features'])
+    store = {'metadata': pd.read_csv(os.path.join(store_path, metadata_file_name)), 'params': info['params'], 'features': {}}
+    for name in features:
+        path = os.path.join(store_path, name + '.f32')
+        #np.memmap can't map an empty file
+        data = np.memmap(path, dtype=np.float32, mode='r') if os.path.getsize(path) > 0 else np.zeros(0, dtype=np.float32)
+        store['features'][name] = {'data': data, 'index': np.load(os.path.join(store_path, name + '.index.npy')),
+                                   'complex': info['features'][name]['complex']}
+    return store
+
+#This function reads one segment's array for a feature.  The array is a view of the memory-mapped file (complex features are returned as complex64)
+def load_sample(store, feature, i):
+    entry = store['features'][feature]
+    offset, shape = entry['index'][i][0], tuple(entry['index'][i][1:])
+    value = entry['data'][offset:offset+int(np.prod(shape))].reshape(shape)
+    if entry['complex']:
+        value = value.view(np.complex64)[..., 0]
+    return value
+
+#This function reads the arrays of several segments for a feature, in the order of indices
+def load_samples(store, feature, indices):
+    return [load_sample(store, feature, i) for i in indices]
+
+#This function computes features for every segment listed in a segment .csv file and writes them straight to a feature store
+#The segments are processed on a process pool like extract_features, but each segment's features are written as soon as they arrive (in row order)
+#instead of being collected in a dataframe
+
+#Inputs
+#segments: path to the segment .csv file, or a dataframe read from it
+#store_path: folder to write the store to
+#features, path_column, audio_root, workers, chunksize, sr, n_fft, hop_length, n_mfcc: see extract_features
+#metadata_columns: columns of the segment table to keep in the store's metadata (all of them if None)
+
+#Returns
+#store_path
+def extract_features_to_store(segments, store_path, features=('mfcc',), path_column='Segment path', audio_root=None, workers=1, chunksize=16,
+                              metadata_columns=None, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mfcc=n_mfcc):
+    segmentDF = pd.read_csv(segments) if not isinstance(segments, pd.DataFrame) else segments
+    resolved = list(dict.fromkeys(resolve_features(features))) #Each feature is stored once, even if it was asked for by two names
+    paths = list(segmentDF[path_column])
+    if audio_root is not None:
+        paths = [os.path.join(audio_root, path) for path in paths]
+    metadataDF = segmentDF[metadata_columns] if metadata_columns is not None else segmentDF
+    params = {'sr': sr, 'n_fft': n_fft, 'hop_length': hop_length, 'n_mfcc': n_mfcc, 'n_mels': n_mels}
+
+    args = [resolved]*len(paths)
+    values = [[value]*len(paths) for value in (sr, n_fft, hop_length, n_mfcc)]
+    if workers is None or workers <= 1:
+        rows = map(file_features, paths, args, *values)
+        return write_feature_store(store_path, metadataDF, rows, resolved, params)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = pool.map(file_features, paths, args, *values, chunksize=chunksize)
+        return write_feature_store(store_path, metadataDF, rows, resolved, params)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute classifier features for the audio segments in a segment .csv file and write them to a feature store')
+    parser.add_argument('segments', help='segment .csv file (AudioSegments_<token>_<day>.csv, or the dataset file directory)')
+    parser.add_argument('store', help='folder to write the feature store to')
+    parser.add_argument('-f', '--features', nargs='+', default=['mfcc'], help='features to compute: ' + ', '.join(all_features))
+    parser.add_argument('--path-column', default='Segment path', help='column with the path of each segment')
+    parser.add_argument('--audio-root', default=None, help='folder the segment paths are relative to')
+    parser.add_argument('--metadata-columns', nargs='+', default=None, help='columns of the segment table to keep (default: all)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='number of processes')
+    args = parser.parse_args()
+
+    extract_features_to_store(args.segments, args.store, args.features, path_column=args.path_column, audio_root=args.audio_root,
+                              workers=args.workers, metadata_columns=args.metadata_columns)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#The feature modules import each other from the features folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
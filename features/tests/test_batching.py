@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+from batching import *
+from extract_features import compute_features
+
+def test_duration_boundaries():
+    durations = np.random.default_rng(0).uniform(0.1, 5, 1000)
+    boundaries = duration_boundaries(durations, 4)
+    assert len(boundaries) == 3 and np.all(np.diff(boundaries) > 0)
+    counts = np.bincount(bucket_index(durations, boundaries), minlength=4)
+    assert len(counts) == 4 and counts.min() >= 240
+    assert len(duration_boundaries(durations, 1)) == 0 and len(duration_boundaries([], 4)) == 0
+    assert len(duration_boundaries(np.ones(50), 4)) == 1 #Equal durations give one boundary, so all in one bucket
+    assert np.all(bucket_index(np.ones(50), duration_boundaries(np.ones(50), 4)) == 1)
+
+def test_bucket_index():
+    boundaries = np.array([1.0, 2.0])
+    np.testing.assert_array_equal(bucket_index([0.5, 1.0, 1.5, 2.0, 9.0], boundaries), [0, 1, 1, 2, 2])
+
+def test_fit_length():
+    value = np.arange(6, dtype=np.float32).reshape(2, 3)
+    np.testing.assert_array_equal(fit_length(value, 2, 'crop'), value[:, :2])
+    np.testing.assert_array_equal(fit_length(value, 2, 'pad'), value[:, :2])
+    np.testing.assert_array_equal(fit_length(value, 5, 'pad'), [[0, 1, 2, 0, 0], [3, 4, 5, 0, 0]])
+    np.testing.assert_array_equal(fit_length(value, 5, 'crop'), fit_length(value, 5, 'pad'))
+    np.testing.assert_array_equal(fit_length(value, 7, 'tile'), [[0, 1, 2, 0, 1, 2, 0], [3, 4, 5, 3, 4, 5, 3]])
+    np.testing.assert_array_equal(fit_length(np.zeros((2, 0)), 3, 'tile'), np.zeros((2, 3)))
+    assert fit_length(value.astype(np.complex64), 5).dtype == np.complex64
+
+def test_bucket_batches(tmp_path):
+    rng = np.random.default_rng(1)
+    lengths = rng.integers(1000, 40000, 37)
+    rows = [compute_features(rng.normal(0, 0.1, n).astype(np.float32), ['mfcc']) for n in lengths]
+    write_feature_store(str(tmp_path), pd.DataFrame({'Label': ['a']*len(rows), 'Segment duration': lengths/22050.0}), iter(rows), ['mfcc'])
+    store = open_feature_store(str(tmp_path))
+    frames = sample_lengths(store, 'mfcc')
+
+    buckets = bucket_index(lengths/22050.0, duration_boundaries(lengths/22050.0))
+    seen = []
+    for batch_indices, batch in bucket_batches(store, 'mfcc', batch_size=5, seed=0):
+        #A batch holds one bucket, padded to the longest sample of that bucket only
+        assert len(batch_indices) <= 5 and len(set(buckets[batch_indices])) == 1
+        assert batch.shape == (len(batch_indices), 13, frames[buckets == buckets[batch_indices[0]]].max())
+        for i, value in zip(batch_indices, batch):
+            np.testing.assert_array_equal(value, fit_length(load_sample(store, 'mfcc', i), batch.shape[-1]))
+        seen.extend(batch_indices)
+    assert sorted(seen) == list(range(len(rows)))
+    assert len(set(buckets)) == 4 and max(batch.shape[-1] for _, batch in bucket_batches(store, 'mfcc')) == frames.max()
+
+    batches = list(bucket_batches(store, 'mfcc', batch_size=4, indices=np.arange(10), window=20, mode='tile', drop_remainder=True, shuffle=False))
+    assert [list(i) for i, _ in batches] == [[0, 1, 2, 3], [4, 5, 6, 7]] and all(batch.shape == (4, 13, 20) for _, batch in batches)
+    with pytest.raises(ValueError):
+        next(bucket_batches(store, 'mfcc', mode='repeat'))
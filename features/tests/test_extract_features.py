@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+import soundfile
+from extract_features import *
+
+def test_resolve_features():
+    assert resolve_features(['mffc', 'log_mel', 'signal']) == ['mfcc', 'log_mel', 'signal']
+    with pytest.raises(ValueError, match='mfc'):
+        resolve_features(['mfc'])
+
+def test_compute_features_returns_what_was_asked():
+    y = np.random.default_rng(0).normal(0, 0.1, 5000).astype(np.float32)
+    for features in (['mfcc'], ['l_mag', 'stft'], ['signal', 'fft', 'log_spec'], list(all_features)):
+        out = compute_features(y, features)
+        assert sorted(out) == sorted(features)
+        for name, value in out.items():
+            assert value.ndim == feature_ranks[name] and np.iscomplexobj(value) == (name in complex_features)
+    out = compute_features(y, all_features)
+    np.testing.assert_allclose(out['mfcc'], frontend.mfcc(y), rtol=1e-5, atol=1e-4)
+    np.testing.assert_allclose(out['log_mel'], frontend.log_mel(y), rtol=1e-5, atol=1e-4)
+    np.testing.assert_array_equal(out['spectrogram'], np.abs(out['stft']))
+    assert len(out['l_mag']) == len(y)//2
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_extract_features(tmp_path, workers):
+    rng = np.random.default_rng(1)
+    signals = [rng.normal(0, 0.1, n).astype(np.float32) for n in (3000, 9000, 700, 4000)]
+    for i, y in enumerate(signals):
+        soundfile.write(str(tmp_path/('%d.wav' % i)), y, sr, subtype='FLOAT')
+    segments = pd.DataFrame({'Segment path': ['%d.wav' % i for i in range(len(signals))], 'Label': list('abab')})
+    featureDF = extract_features(segments, ['mffc', 'l_mag'], audio_root=str(tmp_path), workers=workers, chunksize=1)
+    assert list(featureDF.columns) == ['Segment path', 'Label', 'mffc', 'l_mag']
+    for y, mfcc, l_mag in zip(signals, featureDF['mffc'], featureDF['l_mag']):
+        expected = compute_features(y, ['mfcc', 'l_mag'])
+        np.testing.assert_allclose(mfcc, expected['mfcc'], rtol=1e-5, atol=1e-4)
+        np.testing.assert_allclose(l_mag, expected['l_mag'], rtol=1e-5, atol=1e-5)
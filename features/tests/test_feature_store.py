@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+from feature_store import write_feature_store, open_feature_store, load_sample
+from extract_features import compute_features
+
+def test_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    signals = [rng.normal(0, 0.1, n).astype(np.float32) for n in (3000, 12000, 800)]
+    features = ['mfcc', 'stft', 'signal']
+    rows = [compute_features(y, features) for y in signals]
+    write_feature_store(str(tmp_path), pd.DataFrame({'Label': ['a', 'b', 'a']}), iter(rows), features)
+    store = open_feature_store(str(tmp_path))
+    for i, row in enumerate(rows):
+        for name in features:
+            np.testing.assert_array_equal(load_sample(store, name, i), row[name].astype(np.complex64 if name == 'stft' else np.float32))
+
+def test_empty_store(tmp_path):
+    features = ['mfcc', 'stft', 'signal', 'fft']
+    write_feature_store(str(tmp_path), pd.DataFrame({'Segment path': [], 'Label': []}), iter([]), features)
+    store = open_feature_store(str(tmp_path))
+    assert len(store['metadata']) == 0
+    widths = {name: store['features'][name]['index'].shape for name in features}
+    assert widths == {'mfcc': (0, 3), 'stft': (0, 4), 'signal': (0, 2), 'fft': (0, 3)}
+    assert store['features']['stft']['complex'] and not store['features']['mfcc']['complex']
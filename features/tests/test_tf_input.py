@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from extract_features import compute_features
+
+tf = pytest.importorskip('tensorflow') #tf_input imports TensorFlow
+from tf_input import *
+
+def make_metadata(seed=0):
+    rng = np.random.default_rng(seed)
+    participants = rng.choice(['P01', 'P02', 'P03'], 300)
+    labels = rng.choice(['scream', 'laugh', 'babble', 'rare'], 300, p=[0.4, 0.3, 0.28, 0.02])
+    return pd.DataFrame({'Participant': participants, 'Possible Label': labels}, index=rng.permutation(300) + 1000)
+
+def test_stratified_split():
+    metadata = make_metadata()
+    split = stratified_split(metadata, test_size=0.2, val_size=0.1, seed=0)
+    train, val, test = split['train'], split['val'], split['test']
+    assert not set(train) & set(val) and not set(train) & set(test) and not set(val) & set(test)
+    assert sorted(np.concatenate((train, val, test))) == list(range(len(metadata)))
+    groups = metadata.groupby(['Participant', 'Possible Label']).size()
+    for key, size in groups.items():
+        in_group = np.flatnonzero((metadata['Participant'] == key[0]).to_numpy() & (metadata['Possible Label'] == key[1]).to_numpy())
+        n_test, n_val = np.isin(in_group, test).sum(), np.isin(in_group, val).sum()
+        if round(size*0.2) + round(size*0.1) >= size:
+            assert n_test == n_val == 0 #Too small to split
+        else:
+            assert n_test == round(size*0.2) and n_val == round(size*0.1)
+    again = stratified_split(metadata, test_size=0.2, val_size=0.1, seed=0)
+    assert all(np.array_equal(split[name], again[name]) for name in split)
+
+def test_encode_labels():
+    codes, classes = encode_labels(pd.DataFrame({'Label': ['b', 'a', 'c', 'a']}))
+    assert list(classes) == ['a', 'b', 'c'] and list(codes) == [1, 0, 2, 0] and codes.dtype == np.int32
+    with pytest.raises(ValueError):
+        encode_labels(pd.DataFrame({'Category': ['a']}))
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(1)
+    rows = [compute_features(rng.normal(0, 0.1, n).astype(np.float32), ['mfcc', 'stft']) for n in rng.integers(1000, 20000, 12)]
+    write_feature_store(str(tmp_path), pd.DataFrame({'Label': list('abc')*4}), iter(rows), ['mfcc', 'stft'])
+    return open_feature_store(str(tmp_path))
+
+def test_make_dataset(store):
+    labels, classes = encode_labels(store['metadata'])
+    indices = np.array([0, 3, 4, 7, 8, 11])
+    samples = {i: load_sample(store, 'mfcc', i) for i in indices}
+
+    batches = list(make_dataset(store, 'mfcc', indices, labels, batch_size=4, shuffle_buffer=0))
+    assert [len(y) for _, y in batches] == [4, 2]
+    for (x, y), batch_indices in zip(batches, (indices[:4], indices[4:])):
+        assert x.shape[-1] == max(samples[i].shape[1] for i in batch_indices) #Padded to the longest sample of the batch
+        for value, label, i in zip(x.numpy(), y.numpy(), batch_indices):
+            np.testing.assert_array_equal(value, fit_length(samples[i], x.shape[-1]))
+            assert label == labels[i]
+
+    seen = [int(label) for _, y in make_dataset(store, 'mfcc', indices, labels, batch_size=4, seed=0) for label in y.numpy()]
+    assert sorted(seen) == sorted(labels[indices])
+
+    x, _ = next(iter(make_dataset(store, 'stft', indices, labels, batch_size=6, window=10, mode='tile', shuffle_buffer=0)))
+    assert x.dtype == tf.complex64 and x.shape == (6, 1025, 10)
+    np.testing.assert_array_equal(x.numpy()[1], fit_length(load_sample(store, 'stft', 3), 10, 'tile'))
+
+def test_make_dataset_pooling(store):
+    labels, _ = encode_labels(store['metadata'])
+    x, _ = next(iter(make_dataset(store, 'mfcc', [2, 5], labels, shuffle_buffer=0, pooling='stats')))
+    np.testing.assert_allclose(x.numpy(), frontend.embed_samples([load_sample(store, 'mfcc', i) for i in (2, 5)]), rtol=1e-6)
+    x, _ = next(iter(make_dataset(store, 'mfcc', [2, 5], labels, shuffle_buffer=0, pooling='flatten', window=8)))
+    assert x.shape == (2, 13*8)
+    with pytest.raises(ValueError):
+        make_dataset(store, 'stft', [2, 5], labels, pooling='stats')
+    with pytest.raises(ValueError):
+        make_dataset(store, 'mfcc', [2, 5], labels, pooling='flatten')
+    assert engine_frontend_params(store, 'mfcc', 'flatten', 8)['frames'] == 8
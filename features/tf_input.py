@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming tf.data input pipeline for training on a feature store (see feature_store).  Only sample indices are shuffled and passed through
+the pipeline; each sample is read from the memory-mapped store when its batch is built, so the training set doesn't have to fit in memory
+"""
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from feature_store import *
+from batching import fit_length
+import frontend #inference/frontend.py (put on the path by extract_features)
+
+stratify_columns = ('Participant', 'Label')
+label_columns = ('Label', 'Possible Label') #'Label' in the dataset file directory, 'Possible Label' in the files written by assign_labels
+
+#This function finds the label column of a metadata table
+def find_label_column(metadata):
+    for column in label_columns:
+        if column in metadata.columns:
+            return column
+    raise ValueError('The metadata has none of the label columns %s' % (label_columns,))
+
+#This function encodes the labels as integers (in the same way as sklearn's LabelEncoder: classes sorted, code = position in classes)
+
+#Inputs
+#metadata: metadata dataframe of the store
+#label_column: column with the labels (found with find_label_column if None)
+
+#Returns
+#codes: int32 array with the code of every sample
+#classes: array of the class names
+def encode_labels(metadata, label_column=None):
+    label_column = label_column or find_label_column(metadata)
+    classes, codes = np.unique(metadata[label_column].astype(str).to_numpy(), return_inverse=True)
+    return codes.astype(np.int32), classes
+
+#This function splits the samples into train/validation/test sets, keeping the share of each (participant, label) group the same in every set
+#Groups too small to be split keep their samples in the training set
+
+#Inputs
+#metadata: metadata dataframe of the store
+#test_size: fraction of each group used for testing
+#val_size: fraction of each group used for validation
+#columns: columns that define the groups (those of stratify_columns that are in the metadata if None; the label column is always included)
+#seed: random seed
+
+#Returns
+#Dictionary with the index arrays 'train', 'val', and 'test' (positions in the store, sorted)
+def stratified_split(metadata, test_size=0.3, val_size=0.0, columns=None, seed=None):
+    if columns is None:
+        columns = [column for column in stratify_columns if column in metadata.columns]
+        label_column = find_label_column(metadata)
+        if label_column not in columns:
+            columns.append(label_column)
+    rng = np.random.default_rng(seed)
+    split = {'train': [], 'val': [], 'test': []}
+    positions = pd.Series(np.arange(len(metadata)), index=metadata.index)
+    for key, group in positions.groupby([metadata[column] for column in columns], sort=True):
+        members = rng.permutation(group.to_numpy())
+        n_test = int(round(len(members)*test_size))
+        n_val = int(round(len(members)*val_size))
+        if n_test + n_val >= len(members): #Too small to split
+            n_test = n_val = 0
+        split['test'].append(members[:n_test])
+        split['val'].append(members[n_test:n_test+n_val])
+        split['train'].append(members[n_test+n_val:])
+    return {name: np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=int) for name, parts in split.items()}
+
+#This function builds a tf.data pipeline over some samples of a feature store
+
+#Inputs
+#store: feature store returned by open_feature_store
+#feature: name of the feature to train on
+#indices: positions of the samples to use (e.g. one of the arrays returned by stratified_split)
+#labels: integer label of every sample in the store (from encode_labels)
+#batch_size: number of samples per batch
+#shuffle_buffer: number of sample indices held in the shuffle buffer (0 to keep the order of indices)
+#window: if not None, every sample is fitted to this many frames (see batching.fit_length); otherwise each batch is zero-padded to its longest sample
+#mode: how samples are fitted to the window (see batching.fit_length)
+#seed: random seed for the shuffle
+#num_parallel_calls: number of samples read at the same time
+#prefetch: number of batches prepared in the background while the model trains on the current one
+#pooling: if not None, each sample is turned into the inference engine's input vector with frontend.embed ('stats', or 'flatten' to window frames),
+#so the trained model can be exported with inference/engine.export_keras_model (see engine_frontend_params) and run on the device as it is
+
+#Returns
+#tf.data.Dataset of (features, labels) batches
+def make_dataset(store, feature, indices, labels, batch_size=32, shuffle_buffer=1024, window=None, mode='pad', seed=None,
+                 num_parallel_calls=tf.data.AUTOTUNE, prefetch=tf.data.AUTOTUNE, pooling=None):
+    entry = store['features'][feature]
+    dtype = np.complex64 if entry['complex'] else np.float32
+    sample_rank = entry['index'].shape[1] - 1 - int(entry['complex'])
+    labels = np.asarray(labels, dtype=np.int32)
+    if pooling is not None:
+        if entry['complex'] or sample_rank != 2:
+            raise ValueError('pooling needs a (coefficients, frames) feature such as mfcc or log_mel, not %s' % feature)
+        if pooling == 'flatten' and window is None:
+            raise ValueError("pooling='flatten' needs a window (the number of frames the engine keeps)")
+        sample_rank = 1
+
+    def read(i):
+        value = load_sample(store, feature, int(i))
+        if pooling is not None:
+            value = frontend.embed(fit_length(value, window, mode) if pooling == 'stats' and window is not None else value, pooling, window)
+        elif window is not None:
+            value = fit_length(value, window, mode)
+        return np.array(value, dtype=dtype), labels[int(i)] #Copy out of the memory map
+
+    def read_tf(i):
+        value, label = tf.numpy_function(read, [i], (tf.as_dtype(dtype), tf.int32))
+        value.set_shape([None]*sample_rank)
+        label.set_shape([])
+        return value, label
+
+    ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if shuffle_buffer:
+        ds = ds.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    ds = ds.map(read_tf, num_parallel_calls=num_parallel_calls, deterministic=shuffle_buffer == 0)
+    ds = ds.batch(batch_size) if window is not None or pooling is not None else ds.padded_batch(batch_size)
+    return ds.prefetch(prefetch)
+
+#This function returns the frontend_params to export a model trained with make_dataset(..., pooling=pooling) with (see inference/engine.export_model),
+#so the engine computes the same feature with the store's analysis parameters and pools it the same way
+def engine_frontend_params(store, feature, pooling='stats', window=None):
+    if feature not in ('mfcc', 'log_mel'):
+        raise ValueError('The inference engine computes mfcc or log_mel features, not %s' % feature)
+    params = {'feature': feature, 'pooling': pooling, 'frames': window}
+    params.update({key: store['params'][key] for key in ('sr', 'n_fft', 'hop_length', 'n_mfcc', 'n_mels') if key in store['params']})
+    return params
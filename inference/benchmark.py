@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latency and memory benchmark for the inference engine, for sizing the device before buying it.  Each configuration runs in its own process with
+the BLAS thread count fixed (1 thread by default, i.e. one core of the device), and the front end and the model are timed separately.
+Run it on an exported model, or on a random model with the shape of the notebook's classifier
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import resource
+import tempfile
+import numpy as np
+from engine import *
+
+thread_variables = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+#This function writes a model with random weights (Dense + ReLU + BatchNormalization hidden layers and a softmax output, like the notebook's classifier)
+def random_model(path, frontend_params, hidden=(128, 128, 128), n_classes=5, seed=0):
+    params = dict(default_frontend, **frontend_params)
+    n_coefficients = params['n_mels'] if params['feature'] == 'log_mel' else params['n_mfcc']
+    n_inputs = 2*n_coefficients if params['pooling'] == 'stats' else n_coefficients*params['frames']
+    rng = np.random.default_rng(seed)
+    layers = []
+    for n_in, n_out in zip((n_inputs,) + tuple(hidden), tuple(hidden)):
+        layers.append({'type': 'dense', 'activation': 'relu', 'kernel': rng.normal(0, np.sqrt(2.0/n_in), (n_in, n_out)), 'bias': np.zeros(n_out)})
+        layers.append({'type': 'batchnorm', 'epsilon': 1e-3, 'gamma': np.ones(n_out), 'beta': np.zeros(n_out),
+                       'moving_mean': rng.normal(0, 1, n_out), 'moving_variance': rng.uniform(0.5, 2, n_out)})
+    n_last = hidden[-1] if hidden else n_inputs
+    layers.append({'type': 'dense', 'activation': 'softmax', 'kernel': rng.normal(0, np.sqrt(1.0/n_last), (n_last, n_classes)),
+                   'bias': np.zeros(n_classes)})
+    return export_model(layers, path, ['class%d' % i for i in range(n_classes)], params)
+
+#This function times the engine on buffers of random audio
+
+#Inputs
+#model_path: .npz model file
+#dtype: dtype to run the kernels in (None keeps the stored dtype)
+#seconds: length of each audio buffer
+#runs: number of timed runs (after warmup untimed runs)
+
+#Returns
+#Dictionary of results (times in ms)
+def run_benchmark(model_path, dtype=None, seconds=5.0, runs=50, warmup=5, seed=0):
+    engine = InferenceEngine(model_path, dtype)
+    rate = engine.frontend['sr']
+    rng = np.random.default_rng(seed)
+    pcm = (rng.normal(0, 0.1, int(seconds*rate))*32767).clip(-32768, 32767).astype(np.int16)
+
+    frontend_ms, model_ms = [], []
+    for run in range(warmup + runs):
+        start = time.perf_counter()
+        x = engine.features(pcm)
+        middle = time.perf_counter()
+        engine.predict(x)
+        end = time.perf_counter()
+        if run >= warmup:
+            frontend_ms.append((middle - start)*1e3)
+            model_ms.append((end - middle)*1e3)
+    total_ms = np.add(frontend_ms, model_ms)
+    return {'dtype': engine.dtype, 'seconds': seconds, 'inputs': int(x.shape[0]), 'weight_bytes': int(engine.weight_bytes()),
+            'file_bytes': os.path.getsize(model_path), 'frontend_ms': float(np.mean(frontend_ms)), 'model_ms': float(np.mean(model_ms)),
+            'mean_ms': float(total_ms.mean()), 'p50_ms': float(np.percentile(total_ms, 50)), 'p95_ms': float(np.percentile(total_ms, 95)),
+            'max_ms': float(total_ms.max()), 'real_time_factor': float(total_ms.mean()/1e3/seconds),
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0} #ru_maxrss is in KB on Linux
+
+#This function runs one benchmark configuration in a new process (so its peak memory and thread count are its own) and returns its results
+def run_in_process(args, dtype):
+    env = dict(os.environ, **{name: str(args.threads) for name in thread_variables})
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--model', args.model, '--seconds', str(args.seconds), '--runs', str(args.runs)]
+    if dtype is not None:
+        command += ['--dtype', dtype]
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def print_results(results):
+    columns = ('dtype', 'weight_bytes', 'frontend_ms', 'model_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'real_time_factor', 'peak_rss_mb')
+    print(' '.join('%16s' % column for column in columns))
+    for result in results:
+        print(' '.join('%16s' % (('%.3f' % result[column]) if isinstance(result[column], float) else result[column]) for column in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the latency and memory of the inference engine on the CPU')
+    parser.add_argument('--model', default=None, help='.npz model written by export_model (a random model is written to a temporary file if not given)')
+    parser.add_argument('--dtype', nargs='+', default=list(weight_dtypes), choices=weight_dtypes, help='weight dtypes to benchmark')
+    parser.add_argument('--seconds', type=float, default=5.0, help='length of the audio buffer classified on each run')
+    parser.add_argument('--runs', type=int, default=50, help='number of timed runs')
+    parser.add_argument('--threads', type=int, default=1, help='BLAS threads (cores the device can spare)')
+    parser.add_argument('--feature', default='mfcc', choices=('mfcc', 'log_mel'), help='front end feature of the random model')
+    parser.add_argument('--pooling', default='stats', choices=poolings, help='how the random model pools the features over time')
+    parser.add_argument('--frames', type=int, default=None, help='frames kept by flatten pooling (default: those in --seconds of audio)')
+    parser.add_argument('--hidden', type=int, nargs='*', default=[128, 128, 128], help='hidden layer sizes of the random model')
+    parser.add_argument('--classes', type=int, default=5, help='number of classes of the random model')
+    parser.add_argument('--output', default=None, help='.json file to save the results to')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child: #One configuration, run by run_in_process
+        print(json.dumps(run_benchmark(args.model, args.dtype[0] if args.dtype else None, args.seconds, args.runs)))
+        return
+
+    temporary = args.model is None
+    if temporary:
+        frames = args.frames or 1 + int(args.seconds*sr)//hop_length
+        handle, args.model = tempfile.mkstemp(suffix='.npz')
+        os.close(handle)
+        random_model(args.model, {'feature': args.feature, 'pooling': args.pooling, 'frames': frames}, tuple(args.hidden), args.classes)
+    try:
+        results = [run_in_process(args, dtype) for dtype in args.dtype]
+    finally:
+        if temporary:
+            os.remove(args.model)
+    print('%.1f s buffers, %d runs, %d thread(s)' % (args.seconds, args.runs, args.threads))
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+if __name__ == '__main__':
+    main()
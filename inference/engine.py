@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Standalone inference engine for running the vocalization classifier on a small device (e.g. a Raspberry Pi).  It only needs NumPy: the model is
+exported from Keras to a plain .npz file of weights, batch normalization is folded into the dense layers, the weights can be stored as float32,
+float16, or int8, and the features are computed with the NumPy front end in frontend.py
+"""
+
+import json
+import numpy as np
+from frontend import *
+
+weight_dtypes = ('float32', 'float16', 'int8')
+activations = ('linear', 'relu', 'sigmoid', 'tanh', 'softmax')
+default_frontend = {'feature': 'mfcc', 'pooling': 'stats', 'frames': None, 'sr': sr, 'n_fft': n_fft, 'hop_length': hop_length,
+                    'n_mels': n_mels, 'n_mfcc': n_mfcc}
+block_rows = 4096 #Rows of a quantized kernel converted to float32 at a time, so a large kernel is never held in float32 all at once
+skipped_layers = ('InputLayer', 'Dropout', 'Flatten') #Keras layers that do nothing at inference
+
+#This function quantizes a float kernel
+#int8 kernels are quantized symmetrically with one scale per output column (kernel = q*scale, with q in [-127, 127])
+
+#Returns
+#kernel: the kernel in the requested dtype
+#scale: float32 array with the scale of each column for int8, otherwise None
+def quantize_kernel(kernel, dtype='float32'):
+    if dtype not in weight_dtypes:
+        raise ValueError('dtype must be one of %s' % (weight_dtypes,))
+    kernel = np.asarray(kernel)
+    if kernel.dtype == np.int8:
+        raise ValueError('The kernel is already quantized')
+    if dtype != 'int8':
+        return kernel.astype(dtype), None
+    scale = np.abs(kernel).max(axis=0)/127.0
+    scale[scale == 0] = 1.0
+    return np.clip(np.round(kernel/scale), -127, 127).astype(np.int8), scale.astype(np.float32)
+
+#This function converts a (possibly quantized) kernel back to float32
+def dequantize_kernel(kernel, scale=None):
+    kernel = kernel.astype(np.float32)
+    return kernel*scale if scale is not None else kernel
+
+#This function folds batch normalization layers into the dense layer that follows them
+#At inference a batch normalization layer is the affine map x*s + t, with s = gamma/sqrt(moving_variance + epsilon) and t = beta - moving_mean*s,
+#so a following dense layer x @ W + b is replaced by x @ (s[:, None]*W) + (b + t @ W).  A batch normalization layer with no dense layer after it is
+#kept as an 'affine' layer
+
+#Inputs
+#layers: list of layer dictionaries: {'type': 'dense', 'activation', 'kernel', 'bias'} or
+#{'type': 'batchnorm', 'epsilon', 'gamma', 'beta', 'moving_mean', 'moving_variance'} (gamma/beta may be None, as with scale=False/center=False in Keras)
+
+#Returns
+#List of 'dense' and 'affine' ({'type': 'affine', 'scale', 'shift'}) layer dictionaries with float64 weights
+def fold_batchnorm(layers):
+    folded = []
+    pending = None #(s, t) of a batch normalization layer waiting for the next dense layer
+    for layer in layers:
+        if layer['type'] == 'batchnorm':
+            s = 1.0/np.sqrt(np.asarray(layer['moving_variance'], dtype=np.float64) + layer.get('epsilon', 1e-3))
+            if layer.get('gamma') is not None:
+                s = s*np.asarray(layer['gamma'], dtype=np.float64)
+            t = -np.asarray(layer['moving_mean'], dtype=np.float64)*s
+            if layer.get('beta') is not None:
+                t = t + np.asarray(layer['beta'], dtype=np.float64)
+            pending = (s, t) if pending is None else (pending[0]*s, pending[1]*s + t)
+        elif layer['type'] == 'dense':
+            kernel = np.asarray(layer['kernel'], dtype=np.float64)
+            bias = np.asarray(layer['bias'], dtype=np.float64) if layer.get('bias') is not None else np.zeros(kernel.shape[1])
+            if pending is not None:
+                kernel, bias = pending[0][:, None]*kernel, bias + pending[1] @ kernel
+                pending = None
+            folded.append({'type': 'dense', 'activation': layer.get('activation', 'linear'), 'kernel': kernel, 'bias': bias})
+        else:
+            raise ValueError('Unknown layer type %r' % layer['type'])
+    if pending is not None:
+        folded.append({'type': 'affine', 'scale': pending[0], 'shift': pending[1]})
+    return folded
+
+#This function writes a model to an .npz file that the inference engine can load
+
+#Inputs
+#layers: list of layer dictionaries (see fold_batchnorm)
+#path: .npz file to write
+#classes: class names, in the order of the model's outputs (two names for a model with a single sigmoid output: the negative class, then the positive one)
+#frontend_params: how the model's input is computed from audio (see default_frontend; missing keys take the default values)
+#dtype: dtype to store the dense kernels in ('float32', 'float16', or 'int8'); biases and affine layers are always float32
+#input_mean, input_std: optional normalization applied to the input vector before the first layer ((x - mean)/std)
+
+#Returns
+#path
+def export_model(layers, path, classes, frontend_params=None, dtype='float32', input_mean=None, input_std=None):
+    config = {'layers': [], 'frontend': dict(default_frontend, **(frontend_params or {})), 'dtype': dtype}
+    arrays = {'classes': np.array([str(c) for c in classes])}
+    layers = fold_batchnorm(layers)
+    n_outputs = layers[-1]['bias'].shape[0] if layers[-1]['type'] == 'dense' else layers[-1]['scale'].shape[0]
+    if n_outputs == 1 and layers[-1]['type'] == 'dense' and layers[-1]['activation'] == 'sigmoid':
+        n_outputs = 2 #predict returns [1 - p, p]
+    if len(classes) != n_outputs:
+        raise ValueError('The model has %d outputs but %d classes were given' % (n_outputs, len(classes)))
+    for i, layer in enumerate(layers):
+        prefix = 'layer%d/' % i
+        if layer['type'] == 'dense':
+            if layer['activation'] not in activations:
+                raise ValueError('Unsupported activation %r' % layer['activation'])
+            kernel, scale = quantize_kernel(layer['kernel'], dtype)
+            arrays[prefix + 'kernel'] = kernel
+            arrays[prefix + 'bias'] = layer['bias'].astype(np.float32)
+            if scale is not None:
+                arrays[prefix + 'kernel_scale'] = scale
+            config['layers'].append({'type': 'dense', 'activation': layer['activation']})
+        else:
+            arrays[prefix + 'scale'] = layer['scale'].astype(np.float32)
+            arrays[prefix + 'shift'] = layer['shift'].astype(np.float32)
+            config['layers'].append({'type': 'affine'})
+    if input_mean is not None:
+        arrays['input_mean'] = np.asarray(input_mean, dtype=np.float32)
+        arrays['input_std'] = np.asarray(input_std if input_std is not None else np.ones_like(input_mean), dtype=np.float32)
+    arrays['config'] = np.array(json.dumps(config))
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+    return path
+
+#This function reads the layers of a trained Keras Sequential model (like the one in vocal_classification.ipynb) into layer dictionaries
+#A separate Activation layer is folded into the dense layer before it, if that layer has no activation of its own; anywhere else it is not supported
+#It only calls get_weights/get_config on the layers, so TensorFlow is not needed to run the exported model
+def keras_layers(model):
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in skipped_layers:
+            continue
+        config = layer.get_config()
+        weights = layer.get_weights()
+        if kind == 'Dense':
+            layers.append({'type': 'dense', 'activation': config['activation'], 'kernel': weights[0],
+                           'bias': weights[1] if config['use_bias'] else None})
+        elif kind == 'BatchNormalization':
+            weights = list(weights)
+            gamma = weights.pop(0) if config['scale'] else None
+            beta = weights.pop(0) if config['center'] else None
+            layers.append({'type': 'batchnorm', 'epsilon': config['epsilon'], 'gamma': gamma, 'beta': beta,
+                           'moving_mean': weights[0], 'moving_variance': weights[1]})
+        elif kind == 'Activation' and layers and layers[-1]['type'] == 'dense' and layers[-1]['activation'] == 'linear':
+            layers[-1]['activation'] = config['activation']
+        else:
+            raise ValueError('Layer %s (%s) is not supported by the inference engine' % (layer.name, kind))
+    return layers
+
+#This function exports a trained Keras Sequential model to an .npz file (see export_model for the other inputs)
+def export_keras_model(model, path, classes, frontend_params=None, dtype='float32', input_mean=None, input_std=None):
+    return export_model(keras_layers(model), path, classes, frontend_params, dtype, input_mean, input_std)
+
+#This function multiplies a batch of inputs by a (possibly quantized) kernel, converting blocks of kernel rows to float32 as it goes
+#For int8 kernels the per-column scale is applied once to the result instead of to the kernel
+def quantized_matmul(x, kernel, scale=None):
+    if kernel.dtype == np.float32:
+        out = x @ kernel
+    elif kernel.shape[0] <= block_rows:
+        out = x @ kernel.astype(np.float32)
+    else:
+        out = np.zeros((x.shape[0], kernel.shape[1]), dtype=np.float32)
+        for start in range(0, kernel.shape[0], block_rows):
+            out += x[:, start:start+block_rows] @ kernel[start:start+block_rows].astype(np.float32)
+    return out*scale if scale is not None else out
+
+def apply_activation(x, activation):
+    if activation == 'relu':
+        return np.maximum(x, 0, out=x)
+    if activation == 'sigmoid':
+        return 1.0/(1.0 + np.exp(-x))
+    if activation == 'tanh':
+        return np.tanh(x)
+    if activation == 'softmax':
+        return softmax(x)
+    return x
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e/e.sum(axis=-1, keepdims=True)
+
+#This function turns the output of the last layer into class probabilities
+#Softmax and sigmoid outputs are already probabilities (a single sigmoid unit p becomes [1 - p, p]); models trained on logits get a softmax here
+def output_probabilities(x, activation):
+    if activation == 'sigmoid':
+        return np.concatenate((1.0 - x, x), axis=1) if x.shape[1] == 1 else x
+    return x if activation == 'softmax' else softmax(x)
+
+class InferenceEngine:
+    '''
+    Loads a model written by export_model and classifies buffers of audio samples with it
+    '''
+
+    #Inputs
+    #path: .npz file written by export_model
+    #dtype: dtype to run the dense kernels in ('float32', 'float16', or 'int8'); None keeps the dtype they were stored in.  A float32 model can be
+    #quantized when it is loaded, so one exported model can be compared at every precision
+    def __init__(self, path, dtype=None):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        config = json.loads(str(arrays['config']))
+        self.classes = arrays['classes']
+        self.frontend = dict(default_frontend, **config['frontend'])
+        self.dtype = dtype or config['dtype']
+        self.input_mean = arrays.get('input_mean')
+        self.input_std = arrays.get('input_std')
+        self.layers = []
+        for i, layer in enumerate(config['layers']):
+            prefix = 'layer%d/' % i
+            if layer['type'] == 'affine':
+                self.layers.append(('affine', arrays[prefix + 'scale'], arrays[prefix + 'shift']))
+                continue
+            kernel, scale = arrays[prefix + 'kernel'], arrays.get(prefix + 'kernel_scale')
+            if kernel.dtype.name != self.dtype:
+                kernel, scale = quantize_kernel(dequantize_kernel(kernel, scale), self.dtype)
+            self.layers.append(('dense', kernel, scale, arrays[prefix + 'bias'], layer['activation']))
+
+    #This function returns the number of bytes taken by the model's weights
+    def weight_bytes(self):
+        return sum(array.nbytes for layer in self.layers for array in layer[1:] if isinstance(array, np.ndarray))
+
+    #This function computes the model input vector for a buffer of audio
+    #pcm_buffer: int16/int32 or float samples (mono, or (frames, channels)); sample_rate: rate of the buffer (the front end's rate if None)
+    def features(self, pcm_buffer, sample_rate=None):
+        params = self.frontend
+        y = pcm_to_float(pcm_buffer)
+        if sample_rate is not None:
+            y = resample_linear(y, sample_rate, params['sr'])
+        if params['feature'] == 'log_mel':
+            values = log_mel(y, params['sr'], params['n_fft'], params['hop_length'], params['n_mels'])
+        else:
+            values = mfcc(y, params['sr'], params['n_fft'], params['hop_length'], params['n_mels'], params['n_mfcc'])
+        return embed(values, params['pooling'], params['frames'])
+
+    #This function runs the model on a batch of input vectors (shape (n, inputs)) and returns the class probabilities (shape (n, classes))
+    #With several sigmoid outputs each column is the independent probability of its class, so the rows don't sum to 1
+    def predict(self, x):
+        x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+        if self.input_mean is not None:
+            x = (x - self.input_mean)/self.input_std
+        activation = 'linear'
+        for layer in self.layers:
+            if layer[0] == 'affine':
+                x = x*layer[1] + layer[2]
+                continue
+            _, kernel, scale, bias, activation = layer
+            x = apply_activation(quantized_matmul(x, kernel, scale) + bias, activation)
+        return output_probabilities(x, activation)
+
+    #This function classifies a buffer of audio
+
+    #Returns
+    #label: name of the most likely class
+    #probabilities: dictionary mapping each class name to its probability
+    def classify(self, pcm_buffer, sample_rate=None):
+        probabilities = self.predict(self.features(pcm_buffer, sample_rate))[0]
+        return str(self.classes[int(np.argmax(probabilities))]), dict(zip(map(str, self.classes), probabilities.tolist()))
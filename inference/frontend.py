@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NumPy-only audio front end (log-mel spectrogram and MFCC) for running the classifier on a small device without librosa.
+The defaults reproduce librosa's (stft with a centred Hann window, Slaney mel filters, power_to_db with top_db=80, orthonormal DCT-II).
+features/extract_features.py computes its STFT, log-mel, and MFCC features with this module, so training and the device use the same code.
+embed turns the features into the model input, both in the training pipeline (features/tf_input.make_dataset) and in the inference engine
+"""
+
+import numpy as np
+from functools import lru_cache
+
+sr = 22050 #Sampling rate the front end expects (the rate the training segments are loaded at)
+n_fft = 2048
+hop_length = 512
+n_mels = 128
+n_mfcc = 13
+top_db = 80.0
+amin = 1e-10
+poolings = ('stats', 'flatten')
+
+#These functions convert between Hz and the Slaney mel scale (linear below 1 kHz, logarithmic above), as librosa does with htk=False
+min_log_hz = 1000.0
+mel_step = 200.0/3
+min_log_mel = min_log_hz/mel_step
+log_step = np.log(6.4)/27.0
+
+def hz_to_mel(f):
+    f = np.asarray(f, dtype=np.float64)
+    return np.where(f >= min_log_hz, min_log_mel + np.log(np.maximum(f, min_log_hz)/min_log_hz)/log_step, f/mel_step)
+
+def mel_to_hz(m):
+    m = np.asarray(m, dtype=np.float64)
+    return np.where(m >= min_log_mel, min_log_hz*np.exp(log_step*(m - min_log_mel)), m*mel_step)
+
+#This function builds the mel filterbank (Slaney-normalised triangular filters), cached for each set of parameters
+#Returns an array of shape (n_mels, 1 + n_fft//2)
+@lru_cache(maxsize=8)
+def mel_filterbank(sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=0.0, fmax=None):
+    fmax = sr/2 if fmax is None else fmax
+    fft_freqs = np.fft.rfftfreq(n_fft, 1.0/sr)
+    mel_freqs = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+    fdiff = np.diff(mel_freqs)
+    ramps = mel_freqs[:, None] - fft_freqs[None, :]
+    lower = -ramps[:-2]/fdiff[:-1, None]
+    upper = ramps[2:]/fdiff[1:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    weights *= (2.0/(mel_freqs[2:n_mels+2] - mel_freqs[:n_mels]))[:, None]
+    return weights.astype(np.float32)
+
+#This function builds the orthonormal DCT-II matrix used for the MFCC, cached for each size.  Returns an array of shape (n_mfcc, n_mels)
+@lru_cache(maxsize=8)
+def dct_matrix(n_mfcc=n_mfcc, n_mels=n_mels):
+    k = np.arange(n_mfcc)[:, None]
+    n = np.arange(n_mels)[None, :]
+    basis = np.cos(np.pi*k*(2*n + 1)/(2.0*n_mels))*np.sqrt(2.0/n_mels)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+@lru_cache(maxsize=8)
+def hann_window(n_fft=n_fft):
+    return (0.5 - 0.5*np.cos(2*np.pi*np.arange(n_fft)/n_fft)).astype(np.float32) #Periodic Hann window
+
+#This function computes the STFT of a signal, with frames centred on multiples of hop_length (the signal is zero-padded by n_fft//2 at both ends)
+#Returns a complex64 array of shape (1 + n_fft//2, frames), like librosa.stft
+def stft(y, n_fft=n_fft, hop_length=hop_length):
+    y = np.pad(np.asarray(y, dtype=np.float32), n_fft//2)
+    n_frames = 1 + (len(y) - n_fft)//hop_length
+    frames = np.lib.stride_tricks.as_strided(y, shape=(n_frames, n_fft), strides=(y.strides[0]*hop_length, y.strides[0]))
+    return np.fft.rfft(frames*hann_window(n_fft), axis=1).T.astype(np.complex64)
+
+#This function computes the power spectrogram of a signal.  Returns an array of shape (1 + n_fft//2, frames)
+def power_spectrogram(y, n_fft=n_fft, hop_length=hop_length):
+    spectrum = stft(y, n_fft, hop_length)
+    return spectrum.real**2 + spectrum.imag**2
+
+#This function converts a power spectrogram to dB (relative to 1), clipping everything more than top_db below the maximum
+def power_to_db(S, top_db=top_db):
+    log_S = 10.0*np.log10(np.maximum(amin, S))
+    if top_db is not None:
+        log_S = np.maximum(log_S, log_S.max() - top_db)
+    return log_S
+
+#This function computes the log-mel spectrogram of a signal, or of its power spectrogram S if it has already been computed
+#Returns an array of shape (n_mels, frames)
+def log_mel(y=None, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels, S=None):
+    if S is None:
+        S = power_spectrogram(y, n_fft, hop_length)
+    return power_to_db(mel_filterbank(sr, n_fft, n_mels) @ S)
+
+#This function computes the MFCCs of a signal, or of its power spectrogram S if it has already been computed
+#Returns an array of shape (n_mfcc, frames)
+def mfcc(y=None, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels, n_mfcc=n_mfcc, S=None):
+    return dct_matrix(n_mfcc, n_mels) @ log_mel(y, sr, n_fft, hop_length, n_mels, S)
+
+#This function turns a (coefficients, frames) feature array into the model's input vector
+
+#Inputs
+#features: array of shape (coefficients, frames), e.g. from mfcc or log_mel (or read from the feature store when training)
+#pooling: 'stats' for the mean and standard deviation of each coefficient over time (2*coefficients values, whatever the length of the audio),
+#or 'flatten' to fit the features to a fixed number of frames (zero-padded or cropped at the end) and flatten them
+#frames: number of frames for 'flatten'
+
+#Returns
+#float32 vector
+def embed(features, pooling='stats', frames=None):
+    features = np.asarray(features, dtype=np.float32)
+    if pooling == 'stats':
+        return np.concatenate((features.mean(axis=1), features.std(axis=1)))
+    if pooling == 'flatten':
+        out = np.zeros((features.shape[0], frames), dtype=np.float32)
+        n = min(frames, features.shape[1])
+        out[:, :n] = features[:, :n]
+        return out.ravel()
+    raise ValueError('pooling must be one of %s' % (poolings,))
+
+#This function builds the training inputs from a list of feature arrays (e.g. load_samples(store, 'mfcc', indices) from features/feature_store.py),
+#pooled the same way the inference engine pools the features of live audio.  Returns an array of shape (samples, inputs)
+def embed_samples(samples, pooling='stats', frames=None):
+    return np.stack([embed(value, pooling, frames) for value in samples])
+
+#This function converts a buffer of PCM samples to float32 in [-1, 1], mixing multi-channel (frames, channels) buffers down to mono
+def pcm_to_float(pcm):
+    pcm = np.asarray(pcm)
+    if np.issubdtype(pcm.dtype, np.integer):
+        pcm = pcm.astype(np.float32)/float(np.iinfo(pcm.dtype).max + 1)
+    pcm = pcm.astype(np.float32, copy=False)
+    return pcm.mean(axis=1) if pcm.ndim == 2 else pcm
+
+#This function resamples a signal by linear interpolation (for microphones that can't record at the front end's rate; a device should record at sr if it can)
+def resample_linear(y, orig_sr, target_sr=sr):
+    if orig_sr == target_sr or len(y) == 0:
+        return y
+    n_out = int(round(len(y)*target_sr/float(orig_sr)))
+    return np.interp(np.arange(n_out)*(orig_sr/float(target_sr)), np.arange(len(y)), y).astype(np.float32)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#The inference modules import each other from the inference folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+from engine import *
+
+def dense(rng, n_in, n_out, activation='relu'):
+    return {'type': 'dense', 'activation': activation, 'kernel': rng.normal(0, 1/np.sqrt(n_in), (n_in, n_out)), 'bias': rng.normal(0, 0.1, n_out)}
+
+def batchnorm(rng, n, scale=True, center=True):
+    return {'type': 'batchnorm', 'epsilon': 1e-3, 'gamma': rng.uniform(0.5, 2, n) if scale else None, 'beta': rng.normal(0, 1, n) if center else None,
+            'moving_mean': rng.normal(0, 1, n), 'moving_variance': rng.uniform(0.5, 2, n)}
+
+#Runs the layers unfolded, in float64
+def reference_predict(layers, x):
+    x = np.asarray(x, dtype=np.float64)
+    activation = 'linear'
+    for layer in layers:
+        if layer['type'] == 'batchnorm':
+            x = (x - layer['moving_mean'])/np.sqrt(layer['moving_variance'] + layer['epsilon'])
+            x = x*(layer['gamma'] if layer['gamma'] is not None else 1) + (layer['beta'] if layer['beta'] is not None else 0)
+        else:
+            activation = layer['activation']
+            x = apply_activation(x @ layer['kernel'] + layer['bias'], activation)
+    return output_probabilities(x, activation)
+
+def test_fold_batchnorm():
+    rng = np.random.default_rng(0)
+    x = rng.normal(0, 1, (20, 26))
+    layers = [batchnorm(rng, 26), dense(rng, 26, 16), batchnorm(rng, 16, scale=False), batchnorm(rng, 16, center=False), dense(rng, 16, 5, 'softmax')]
+    folded = fold_batchnorm(layers)
+    assert [layer['type'] for layer in folded] == ['dense', 'dense']
+    x_folded = x
+    for layer in folded:
+        x_folded = apply_activation(x_folded @ layer['kernel'] + layer['bias'], layer['activation'])
+    np.testing.assert_allclose(x_folded, reference_predict(layers, x), rtol=1e-10, atol=1e-12)
+
+    trailing = fold_batchnorm([dense(rng, 26, 4, 'linear'), batchnorm(rng, 4)])
+    assert [layer['type'] for layer in trailing] == ['dense', 'affine']
+
+@pytest.mark.parametrize('dtype, tolerance', [('float32', 1e-5), ('float16', 5e-3), ('int8', 3e-2)])
+def test_round_trip(tmp_path, dtype, tolerance):
+    rng = np.random.default_rng(1)
+    layers = [dense(rng, 26, 64), batchnorm(rng, 64), dense(rng, 64, 64), dense(rng, 64, 5, 'softmax')]
+    x = rng.normal(0, 1, (50, 26)).astype(np.float32)
+    path = export_model(layers, str(tmp_path/'model.npz'), list('abcde'), dtype=dtype)
+    engine = InferenceEngine(path)
+    assert engine.dtype == dtype and engine.layers[0][1].dtype == np.dtype(dtype)
+    np.testing.assert_allclose(engine.predict(x), reference_predict(layers, x), atol=tolerance)
+    #A float32 model quantized when it is loaded gives the same weights as one exported quantized
+    float_path = export_model(layers, str(tmp_path/'float.npz'), list('abcde'))
+    np.testing.assert_array_equal(InferenceEngine(float_path, dtype).layers[0][1], engine.layers[0][1])
+
+def test_quantize_kernel():
+    rng = np.random.default_rng(2)
+    kernel = rng.normal(0, 1, (300, 7))
+    kernel[:, 3] = 0
+    q, scale = quantize_kernel(kernel, 'int8')
+    assert q.dtype == np.int8 and np.abs(q).max() == 127 and scale[3] == 1
+    assert np.abs(dequantize_kernel(q, scale) - kernel).max() <= scale.max()/2 + 1e-6
+    x = rng.normal(0, 1, (4, 300)).astype(np.float32)
+    np.testing.assert_allclose(quantized_matmul(x, q, scale), x @ dequantize_kernel(q, scale), rtol=1e-4, atol=1e-4)
+    with pytest.raises(ValueError):
+        quantize_kernel(q, 'int8')
+
+def test_single_sigmoid_output(tmp_path):
+    rng = np.random.default_rng(3)
+    layers = [dense(rng, 26, 8), dense(rng, 8, 1, 'sigmoid')]
+    x = rng.normal(0, 1, (10, 26))
+    engine = InferenceEngine(export_model(layers, str(tmp_path/'model.npz'), ['noise', 'call']))
+    probabilities = engine.predict(x)
+    p = 1/(1 + np.exp(-(np.maximum(x @ layers[0]['kernel'] + layers[0]['bias'], 0) @ layers[1]['kernel'] + layers[1]['bias'])))
+    np.testing.assert_allclose(probabilities, np.hstack((1 - p, p)), atol=1e-5)
+    with pytest.raises(ValueError):
+        export_model(layers, str(tmp_path/'model.npz'), ['call'])
+
+def test_several_sigmoid_outputs(tmp_path):
+    rng = np.random.default_rng(4)
+    layers = [dense(rng, 26, 3, 'sigmoid')]
+    x = rng.normal(0, 1, (10, 26))
+    engine = InferenceEngine(export_model(layers, str(tmp_path/'model.npz'), list('abc')))
+    np.testing.assert_allclose(engine.predict(x), 1/(1 + np.exp(-(x @ layers[0]['kernel'] + layers[0]['bias']))), atol=1e-5)
+
+def test_classes_must_match_outputs(tmp_path):
+    rng = np.random.default_rng(5)
+    with pytest.raises(ValueError):
+        export_model([dense(rng, 26, 5, 'softmax')], str(tmp_path/'model.npz'), list('abcd'))
+    with pytest.raises(ValueError):
+        export_model([dense(rng, 26, 5, 'linear'), batchnorm(rng, 5)], str(tmp_path/'model.npz'), list('abcdef'))
+
+def test_classify(tmp_path):
+    rng = np.random.default_rng(6)
+    params = {'feature': 'mfcc', 'pooling': 'stats'}
+    engine = InferenceEngine(export_model([dense(rng, 2*n_mfcc, 3, 'linear')], str(tmp_path/'model.npz'), list('abc'), params))
+    pcm = (rng.normal(0, 0.1, sr)*32767).astype(np.int16)
+    label, probabilities = engine.classify(pcm)
+    assert list(probabilities) == list('abc') and label == max(probabilities, key=probabilities.get)
+    assert abs(sum(probabilities.values()) - 1) < 1e-5
+    np.testing.assert_allclose(engine.features(pcm), embed(mfcc(pcm_to_float(pcm))))
+
+class TestKerasExport:
+    @pytest.fixture(autouse=True)
+    def keras(self):
+        tf = pytest.importorskip('tensorflow')
+        return tf.keras
+
+    def check_parity(self, model, tmp_path, classes, dtype='float32', atol=1e-5):
+        x = np.random.default_rng(7).normal(0, 1, (40, model.inputs[0].shape[1])).astype(np.float32)
+        engine = InferenceEngine(export_keras_model(model, str(tmp_path/'model.npz'), classes, dtype=dtype))
+        expected = model.predict(x, verbose=0)
+        if expected.shape[1] == 1:
+            expected = np.hstack((1 - expected, expected))
+        np.testing.assert_allclose(engine.predict(x), expected, atol=atol)
+
+    def random_batchnorm(self, model):
+        rng = np.random.default_rng(8)
+        for layer in model.layers:
+            if type(layer).__name__ == 'BatchNormalization':
+                layer.set_weights([rng.uniform(0.5, 2, w.shape) if i in (0, 3) else rng.normal(0, 1, w.shape) for i, w in enumerate(layer.get_weights())])
+        return model
+
+    def test_notebook_classifier(self, keras, tmp_path):
+        layers = keras.layers
+        model = self.random_batchnorm(keras.Sequential([layers.Input((26,)), layers.Dense(64, activation='relu'), layers.BatchNormalization(),
+                                                        layers.Dropout(0.3), layers.Dense(64, activation='relu'), layers.BatchNormalization(),
+                                                        layers.Dense(5, activation='softmax')]))
+        for dtype, atol in (('float32', 1e-5), ('float16', 5e-3), ('int8', 3e-2)):
+            self.check_parity(model, tmp_path, list('abcde'), dtype, atol)
+
+    def test_activation_layer(self, keras, tmp_path):
+        layers = keras.layers
+        model = keras.Sequential([layers.Input((26,)), layers.Dense(16), layers.Activation('relu'), layers.Dense(3), layers.Activation('softmax')])
+        self.check_parity(model, tmp_path, list('abc'))
+        model = keras.Sequential([layers.Input((26,)), layers.Dense(16, activation='tanh'), layers.Activation('relu'), layers.Dense(3)])
+        with pytest.raises(ValueError):
+            keras_layers(model)
+
+    def test_single_sigmoid_output(self, keras, tmp_path):
+        layers = keras.layers
+        model = keras.Sequential([layers.Input((26,)), layers.Dense(8, activation='relu'), layers.Dense(1, activation='sigmoid')])
+        self.check_parity(model, tmp_path, ['noise', 'call'])
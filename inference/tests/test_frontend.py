@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import frontend
+
+librosa = pytest.importorskip('librosa')
+pytestmark = pytest.mark.filterwarnings('ignore:n_fft=.*is too large')
+
+def signals():
+    rng = np.random.default_rng(0)
+    t = np.arange(3*frontend.sr)/frontend.sr
+    yield (0.3*np.sin(2*np.pi*440*t) + rng.normal(0, 0.05, len(t))).astype(np.float32)
+    yield rng.normal(0, 0.1, 5000).astype(np.float32)
+    yield rng.normal(0, 0.1, 700).astype(np.float32) #Shorter than n_fft (librosa warns about it)
+
+#Differences of float32 rounding: about 1e-5 of the largest value
+def assert_close(actual, expected):
+    assert actual.shape == expected.shape
+    assert np.abs(actual - expected).max() <= 1e-5*max(1.0, np.abs(expected).max())
+
+def test_stft_matches_librosa():
+    for y in signals():
+        expected = librosa.stft(y, n_fft=frontend.n_fft, hop_length=frontend.hop_length, center=True, pad_mode='constant')
+        spectrum = frontend.stft(y)
+        assert spectrum.dtype == np.complex64
+        assert_close(spectrum, expected)
+
+def test_log_mel_matches_librosa():
+    for y in signals():
+        S = np.abs(librosa.stft(y, n_fft=frontend.n_fft, hop_length=frontend.hop_length, pad_mode='constant'))**2
+        expected = librosa.power_to_db(librosa.feature.melspectrogram(S=S, sr=frontend.sr, n_mels=frontend.n_mels), top_db=frontend.top_db)
+        assert_close(frontend.log_mel(y), expected)
+
+def test_mfcc_matches_librosa():
+    for y in signals():
+        S = np.abs(librosa.stft(y, n_fft=frontend.n_fft, hop_length=frontend.hop_length, pad_mode='constant'))**2
+        log_S = librosa.power_to_db(librosa.feature.melspectrogram(S=S, sr=frontend.sr, n_mels=frontend.n_mels), top_db=frontend.top_db)
+        expected = librosa.feature.mfcc(S=log_S, n_mfcc=frontend.n_mfcc)
+        assert_close(frontend.mfcc(y), expected)
+        np.testing.assert_allclose(frontend.mfcc(S=frontend.power_spectrogram(y)), frontend.mfcc(y))
+
+def test_filterbank_and_dct_match_librosa():
+    np.testing.assert_allclose(frontend.mel_filterbank(), librosa.filters.mel(sr=frontend.sr, n_fft=frontend.n_fft, n_mels=frontend.n_mels), atol=1e-7)
+    import scipy.fft
+    np.testing.assert_allclose(frontend.dct_matrix(), scipy.fft.dct(np.eye(frontend.n_mels), type=2, norm='ortho', axis=0)[:frontend.n_mfcc], atol=1e-6)
+
+def test_embed():
+    features = np.arange(12, dtype=np.float32).reshape(3, 4)
+    np.testing.assert_array_equal(frontend.embed(features), np.concatenate((features.mean(axis=1), features.std(axis=1))))
+    np.testing.assert_array_equal(frontend.embed(features, 'flatten', 2), features[:, :2].ravel())
+    np.testing.assert_array_equal(frontend.embed(features, 'flatten', 5).reshape(3, 5)[:, 4], 0)
+    with pytest.raises(ValueError):
+        frontend.embed(features, 'max')
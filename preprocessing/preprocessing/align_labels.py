@@ -8,14 +8,61 @@ Created on Tue Jan 14 13:25:04 2020
 
 import pandas as pd
 from pytz import timezone as timezonepytz
-from mutagen.mp3 import MP3
 from datetime import datetime, timedelta
 from preprocessing_general import *
+from preprocessing.file_index import *
+
+label_time_columns = ['Event Created Time', 'Event Time', 'Event End']
+label_time_format = '%Y-%m-%dT%H:%M:%S.%f%z' #ISO 8601 format written by the labeling app, e.g. 2021-01-02T18:02:57.667000+00:00
+default_duration = 2 #Duration (s) of labels that don't have an end time
+
+#This function converts a column of label times to UTC datetimes.  The whole column is parsed at once with the labeling app's fixed format;
+#if any value doesn't match it (e.g. a time without fractional seconds), the column is parsed again as general ISO 8601
+def parse_label_times(column):
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return pd.to_datetime(column, utc=True)
+    try:
+        return pd.to_datetime(column, format=label_time_format, utc=True)
+    except ValueError:
+        return pd.to_datetime(column, format='ISO8601', utc=True)
+
+#This function parses the times in a label dataframe and fills in missing end times
+#Inputs
+#labels: dataframe read from the label data file (any number of participants)
+#Returns
+#labels: a copy of the dataframe with the time columns stored as UTC datetimes
+def parse_label_table(labels):
+    labels = labels.copy()
+    for column in label_time_columns:
+        labels[column] = parse_label_times(labels[column])
 
-#This function parses the label data file generated by the labeling app, and stores all the data in the correct format.
+    ##Make adjustments for participant anomalies in data set up due to old versions
+    #data from beginning of study may not have an end time
+    labels['Event End'] = labels['Event End'].fillna(labels['Event Time'] + timedelta(seconds=default_duration))
+    return labels
+
+#This function reads the label data file once and splits it by participant, so that processing many participant-days doesn't re-read and re-parse the file
+#The parsed table can be kept on disk (cache_path) so that later runs don't parse the .csv file at all.  The cache is rebuilt when the .csv file is newer than it
 
 #Inputs
 #labels_path: path to the .csv file that has the label timing information
+#cache_path: optional path to store the parsed table at (as a pickle, which keeps the column types)
+
+#Returns
+#labels_by_participant: dictionary mapping each participant ID to a dataframe of its labels, with the time columns already parsed
+def load_labels(labels_path, cache_path=None):
+    if cache_path is not None and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(labels_path):
+        labels = pd.read_pickle(cache_path)
+    else:
+        labels = parse_label_table(pd.read_csv(labels_path))
+        if cache_path is not None:
+            labels.to_pickle(cache_path)
+    return {participant_id: pt_labels for participant_id, pt_labels in labels.groupby('Participant ID', sort=False)}
+
+#This function parses the label data file generated by the labeling app, and stores all the data in the correct format.
+
+#Inputs
+#labels_path: path to the .csv file that has the label timing information, a dataframe already read from it, or the dictionary returned by load_labels
 #participant_id: the participant whose data is being processed
 #data_path: path to the folder containing the audio data being processed
 #utc_offset: offset between the recorder clock and UTC time in hours
@@ -24,52 +71,92 @@ from preprocessing_general import *
 #Returns
 #id_data: dataframe with all labels for participant_id, with time information stored as datetimes with the correct timezone
 def parse_label_csv(labels_path, participant_id, data_path, utc_offset, drift=0):
-    labels = pd.read_csv(labels_path)
+    if isinstance(labels_path, dict):
+        labels = labels_path.get(participant_id, pd.DataFrame(columns=['Participant ID']))
+    elif isinstance(labels_path, pd.DataFrame):
+        labels = labels_path
+    else:
+        labels = pd.read_csv(labels_path)
 
     #Extract the participant of interest
     id_data = labels.loc[labels['Participant ID'] == participant_id].copy()
-    id_data.sort_values(['Participant ID'])
     
     if(id_data.size==0):
         raise SystemExit('There is no label data for the selected participant')
 
-    id_data['Event Created Time']=id_data['Event Created Time'].apply(pd.to_datetime)
-    id_data['Event Time']=id_data['Event Time'].apply(pd.to_datetime)
-    id_data['Event End']=id_data['Event End'].apply(pd.to_datetime)
-
+    id_data = parse_label_table(id_data)
 
-    default_duration = 2
-    
-    id_data['Event Created Time']=(id_data['Event Created Time'].copy()).dt.tz_convert('UTC')
-    id_data['Event Time']=(id_data['Event Time'].copy()).dt.tz_convert('UTC')
-    id_data['Event End']=(id_data['Event End'].copy()).dt.tz_convert('UTC')
-
-    def fill_na_event_ends(idDF): #data from beginning of study may not have an end time
-        if pd.isnull(idDF['Event End']):
-            return idDF['Event Time']+timedelta(seconds=default_duration)
-        else:
-            return idDF['Event End']
-
-    ##Make adjustments for participant anomalies in data set up due to old versions
-    id_data['Event End']=id_data.apply(lambda x: fill_na_event_ends(x), axis=1)
-
-    tail = os.path.split(data_path)
-    study_date = tail[1]
-    folder_date_format = '%Y%m%d'
     utc_offset_seconds = (utc_offset+0.0000001)*3600 + drift #convert utc_offset (given in hours, to seconds)
     
     id_data['Recorder Event Time'] = id_data['Event Created Time'] +timedelta(seconds=utc_offset_seconds)
 
-    id_data_indices = list(id_data.index)
-    if len(id_data_indices)==0:
-        raise SystemExit('There is no label data for the selected participant')
-    
     return id_data
 
+#This function finds the start time (in UTC) and length of a recorder file from its entry in the folder's file index (see file_index)
+#The recorder sets the file's modification time to its local clock time when the recording starts
+
+#Inputs
+#f: path to the recorder file
+#entry: the file's entry in the index returned by load_file_index
+#utc_offset: offset between the recorder clock and UTC time in hours
+#drift: calculated drift between the recorder clock and the time server (in s)
+
+#Returns
+#seg_start_time: datetime with the file start time in UTC
+#length: length of the recording in s
+def recorder_file_times(f, entry, utc_offset, drift=0):
+    print(f, ', original time stamp:', datetime.fromtimestamp(entry['mtime']))
+
+    ##Convert the recorder time stamp to UTC, using information in the participant database
+    seg_start_time, seg_end_time = file_start_end_times(entry, utc_offset, drift)
+    print('UTC file start time', seg_start_time)
+    return seg_start_time, entry['duration']
+
+#This function finds every (label, file) pair where the label overlaps the recording window of the file
+#A label is assigned to a file if it was created during the file, or if it was created before the file started and ended after the file started
+
+#Inputs
+#created_ns: array of label creation times (int64 ns since the epoch)
+#end_ns: array of label end times (int64 ns since the epoch)
+#file_start_ns: array of file start times (int64 ns since the epoch)
+#file_length: array of file lengths in s
+
+#Returns
+#label_index, file_index: arrays with the positions of the label and the file for each pair
+#created_in_file: boolean array, True if the label was created during the file (False if it was created before the file started)
+def label_file_pairs(created_ns, end_ns, file_start_ns, file_length):
+    order = np.argsort(file_start_ns, kind='stable')
+    sorted_starts = file_start_ns[order]
+    max_length_ns = int(np.ceil(np.max(file_length, initial=0)*1e9)) + 1
+
+    #Each label can only have been created during files that started less than the longest file length before it
+    lo_in = np.searchsorted(sorted_starts, created_ns - max_length_ns, side='left')
+    hi_in = np.searchsorted(sorted_starts, created_ns, side='left') #files that started before the label was created
+    #Labels created before a file started and ending after it started
+    lo_span = hi_in
+    hi_span = np.searchsorted(sorted_starts, end_ns, side='left')
+
+    def expand(lo, hi):
+        counts = np.maximum(hi - lo, 0)
+        label_index = np.repeat(np.arange(len(lo)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return label_index, order[np.repeat(lo, counts) + offsets]
+
+    in_labels, in_files = expand(lo_in, hi_in)
+    keep = (created_ns[in_labels] - file_start_ns[in_files])/1e9 < file_length[in_files]
+    in_labels, in_files = in_labels[keep], in_files[keep]
+    span_labels, span_files = expand(lo_span, hi_span)
+
+    label_index = np.concatenate((in_labels, span_labels))
+    file_index = np.concatenate((in_files, span_files))
+    created_in_file = np.concatenate((np.ones(len(in_labels), dtype=bool), np.zeros(len(span_labels), dtype=bool)))
+    return label_index, file_index, created_in_file
+
 #This function finds the labels that occur within the audio files being processed (in data_path) and calculates the label timings relative to the audio files
+#All the labels are matched to all the files in one pass (see label_file_pairs)
 
 #Inputs
-#labels_path: path to the .csv file that has the label timing information
+#labels_path: path to the .csv file that has the label timing information, or a dataframe already read from it
 #participant_id: the participant whose data is being processed
 #data_path: path to the folder containing the audio data being processed
 #utc_offset: offset between the recorder clock and UTC time in hours
@@ -83,14 +170,9 @@ def parse_label_csv(labels_path, participant_id, data_path, utc_offset, drift=0)
 def align_data(labels_path, participant_id, data_path, utc_offset, drift = 0):
     pt_data = parse_label_csv(labels_path, participant_id, data_path, utc_offset, drift)
 
-    #Initialize a pandas directory to export as a CSV
-    dfMaster = pd.DataFrame()
-        
-    #Find all the mp3 files in the directory
-    files = []
-    for filename in os.listdir(data_path):
-        if filename.endswith(".mp3"): #The vidoes that have been rotated have the file extension c
-            files.append(os.path.join(data_path, filename))
+    #Find all the mp3 files in the directory.  Their time stamps and lengths are read from the folder's file index, which only re-opens new or changed files
+    recorder_index = load_file_index(data_path, ('.mp3',))
+    files = [os.path.join(data_path, filename) for filename in recorder_index]
 
     #The files have numerical names that correspond to the order in which they were recorded
     
@@ -98,85 +180,45 @@ def align_data(labels_path, participant_id, data_path, utc_offset, drift = 0):
         return(x[-8:])
         
     files = sorted(files, key = last_8chars)
-    internalDF = pd.DataFrame()
-    
-    for f in files:
-        id_data = pt_data
-        mod_time=os.path.getmtime(f)
-        print(f, ', original time stamp:', datetime.fromtimestamp(mod_time))
-        
-        audio = MP3(f)
-        
-        ##Convert the recorder time stamp to UTC, using information in the participant database
-        
-        utc_offset_seconds = utc_offset*3600+drift #convert utc_offset (given in hours, to seconds)
-        seg_start = mod_time - utc_offset_seconds
-            
-  
-        seg_start=datetime.fromtimestamp(seg_start)
-        seg_start= seg_start.replace(tzinfo=timezonepytz('UTC'))
-        seg_start_time = seg_start       
-        print('UTC file start time', seg_start_time)
-            
-        seg_end_time = seg_start_time+timedelta(seconds=audio.info.length)
-        ##seg_start_time and seg_end_time are now in UTC and can be compared to the label dataframe
-
-        #Label Duration will be NaN if it was a custom label (generally a note).  Default to a 2s custom label time
-        mask = id_data['Was Custom']
-        id_data.loc[mask, 'Event End'] = id_data.loc[mask, 'Event Created Time'] + pd.Timedelta(seconds=2)
-
-
-        #Get information on the label timing relative to the file
-        id_data['Time From Start']=id_data['Event Created Time']-seg_start_time
-        id_data['Label Duration']=id_data['Event End']-id_data['Event Created Time']
-
-        id_data['End From File Start'] = id_data['Event End'] - seg_start_time
-
-        #Remove all labels that occurred before the file started; These labels have negative times
-        id_data_start = id_data.loc[id_data['Time From Start'] > pd.Timedelta(seconds=0)]
-        id_data_end = id_data.loc[id_data['End From File Start'] > pd.Timedelta(seconds=0)]
-        id_data = pd.concat([id_data_start, id_data_end]).drop_duplicates()
-
-        #convert to timeobjects
-        id_data['Time From Start']=pd.to_timedelta(id_data['Time From Start'])
-        id_data['Label Duration']=pd.to_timedelta(id_data['Label Duration'])
-
-        id_data['Time From Start (s)']=id_data['Time From Start'].dt.total_seconds()
-        id_data['End From File Start (s)'] = id_data['End From File Start'].dt.total_seconds()
-
-
-        if (id_data['Time From Start (s)'].size) != 0: #This prevents the code from throwing an error if there are no labels for that audio chunk
-            
-            #Find those labels that started before the audiofile ends
-            audio_data = id_data.loc[id_data['Time From Start (s)']<audio.info.length] #This includes all data with a start time in the audio file
-            
-            #Find those labels before the audio file but ended during the audio file, or that started during the audio file but ended after rhe audio file
-            audio_data2 = id_data[(id_data['Event Created Time'] <= seg_start_time) & ((id_data['Event End'] >= seg_end_time) | ((seg_start_time <= id_data['Event End'])& (seg_end_time >= id_data['Event End']) ))] #This is designed to find labels that encompass an entire file (started before the file began and ends after it ends) or stars before the file began and ends in the file
-            audio_data = pd.concat([audio_data, audio_data2], sort=True)
-
-        else: #this will be empty
-            audio_data = id_data
-        
-        audio_data=audio_data.drop_duplicates()
-
-        audio_data['Time From Start (s)']=audio_data['Time From Start'].apply(seconds)
-        audio_data['Label Duration (s)']=audio_data['Label Duration'].apply(seconds)
-
-        internalDF = pd.concat([internalDF, audio_data])
-                
-        startTimes = audio_data['Time From Start'].tolist()
-        startTimesSec = [x.total_seconds() for x in startTimes] #convert to a number of seconds; total_seconds preserves negative values #audio_data['Time From Start (s)'].tolist()
-        startTimesHms = [hms_string(x, include_sec_frac=True, use_colon=True) for x in startTimesSec]
-
-        labelDuration = audio_data['Label Duration (s)'].tolist()
-        givenLabel = audio_data['Label'].tolist()
-        
-        fname = os.path.basename(f)
-        fileList = len(givenLabel)*[fname] #All these entries are from the same file; create a list with the same filename as the number of labels in that file
-
-        data = {'Recorder file':fileList, 'Start relative recorder (s)':startTimesSec, 'Start relative recorder (hh:mm:ss)': startTimesHms, 'Label':givenLabel, 'Label duration':labelDuration}
-        df = pd.DataFrame(data)
-        dfMaster = pd.concat([dfMaster, df],sort=True)
+    file_times = [recorder_file_times(f, recorder_index[os.path.basename(f)], utc_offset, drift) for f in files]
+    file_start_ns = np.array([pd.Timestamp(start).value for start, length in file_times], dtype=np.int64)
+    file_length = np.array([length for start, length in file_times], dtype=np.float64)
+
+    #Label Duration will be NaN if it was a custom label (generally a note).  Default to a 2s custom label time
+    if len(files) > 0:
+        mask = pt_data['Was Custom']
+        pt_data.loc[mask, 'Event End'] = pt_data.loc[mask, 'Event Created Time'] + pd.Timedelta(seconds=2)
+    pt_data = pt_data.loc[~pt_data.duplicated()] #Identical label rows are only kept once
+
+    created_ns = pt_data['Event Created Time'].astype('datetime64[ns, UTC]').array.asi8
+    end_ns = pt_data['Event End'].astype('datetime64[ns, UTC]').array.asi8
+    label_index, file_index, created_in_file = label_file_pairs(created_ns, end_ns, file_start_ns, file_length)
+
+    #Keep the pairs grouped by file (in recording order); within a file, labels created during the file come first
+    pair_order = np.lexsort((label_index, ~created_in_file, file_index))
+    label_index, file_index = label_index[pair_order], file_index[pair_order]
+
+    internalDF = pt_data.iloc[label_index].copy()
+    seg_start_time = pd.to_datetime(file_start_ns[file_index], utc=True)
+    seg_start_time = pd.Series(seg_start_time, index=internalDF.index)
+
+    #Get information on the label timing relative to the file
+    internalDF['Time From Start'] = internalDF['Event Created Time'] - seg_start_time
+    internalDF['Label Duration'] = internalDF['Event End'] - internalDF['Event Created Time']
+    internalDF['End From File Start'] = internalDF['Event End'] - seg_start_time
+    internalDF['End From File Start (s)'] = internalDF['End From File Start'].dt.total_seconds()
+    internalDF['Time From Start (s)'] = internalDF['Time From Start'].apply(seconds)
+    internalDF = internalDF[sorted(internalDF.columns)]
+    internalDF['Label Duration (s)'] = internalDF['Label Duration'].apply(seconds)
+
+    startTimesSec = internalDF['Time From Start'].dt.total_seconds().tolist() #convert to a number of seconds; total_seconds preserves negative values
+    startTimesHms = [hms_string(x, include_sec_frac=True, use_colon=True) for x in startTimesSec]
+
+    data = {'Recorder file': [os.path.basename(files[i]) for i in file_index], 'Start relative recorder (s)': startTimesSec,
+            'Start relative recorder (hh:mm:ss)': startTimesHms, 'Label': internalDF['Label'].tolist(),
+            'Label duration': internalDF['Label Duration (s)'].tolist()}
+    dfMaster = pd.DataFrame(data)
+    dfMaster = dfMaster[sorted(dfMaster.columns)]
 
     csvDest = data_path+"/formattedLabels"+os.path.split(data_path)[1]+".csv"
         
@@ -187,5 +229,3 @@ def align_data(labels_path, participant_id, data_path, utc_offset, drift = 0):
     dfMaster.to_csv(csvDest, index = None, header=True)
     
     return internalDF, dfMaster
-
-
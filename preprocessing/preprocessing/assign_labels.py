@@ -2,6 +2,143 @@ import pandas as pd
 from preprocessing_general import *
 from shutil import copyfile
 
+link_modes = ('copy', 'hardlink', 'symlink', 'manifest')
+
+#These values should be adjusted depending on the associated labeling accuracy for the participant,
+#and based on the accuracy of the segments outputted by find_vocalizations
+allowedDelayConfident = 15; #to be used if the label started after the segment
+allowedDelayTentative = 3;  # To be used if the label started before the segment; allows for a small amount of drift
+
+#This function finds, for each pair (x_start, x_end), the first label with label_start < x_start and label_end > x_end
+#With x_start == x_end this is the first label that contains x
+
+#Inputs
+#x_start, x_end: arrays of times
+#label_start: array of label start times, sorted in ascending order
+#end_running_max: running maximum of the label end times (np.maximum.accumulate(label_end)), in the same order as label_start
+
+#Returns
+#Array with the index of the first matching label for each pair, or -1 if no label matches
+def first_enclosing_label(x_start, x_end, label_start, end_running_max):
+    n_before = np.searchsorted(label_start, x_start, side='left') #The labels that start before x_start are label_start[:n_before]
+    first_after = np.searchsorted(end_running_max, x_end, side='right') #The first label that ends after x_end
+    return np.where(first_after < n_before, first_after, -1)
+
+#This function finds, for each time in x, the index of the closest value in values.  If two values are equally close, the one with the lower index is returned (the same as np.argmin)
+def nearest_value_index(x, values):
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    n = len(sorted_values)
+
+    pos = np.searchsorted(sorted_values, x, side='left')
+    left = np.clip(pos - 1, 0, n - 1)
+    right = np.clip(pos, 0, n - 1)
+    left = np.searchsorted(sorted_values, sorted_values[left], side='left') #If a value repeats, use its first occurrence (lowest index)
+
+    left_distance = np.absolute(x - sorted_values[left])
+    right_distance = np.absolute(x - sorted_values[right])
+    left_index = order[left]
+    right_index = order[right]
+    return np.where(left_distance < right_distance, left_index,
+                    np.where(right_distance < left_distance, right_index, np.minimum(left_index, right_index)))
+
+#This function matches volume segments to labels using their timing information.  All times are relative to the same recorder file
+
+##Match a segment with a label if (rules are checked in order):
+## 1. the segment is fully within the bounds of a label
+## 2. the end of the segment occured during a label (suggesting that the label was pressed after the user heard the content of the segment)
+## 3. The label and segment starts are close together (the closest label started after the segment, within allowedDelayConfident)
+## 4. Segment started soon after a label ended (within allowedDelayTentative). The label with the closest start is assigned
+## 5. The segment started within a label and ended in close proximity to a label
+###This is the least ideal labeling situation because it could mean that  the label was not accurate for that segment so the user ended it
+#But, it could also mean that the labeler thought the segment was going to end and it didn't, so allow for some of these if there is a high threshold (very close proximity)
+#When several labels satisfy a containment rule, the first label (in order of start time) is used
+
+#The labels are searched with binary searches over the sorted label times, so matching takes O((S+L) log L) for S segments and L labels
+
+#Inputs
+#seg_start, seg_end: arrays of segment start and end times (s)
+#label_start, label_end: arrays of label start and end times (s), sorted by label_start
+#allowed_delay_confident, allowed_delay_tentative: thresholds for rules 3-5 (s)
+
+#Returns
+#Array with the index of the matched label for each segment, or -1 if no label was close enough to the segment to make an assignment
+def match_segments_to_labels(seg_start, seg_end, label_start, label_end, allowed_delay_confident=allowedDelayConfident, allowed_delay_tentative=allowedDelayTentative):
+    seg_start = np.asarray(seg_start, dtype=np.float64)
+    seg_end = np.asarray(seg_end, dtype=np.float64)
+    label_start = np.asarray(label_start, dtype=np.float64)
+    label_end = np.asarray(label_end, dtype=np.float64)
+    if len(seg_start) == 0 or len(label_start) == 0:
+        return np.full(len(seg_start), -1, dtype=np.int64)
+
+    #Sort the labels by start time (a stable sort, so labels that are already sorted keep their order) and map the results back at the end
+    order = np.argsort(label_start, kind='stable')
+    label_start = label_start[order]
+    label_end = label_end[order]
+    end_running_max = np.maximum.accumulate(label_end)
+
+    full_in_label = first_enclosing_label(seg_start, seg_end, label_start, end_running_max) #Condition 1
+    end_in_label = first_enclosing_label(seg_end, seg_end, label_start, end_running_max) #Condition 2
+    start_in_label = first_enclosing_label(seg_start, seg_start, label_start, end_running_max) #Condition 5
+
+    closest_start = nearest_value_index(seg_start, label_start) #The label with the start time closest to the segment start
+    min_value_start = seg_start - label_start[closest_start] #Less than zero means that the label started after the segment started
+    closest_end = nearest_value_index(seg_start, label_end) #The label with the end time closest to the segment start
+    min_value_end = seg_start - label_end[closest_end]
+
+    start_in_label_end_diff = seg_start - label_end[np.maximum(start_in_label, 0)]
+
+    matched = np.select(
+        [full_in_label >= 0,
+         end_in_label >= 0,
+         (min_value_start < 0) & (np.absolute(min_value_start) <= allowed_delay_confident),
+         np.absolute(min_value_end) <= allowed_delay_tentative,
+         (start_in_label >= 0) & (np.absolute(start_in_label_end_diff) <= allowed_delay_tentative)],
+        [full_in_label, end_in_label, closest_start, closest_start, start_in_label],
+        default=-1)
+    return np.where(matched >= 0, order[matched], -1)
+
+#This function builds the label folders: a subfolder of label_root for every label, holding the segments matched with that label
+
+#Inputs
+#matchedLabels: dictionary mapping each segment path to its matched label ("" if no label was matched)
+#label_root: path to the folder that holds the label subfolders
+#link_mode: how each segment is placed in its label folder:
+#   'copy': copy the segment file
+#   'hardlink': hard link to the segment file (no data is duplicated; the folders must be on the same file system)
+#   'symlink': symbolic link to the segment file
+#   'manifest': don't create any label subfolders; only write label_root/manifest.csv listing each segment and its label
+
+#Exports
+#The label subfolders (or the manifest) in label_root
+def build_label_folders(matchedLabels, label_root, link_mode='copy'):
+    if link_mode not in link_modes:
+        raise ValueError('link_mode must be one of ' + ', '.join(link_modes))
+
+    matched = [(seg, label) for seg, label in matchedLabels.items() if len(label) != 0] # Only the segments with a matched label
+
+    if link_mode == 'manifest':
+        manifest = pd.DataFrame(matched, columns=['Segment path', 'Label'])
+        manifest.to_csv(label_root + '/manifest.csv', index=None, header=True)
+        return
+
+    for path_to_file, label in matched:
+        labelFolder = label_root + "/" + label  # The folder name is the label
+        if not (os.path.isdir(labelFolder)):  # If a folder for the label doesn't exist
+            os.mkdir(labelFolder)  # make it
+        segment_basename = os.path.basename(path_to_file)
+        dest = labelFolder + '/' + segment_basename
+
+        if link_mode == 'copy':
+            copyfile(path_to_file, dest)
+            continue
+        if os.path.lexists(dest): #Links can't overwrite an existing file
+            os.remove(dest)
+        if link_mode == 'hardlink':
+            os.link(path_to_file, dest)
+        else:
+            os.symlink(os.path.abspath(path_to_file), dest)
+
 #This function using the timing information to match vocalizations to labels
 
 #Inputs:
@@ -9,12 +146,13 @@ from shutil import copyfile
 #path_to_segment_df: Path to .csv with segment timing information.  This dataframe is exported by find_vocalizations.segment_data
 #path_to_label_df: Path to .csv with label timing information.  This dataframe is exported by align_labels.align_data
 #token: the token that was provided to the function find_vocalizations.segment_data as a short descriptor of the method for reference
+#link_mode: how segments are placed in the label subfolders: 'copy', 'hardlink', 'symlink', or 'manifest' (see build_label_folders)
 
 #Exports
 #The folder AutoSegments which contains subfolders of labels that contain all the audio segments matched with that label
 #Rewrite the dataframe in path_to_segment df to include the matched label
 
-def assign_labels(data_path, path_to_segment_df, path_to_label_df, token):
+def assign_labels(data_path, path_to_segment_df, path_to_label_df, token, link_mode='copy'):
     segment_folder = '/AutoSegments_' + token #Where to export the segments to
 
     #Import and sort information on the identified audio segments
@@ -42,114 +180,18 @@ def assign_labels(data_path, path_to_segment_df, path_to_label_df, token):
 
         seg_start_list = np.array(list(fileSegDF['Start relative recorder (s)']))
         seg_end_list = np.array(list(fileSegDF['End relative recorder (s)']))
-        vol_file_list = list(fileSegDF['Recorder file'])
-        vol_duration_list = list(fileSegDF['Segment duration'])
         segment_path_list = list(fileSegDF['Segment path'])
 
         label_start_list = np.array(list(fileLabelDF['Start relative recorder (s)']))
         label_end_list = np.array(list(fileLabelDF['End relative recorder (s)']))
         label_list = np.array(list(fileLabelDF['Label']))
 
-        # These data structures are used to evaluate if there is a label near the start or end of a volume segment
-        # Each row in start_comparison corresponds to an isolated segment; each column for that row is the time difference between the segment and the label
-        # This matrix contains the distance from each segment to every label for the given file
-        start_comparison = np.zeros((len(seg_start_list), len(label_list)))
-        end_comparison = np.zeros((len(seg_start_list), len(label_list)))
-
-        for i,label in enumerate(label_list):
-            label_start_comparison = seg_start_list - label_start_list[
-                i]  # Compare the entire list of volume segments to when each label started
-            label_end_comparison = seg_start_list - label_end_list[
-                i]  # Compare the entire list of volume segments to when each label ended
-            #If negative, the segment started after the label ended; #if positive, the segment started before the label ended
-
-            start_comparison[:,
-            i] = label_start_comparison  # Put the results for comparing with the label start in column i of this array
-            end_comparison[:,
-            i] = label_end_comparison  # Put the results for comparing with the label end in column i of this array
-
-        col_index_start = np.argmin(np.absolute(start_comparison),
-                                    axis=1)  # The index corresponds to the column (label) with the start time closest to the segment
-
-        min_value_start= np.array([start_comparison[i, col_ind] for i, col_ind in enumerate(col_index_start)])
-        # The value of the time difference between the segment and the closes label start time (with index given in col_index_start)
-
-        col_index_end = np.argmin(np.absolute(end_comparison),
-                                  axis=1)  # This is the minimum value in the row that represents all the labels
-        min_value_end = np.array([end_comparison[i, col_ind] for i, col_ind in enumerate(col_index_end)])
-
-        #These values should be adjusted depending on the associated labeling accuracy for the participant,
-        #and based on the accuracy of the segments outputted by find_vocalizations
-        allowedDelayConfident = 15; #to be used if the label started after the segment
-        allowedDelayTentative = 3;  # To be used if the label started before the segment; allows for a small amount of drift
-
-
-        ##In-progress rules for assigning labels
-        for i, seg in enumerate(segment_path_list):
-            seg_start = seg_start_list[i]
-            # The above lists were used to calculated the closest position of a label to a segment
-            # Depending on the labeling style, there may be no labels close to a segment if the label spanned a long time duration
-            # Here we check, for a given segment, if there are any labels that contain the segment entirely or partially
-            #
-            # Arrays to compare the volume segment start and end times to the label start and end times, for every label
-            start_and_start = seg_start_list[i] > label_start_list  # The segment starts after the label starts; list has length of the number of labels in the file
-            start_and_end = seg_start_list[i] < label_end_list  # The segment starts before the label ends; list has length of the number of labels in the file
-            end_and_start = seg_end_list[i] > label_start_list  # The segment ends after the label starts; list has length of the number of labels in the file
-            end_and_end = seg_end_list[i] < label_end_list  # The segment ends before the label ends; list has length of the number of labels in the file
-
-            seg_start_in_label = [a and b for a, b in zip(start_and_start,
-                                                            start_and_end)]  # The start of the segment is within the label bounds (for every label)
-            seg_end_in_label = [a and b for a, b in
-                                  zip(end_and_start, end_and_end)]  # The end of the segment is within the label bounds (for every label)
-
-            seg_full_in_label = np.array([a and b for a, b in zip(seg_start_in_label,
-                                                                    seg_end_in_label)])  # The start and end of the chunk is within the label bounds
-
-            #Find the indices of those segments that fell partially or fully within the label
-            seg_fully_in_label_indices = [j for j, x in enumerate(seg_full_in_label) if x]
-            seg_end_in_label_indices = [j for j,x in enumerate(seg_end_in_label) if x]
-            seg_start_in_label_indices = [j for j, x in enumerate(seg_start_in_label) if x]
-
-            ##First check if a segment lies entirely within a label (e.g., a person labeled a long span with the same label, and the segment is entirely within it
-
-            ##Match a segment with a label if:
-            ## 1. the segment is fully or partially within the bounds of a label
-            ## 2. the end of the segment occured during a label (suggesting that the label was pressed after the user heard the content of the segment)
-            ## 3. The label and segment starts are close together.
-            # 4. Segment started soon after a label ended
-            ##5. The segment started within a label and ended in close proximity to a label
-            ###This is the least ideal labeling situation because it could mean that  the label was not accurate for that segment so the user ended it
-            #But, it could also mean that the labeler thought the segment was going to end and it didn't, so allow for some of these if there is a high threshold (very close proximity)
-            if len(seg_fully_in_label_indices) > 0: #Condition 1
-                label_index = seg_fully_in_label_indices[0] #the way the app label data is stored, the labels cannot overlap so the segment can be fully in at most exactly one label
-                matchedLabels[seg] = label_list[label_index]
-            elif len(seg_end_in_label_indices) > 0: #Condition2, The segment end time fell within a label, but not both
-                label_index = seg_end_in_label_indices[0]
-                matchedLabels[seg] = label_list[label_index]
-            elif (min_value_start[i] < 0) and (abs(min_value_start[ #Condition 3, Less than zero means that the label started after the segment started
-                                                       i]) <= allowedDelayConfident):  # if the sign is greater than 0, the segment started after a label
-                matchedLabels[seg] = label_list[col_index_start[i]]
-            elif (abs(min_value_end[i]) <= allowedDelayTentative): #Condition 4
-                matchedLabels[seg] = label_list[col_index_start[i]]
-            elif len(seg_start_in_label_indices) > 0: #Condition 5
-                label_index = seg_start_in_label_indices[0]
-                end_diff = end_comparison[i,label_index]
-                if (abs(end_diff) <= allowedDelayTentative):
-                    matchedLabels[seg] = label_list[label_index]
-                else:
-                    matchedLabels[seg] = ""
-            else: #There was no label close enough to the segment to make an assignment
-                matchedLabels[seg] = ""
-
-        for key in matchedLabels:
-            if (len(matchedLabels[key]) != 0):  # If there was a matched label
-                labelFolder = data_path + segment_folder +"/" + matchedLabels[key]  # The folder name is the label
-                if not (os.path.isdir(labelFolder)):  # If a folder for the label doesn't exist
-                    os.mkdir(labelFolder)  # make it
-                path_to_file = key
-                segment_basename=os.path.basename(path_to_file)
-                copydest = labelFolder + '/' + segment_basename
-                copyfile(path_to_file, copydest)
+        label_index = match_segments_to_labels(seg_start_list, seg_end_list, label_start_list, label_end_list)
+        for seg, i in zip(segment_path_list, label_index):
+            matchedLabels[seg] = label_list[i] if i >= 0 else "" #An empty string means there was no label close enough to the segment to make an assignment
+
+    #Build the label folders once, after every file has been matched
+    build_label_folders(matchedLabels, data_path + segment_folder, link_mode)
 
     segDF['Possible Label'] = segDF['Segment path'].map(matchedLabels)
     segDF.to_csv( path_to_segment_df, index=None, header=True)
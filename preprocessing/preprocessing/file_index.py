@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keeps an index of the recorder files in a data folder (size, modification time, duration, sample rate, channels),
+so the pipeline stages don't have to re-open every recording to find its timing information.
+"""
+
+import os
+import json
+import soundfile
+from datetime import datetime, timedelta
+from mutagen.mp3 import MP3
+from pytz import timezone as timezonepytz
+
+index_file_name = '.file_index.json' #Stored in the data folder being indexed
+
+#This function reads the duration, sample rate, and number of channels of an audio file from its headers (the audio is not decoded)
+
+#Inputs
+#path: path to the audio file
+
+#Returns
+#dictionary with the keys 'duration', 'sample_rate', and 'channels'
+def probe_audio_file(path):
+    if path.lower().endswith('.mp3'):
+        info = MP3(path).info
+        return {'duration': info.length, 'sample_rate': info.sample_rate, 'channels': info.channels}
+    info = soundfile.info(path)
+    return {'duration': info.duration, 'sample_rate': info.samplerate, 'channels': info.channels}
+
+#This function returns the index of the audio files in a folder, updating the stored index first
+#Only the files that are new, or whose size or modification time have changed, are probed; entries for deleted files are dropped
+
+#Inputs
+#data_path: path to the folder containing the audio files
+#extensions: tuple of file extensions to index
+
+#Returns
+#index: dictionary mapping each file name to a dictionary with the keys 'size', 'mtime' (s since the epoch, as returned by os.path.getmtime),
+#'mtime_ns', 'duration' (s), 'sample_rate', and 'channels'
+def load_file_index(data_path, extensions=('.mp3',)):
+    index_path = os.path.join(data_path, index_file_name)
+    stored = {}
+    if os.path.exists(index_path):
+        try:
+            with open(index_path) as f:
+                stored = json.load(f)
+        except (ValueError, OSError):
+            print('Rebuilding unreadable file index', index_path)
+
+    index = {}
+    changed = False
+    for name in sorted(os.listdir(data_path)):
+        if not name.endswith(extensions):
+            continue
+        stat = os.stat(os.path.join(data_path, name))
+        entry = stored.get(name)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            index[name] = entry
+            continue
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'mtime_ns': stat.st_mtime_ns}
+        entry.update(probe_audio_file(os.path.join(data_path, name)))
+        index[name] = entry
+        changed = True
+
+    #Keep the entries of files with other extensions that are still present, so indexes of different file types can share the folder
+    for name, entry in stored.items():
+        if name not in index and not name.endswith(extensions) and os.path.exists(os.path.join(data_path, name)):
+            index[name] = entry
+    changed = changed or set(index) != set(stored)
+
+    if changed:
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, index_path)
+
+    return {name: entry for name, entry in index.items() if name.endswith(extensions)}
+
+#This function converts the recorder time stamp of a file to its start time in UTC, using information in the participant database
+#The recorder sets the file's modification time to its local clock time when the recording starts
+
+#Inputs
+#entry: the file's entry in the index returned by load_file_index
+#utc_offset: offset between the recorder clock and UTC time in hours
+#drift: calculated drift between the recorder clock and the time server (in s)
+
+#Returns
+#file_start_time: datetime with the file start time in UTC
+#file_end_time: datetime with the file end time in UTC
+def file_start_end_times(entry, utc_offset, drift=0):
+    utc_offset_seconds = utc_offset*3600+drift #convert utc_offset (given in hours, to seconds)
+    seg_start = entry['mtime'] - utc_offset_seconds
+
+    seg_start = datetime.fromtimestamp(seg_start)
+    file_start_time = seg_start.replace(tzinfo=timezonepytz('UTC'))
+    file_end_time = file_start_time+timedelta(seconds=entry['duration'])
+    return file_start_time, file_end_time
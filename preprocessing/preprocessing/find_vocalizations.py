@@ -33,35 +33,21 @@ def pad_segment(start_time, end_time, padding, file_length):
 
     return start_time, end_time
 
-#This function exports each audio segment that meets the specified volume thresholds.  It is called by the function segment_data
+#This function builds the names and timing information for a segment.  It is called by export_segment and export_segments
 
 #Inputs
 #f: the audio file that the segment is being extracted from
-#voc_start: the start of the segment relatie to f
-#voc_duration: the duration of the segment
-#padding: the amount of padding to add to the segment
+#voc_start: the start of the (padded) segment relative to f, in ms
+#voc_end: the end of the (padded) segment relative to f, in ms
 #export_folder: path to which the segment is exported to
 #using_raw_files: Boolean specifying whether f is an audio chunk file or a raw file
 
 #Outputs
-#orig_file_name: the name of the original .mp3 file fom the recorder
-#label_chunk_file: the name of the audio chunk file from which the segment is being cut (if using_raw_files this is the original file name)
-# start_rel_label_chunk: The start time of the segment relative to the label chunk file (label_chunk_file) in s
-# start_rel_label_chunk_hms: The start time of the segment relative to the label chunk file (label_chunk_file) in hours, minutes, and second format (HH_MM_SS.SS)
-# voc_start_rel_orig/1000: The start time of the segment relative to the original file (orig_file_name)
-# string_start_csv: A string with the start time of the segment relative to the original file (orig_file_name) in hours, minutes, and second format (HH_MM_SS.SS)
-# seg_duration: The duratino of the segment in s
-# export_name: The name of the exported segment
-
-def export_segment(f, voc_start, voc_duration, padding, export_folder, using_raw_files):
-    sound = AudioSegment.from_wav(f)
-    file_length = sound.duration_seconds  # the length of the label chunnk file, in seconds
-    voc_end=voc_start+voc_duration
-
-    ##Pad the segments, but make sure the results aren't out of bounds
-    # Start times relative to f
-    voc_start, voc_end = pad_segment(voc_start, voc_end, padding, file_length*1000)
-
+#f_orig: the name of the original recorder file, without the extension
+#voc_start_rel_orig: the start time of the segment relative to f_orig, in ms
+#string_start_csv: A string with the start time of the segment relative to the original file in hours, minutes, and second format (HH_MM_SS.SS)
+#export_name: the path the segment is exported to
+def segment_names(f, voc_start, voc_end, export_folder, using_raw_files):
     f_basename = os.path.basename(f)
 
     if using_raw_files:
@@ -82,10 +68,117 @@ def export_segment(f, voc_start, voc_duration, padding, export_folder, using_raw
     string_end = hms_string(voc_end_rel_orig/1000, include_sec_frac=True)
     file_extension = '/' + f_orig + '_' + string_start + '--' + string_end
 
+    export_name = export_folder + file_extension + '.wav'
+    return f_orig, voc_start_rel_orig, string_start_csv, export_name
+
+#This function finds the non-silent sections of an array of audio samples.  It is a vectorized version of pydub.silence.detect_nonsilent:
+#the same windows of min_silence_len ms (stepped by seek_step ms) are tested against the same RMS threshold, but the window energies come from
+#a running sum over the samples instead of a pure Python loop over AudioSegment slices, so the [start, end] pairs match pydub's
+
+#Inputs
+#y: array of integer samples, with shape (frames,) or (frames, channels)
+#sr: sampling rate of y
+#min_silence_len: the minimum length of a silent region (ms)
+#silence_thresh: audio that is quieter than this is considered silence (dBFS)
+#seek_step: step size between tested windows (ms)
+#sample_width: number of bytes per sample, used to find the maximum possible amplitude
+#block_frames: number of frames summed at a time, which bounds the memory used for long files
+
+#Returns
+#list of pairs [start, end] of non-silent segments in ms
+def detect_nonsilent_np(y, sr, min_silence_len=1000, silence_thresh=-16, seek_step=1, sample_width=2, block_frames=2**22):
+    if y.ndim == 1:
+        y = y[:, np.newaxis]
+    n_frames, channels = y.shape
+    seg_len = round(1000 * (n_frames / sr)) #Length in ms, computed the same way as len(AudioSegment)
+
+    if seg_len < min_silence_len:
+        return [[0, seg_len]]
+
+    #Running sum of the squared samples at every ms boundary; AudioSegment slicing maps a time in ms to int(ms*sr/1000) frames
+    bounds = np.minimum((np.arange(seg_len + 1) * (sr / 1000.0)).astype(np.int64), n_frames)
+    acc_dtype = np.int64 if (np.issubdtype(y.dtype, np.integer) and y.dtype.itemsize <= 2) else np.float64
+    prefix = np.zeros(seg_len + 1, dtype=acc_dtype)
+    total = 0
+    for block_start in range(0, n_frames, block_frames):
+        block = y[block_start:block_start + block_frames]
+        cs = np.cumsum(np.square(block, dtype=acc_dtype).sum(axis=1)) + total
+        lo = np.searchsorted(bounds, block_start, side='right')
+        hi = np.searchsorted(bounds, block_start + len(block), side='right')
+        prefix[lo:hi] = cs[bounds[lo:hi] - block_start - 1]
+        total = cs[-1]
+
+    #RMS of every min_silence_len window, truncated to an integer like audioop.rms
+    last_slice_start = seg_len - min_silence_len
+    slice_starts = np.arange(0, last_slice_start + 1, seek_step)
+    if last_slice_start % seek_step:
+        slice_starts = np.append(slice_starts, last_slice_start)
+    slice_ends = slice_starts + min_silence_len
+    energy = (prefix[slice_ends] - prefix[slice_starts]).astype(np.float64)
+    counts = (bounds[slice_ends] - bounds[slice_starts]) * channels
+    rms = np.floor(np.sqrt(np.divide(energy, counts, out=np.zeros_like(energy), where=counts > 0)))
+
+    thresh = (10 ** (silence_thresh / 20.0)) * (2 ** (sample_width * 8) / 2)
+    silence_starts = slice_starts[rms <= thresh]
+    if len(silence_starts) == 0:
+        return [[0, seg_len]]
+
+    #Merge silent windows into ranges; a new range starts where consecutive silent windows are neither continuous nor overlapping
+    gaps = np.diff(silence_starts)
+    breaks = np.nonzero((gaps != seek_step) & (gaps > min_silence_len))[0]
+    range_starts = np.concatenate(([silence_starts[0]], silence_starts[breaks + 1]))
+    range_ends = np.concatenate((silence_starts[breaks], [silence_starts[-1]])) + min_silence_len
+
+    if range_starts[0] == 0 and range_ends[0] == seg_len:
+        return []
+
+    #The non-silent ranges are the gaps between the silent ranges
+    nonsilent_starts = np.concatenate(([0], range_ends))
+    nonsilent_ends = np.concatenate((range_starts, [seg_len]))
+    if range_ends[-1] == seg_len:
+        nonsilent_starts = nonsilent_starts[:-1]
+        nonsilent_ends = nonsilent_ends[:-1]
+    splitdata = [[int(a), int(b)] for a, b in zip(nonsilent_starts, nonsilent_ends)]
+    if splitdata and splitdata[0] == [0, 0]:
+        splitdata.pop(0)
+    return splitdata
+
+#This function exports a single audio segment that meets the specified volume thresholds.
+
+#Inputs
+#f: the audio file that the segment is being extracted from
+#voc_start: the start of the segment relatie to f
+#voc_duration: the duration of the segment
+#padding: the amount of padding to add to the segment
+#export_folder: path to which the segment is exported to
+#using_raw_files: Boolean specifying whether f is an audio chunk file or a raw file
+#sound: the already loaded AudioSegment for f.  If None, f is loaded from disk
+
+#Outputs
+#orig_file_name: the name of the original .mp3 file fom the recorder
+#label_chunk_file: the name of the audio chunk file from which the segment is being cut (if using_raw_files this is the original file name)
+# start_rel_label_chunk: The start time of the segment relative to the label chunk file (label_chunk_file) in s
+# start_rel_label_chunk_hms: The start time of the segment relative to the label chunk file (label_chunk_file) in hours, minutes, and second format (HH_MM_SS.SS)
+# voc_start_rel_orig/1000: The start time of the segment relative to the original file (orig_file_name)
+# string_start_csv: A string with the start time of the segment relative to the original file (orig_file_name) in hours, minutes, and second format (HH_MM_SS.SS)
+# seg_duration: The duratino of the segment in s
+# export_name: The name of the exported segment
+
+def export_segment(f, voc_start, voc_duration, padding, export_folder, using_raw_files, sound=None):
+    if sound is None:
+        sound = AudioSegment.from_wav(f)
+    file_length = sound.duration_seconds  # the length of the label chunnk file, in seconds
+    voc_end=voc_start+voc_duration
+
+    ##Pad the segments, but make sure the results aren't out of bounds
+    # Start times relative to f
+    voc_start, voc_end = pad_segment(voc_start, voc_end, padding, file_length*1000)
+
+    f_orig, voc_start_rel_orig, string_start_csv, export_name = segment_names(f, voc_start, voc_end, export_folder, using_raw_files)
+
     if not(os.path.isdir(export_folder)):
        os.mkdir(export_folder)
 
-    export_name = export_folder + file_extension + '.wav'
     audio_chunk = sound[voc_start: voc_end]  # AudioSegment indexing is in ms
     audio_chunk.export(export_name, format='wav')
 
@@ -98,6 +191,66 @@ def export_segment(f, voc_start, voc_duration, padding, export_folder, using_raw
 
     return orig_file_name, label_chunk_file, start_rel_label_chunk, start_rel_label_chunk_hms, voc_start_rel_orig/1000, string_start_csv, seg_duration, export_name
 
+#This function exports all the audio segments found in one file from its already decoded samples, so the file is only read from disk once
+
+#Inputs
+#f: the audio file that the segments are being extracted from
+#y: array of samples of f, with shape (frames, channels)
+#sr: sampling rate of y
+#splitdata: list of pairs [start, end] of non-silent segments in ms, relative to f
+#padding: the amount of padding to add to each segment (ms)
+#export_folder: path to which the segments are exported to
+#using_raw_files: Boolean specifying whether f is an audio chunk file or a raw file
+
+#Returns
+#rows: one tuple per segment with the same fields (and order) as the values returned by export_segment
+def export_segments(f, y, sr, splitdata, padding, export_folder, using_raw_files):
+    file_length = len(y)/sr*1000  # the length of the label chunk file, in ms
+
+    if len(splitdata) > 0 and not(os.path.isdir(export_folder)):
+       os.mkdir(export_folder)
+
+    ##Pad the segments, but make sure the results aren't out of bounds
+    padded = [pad_segment(voc_start, voc_end, padding, file_length) for voc_start, voc_end in splitdata]
+    crops, sr = crop_audio_ms(y, sr, [a for a, b in padded], [b for a, b in padded]) #The same samples as sound[voc_start: voc_end] in export_segment
+
+    rows = []
+    for (voc_start, voc_end), crop in zip(padded, crops):
+        f_orig, voc_start_rel_orig, string_start_csv, export_name = segment_names(f, voc_start, voc_end, export_folder, using_raw_files)
+        soundfile.write(export_name, crop, sr, subtype='PCM_16')
+
+        rows.append((f_orig+'.mp3', f, voc_start/1000, hms_string(voc_start/1000, use_colon=True),
+                     voc_start_rel_orig/1000, string_start_csv, (voc_end-voc_start)/1000, export_name))
+    return rows
+
+#This function segments one audio file using the inputted thresholds and exports its segments.  It is called by segment_data
+
+#Inputs
+#f: path to the .wav file being segmented
+#min_silence_len: the minimum length between non-silent regions (ms)
+#silence_thresh: audio that is quieter than this is considered silence (dB)
+#final_padding: the amount to pad segments (ms)
+#export_folder: path to which the segments are exported to
+#using_raw_files: Boolean specifying whether f is an audio chunk file or a raw file
+#detector: 'pydub' or 'numpy' (see segment_data)
+
+#Returns
+#rows: segment information for the .csv file, as returned by export_segments
+def segment_file(f, min_silence_len, silence_thresh, final_padding, export_folder, using_raw_files, detector='pydub'):
+    #Decode the file once; the same samples are used for silence detection and for exporting every segment
+    y, sr = soundfile.read(f, dtype='int16', always_2d=True)
+
+    print("Segmenting by volume: ", f)
+    if detector == 'numpy':
+        splitdata = detect_nonsilent_np(y, sr, min_silence_len, silence_thresh)
+    else:
+        sound = AudioSegment(data=y.tobytes(), sample_width=2, frame_rate=sr, channels=y.shape[1])
+        splitdata = detect_nonsilent(sound, min_silence_len,
+                                     silence_thresh)  # list of pairs [start, end] of non-silent segments in ms
+    # must be silent for at least min_silence_length; silence is anything quieter than -20 dB
+
+    return export_segments(f, y, sr, splitdata, padding=final_padding, export_folder=export_folder, using_raw_files=using_raw_files)
+
 #This function segments the audio files in data_path using the inputted thresholds
 
 #Inputs
@@ -105,12 +258,17 @@ def export_segment(f, voc_start, voc_duration, padding, export_folder, using_raw
 #silence_thresh: audio that is quieter than this is considered silence (dB)
 #min silence length: the minimum length between non-silent regions (ms)
 #final padding: the amount to pad segments (ms)
+#detector: 'pydub' to find non-silent regions with pydub.silence.detect_nonsilent, or 'numpy' to use the vectorized detect_nonsilent_np
+#workers: number of processes to segment files with in parallel (1 processes the files serially)
 
 #Exports
 #Creates a folder called AudioChunksByLabel within data_path that contains short audio segments based on volume thresholds
 #Exports a directory of timing information for the extracted segments to the data_path folder called 'AudioSegments..."
 
-def segment_data(data_path, min_silence_len=150, silence_thresh=-50, final_padding = 50, token="Volume"):
+def segment_data(data_path, min_silence_len=150, silence_thresh=-50, final_padding = 50, token="Volume", detector='pydub', workers=1):
+    if detector not in ('pydub', 'numpy'):
+        raise ValueError("detector must be 'pydub' or 'numpy'")
+
     path_to_chunks = data_path + "/AudioChunksByLabel" #location of the audio data trimmed to include only labeled areas
 
     if not (os.path.isdir(path_to_chunks)): #If the chunks have not been created, use the original files
@@ -119,60 +277,33 @@ def segment_data(data_path, min_silence_len=150, silence_thresh=-50, final_paddi
     else:
         using_raw_files = False
 
-    ##Initialize lists to store segment information to export to a .csv file
-    orig_file_list = []
-    label_chunk_list = []
-    start_rel_label_chunk_list = []
-    start_rel_label_chunk_hms_list = []
-    start_rel_orig_file_list=[]
-    start_rel_orig_file_hms_list = []
-    vol_seg_duration_list = []
-    segment_path_list= []
+    ##Rows of segment information to export to a .csv file
+    rows = []
 
+    #If using the original files, they will be converted to .wav first (in parallel); files that have already been converted are skipped
+    convert_folder_to_wav(path_to_chunks, ('.mp3',), workers=workers)
     files = []
     for filename in os.listdir(path_to_chunks):
         if filename.endswith(".wav"):
             files.append(os.path.join(path_to_chunks, filename))
-        if filename.endswith(".mp3") and not(os.path.exists(os.path.splitext(os.path.join(path_to_chunks, filename))[0]+'.wav')): #If using the original files, they will be converted to mp3 first; check to make sure it hasn't already been converted first
-            wav_path = convert_wav(os.path.join(path_to_chunks, filename))
-            files.append(wav_path)
     print("found %d .wav files in %s" % (len(files), path_to_chunks))
 
-    for j, f in enumerate(files):
-        f_basename = os.path.basename(f)
-
-        sound=AudioSegment.from_wav(f)
-        file_length = sound.duration_seconds
-
-        print("Segmenting by volume: ", f)
-        splitdata = detect_nonsilent(sound, min_silence_len,
-                                     silence_thresh)  # list of pairs [start, end] of non-silent segments in ms
-        # must be silent for at least min_silence_length; silence is anything quieter than -20 dB
-
-        for vol_chunk in splitdata:
-            start_time = vol_chunk[0]  # pad the start time by 500 ms
-            end_time = vol_chunk[1]  # pad the end time by 500 ms
-            duration = end_time-start_time
-
-            orig_file_name, label_chunk_file, start_rel_label_chunk, start_rel_label_chunk_hms, start_rel_orig_file, start_rel_orig_file_hms, seg_duration, export_name = export_segment(f, start_time, duration, padding=final_padding, export_folder = data_path+"/AudioSegments_"+token, using_raw_files = using_raw_files)
-
-            orig_file_list.append(orig_file_name)
-            label_chunk_list.append(f)
-            start_rel_label_chunk_list.append(start_rel_label_chunk)
-            start_rel_label_chunk_hms_list.append(start_rel_label_chunk_hms)
-            start_rel_orig_file_list.append(start_rel_orig_file)
-            start_rel_orig_file_hms_list.append(start_rel_orig_file_hms)
-            vol_seg_duration_list.append(seg_duration)
-            segment_path_list.append(export_name)
-
-    data = {'Recorder file': orig_file_list, 'Segment path': segment_path_list,
-            'Label chunk file': label_chunk_list,
-            'Start relative recorder (hh:mm:ss)': start_rel_orig_file_hms_list,
-            'Start relative recorder (s)': start_rel_orig_file_list,
-            'Segment duration': vol_seg_duration_list,
-            'Start relative label chunk file (hh:mm:ss)': start_rel_label_chunk_hms_list,
-            'Start relative label chunk file (s)': start_rel_label_chunk_list}
-    df = pd.DataFrame(data)
+    files.sort() #Process (and merge the results of) the files in a stable order
+    export_folder = data_path+"/AudioSegments_"+token
+    if not(os.path.isdir(export_folder)):
+        os.mkdir(export_folder)
+
+    for file_rows in map_over_files(segment_file, files, workers=workers, min_silence_len=min_silence_len, silence_thresh=silence_thresh,
+                                    final_padding=final_padding, export_folder=export_folder, using_raw_files=using_raw_files, detector=detector):
+        rows.extend(file_rows)
+
+    df = pd.DataFrame(rows, columns=['Recorder file', 'Label chunk file',
+                                     'Start relative label chunk file (s)', 'Start relative label chunk file (hh:mm:ss)',
+                                     'Start relative recorder (s)', 'Start relative recorder (hh:mm:ss)',
+                                     'Segment duration', 'Segment path'])
+    df = df[['Recorder file', 'Segment path', 'Label chunk file',
+             'Start relative recorder (hh:mm:ss)', 'Start relative recorder (s)', 'Segment duration',
+             'Start relative label chunk file (hh:mm:ss)', 'Start relative label chunk file (s)']]
 
     try:
         df_filename = data_path + '/AudioSegments_' + token + '_' + os.path.split(data_path)[1] + '.csv'
@@ -9,65 +9,177 @@ Created on Thu Sep 10 14:51:24 2020
 
 import pandas as pd
 from datetime import datetime, timedelta
-from mutagen.mp3 import MP3
 from pytz import timezone as timezonepytz
 from preprocessing_general import *
+from preprocessing.file_index import *
+
+max_time_between_labels = 100 #in s #Labels closer together than this (end of one label to the start of the next) are exported in the same chunk
+num_padding_seconds = 20 #Pad the specified chunks by this amount (s) to make sure we are getting the sounds of interest
+max_chunk_length = None #in s #If set, longer chunks are split between labels (a single label longer than this still stays in one chunk)
+note_duration = 5 #in s #Duration used for labels without an end time (e.g. a note added in the app)
 
 #This function finds groups of labels that occur in 'chunks' (i.e., are closely spaced together) in order to extract shorter audio segments
-##that enclode all the labels from the longer audio file
-
-#Input todays_data: pandas Dataframe with the labels from the selected day
-#Returns chunkDF: pandas Dataframe with timings for audio chunks that encompass all the labels
-def find_label_chunks(todays_data):
-    #to minimize processing time, we will only look at segments of the audio near labels
-    #Define audio chunks that have labels in them
-    todays_data['Next Label Time'] = todays_data['Event Created Time'].shift(-1)
-    todays_data['Time Between Labels'] = todays_data['Next Label Time']- todays_data['Event Created Time'] #Find the time delay between consecutive labels so we don't have to look at the whole file
-    todays_data_indices = list(todays_data.index)
-    todays_data_indices.sort() #Makes sure the indices are in numerical order
-    
-    todays_data.at[todays_data_indices[-1],'Time Between Labels'] = timedelta(0) #Convert the last number in the Time Between Labels Column to a 0
-    todays_data['Time Between Labels (s)']=todays_data['Time Between Labels'].apply(seconds)
+##that enclose all the labels from the longer audio file
+#Each label covers the interval from its creation time to its end time.  The intervals are sorted and merged in one pass, so the chunks never overlap
+#and no audio is decoded or written twice
 
-    max_time_between_labels = 100 #in s #Create a new group if labels are this many seconds apart or more
-    
+#Inputs
+#todays_data: pandas Dataframe with the labels from the selected day
+#gap: labels are merged into the same chunk if the next label starts less than this many seconds after every earlier label has ended
+#padding: seconds added before the start and after the end of each chunk.  Chunks whose padding would overlap are merged
+#max_chunk_length: if not None, chunks longer than this many seconds are split between labels
 
-    chunks_near_labels_df = todays_data.loc[todays_data['Time Between Labels (s)'] > max_time_between_labels] #Look for transition points that meet the new chunk criteria
-    
-    #Create a list of the end and start times for the chunks, based on the max time between labels (later shifting will make this work)
-    chunks = list(chunks_near_labels_df.index)
-    chunks_end = list(chunks_near_labels_df['Event End']) #These times correspond to when a chunk should end 
-    chunks_start = list(chunks_near_labels_df['Next Label Time']) #These times correspond to when a chunk should start
-    
-    corresponding_starts = list(chunks_near_labels_df['Event Created Time'])
-    
-    for i in range(len(chunks_end)): #Set the duration for a note added to the app as 5s
-        if pd.isna(chunks_end[i]): #if the participant added a note, the end time will appear as nan
-            chunks_end[i] = corresponding_starts[i] + timedelta(seconds=5)
-    
-    
-    num_padding_seconds = 20 #Pad the specified chunks by this amount (s) to make sure we are getting the sounds of interest
-    K=timedelta(seconds=num_padding_seconds)
-    
-    first_chunk_start_df = todays_data.loc[ [todays_data_indices[0]] , : ] #The first chunk should always start the defined delta away from the last label
-    first_chunk_start = list(first_chunk_start_df['Event Created Time'])
-    first_chunk_start[0]=first_chunk_start[0]-2*K
-    
-    last_chunk_end_df=todays_data.loc[ [todays_data_indices[-1]] , : ] #The last chunk should end the defined delta away from the last label
-    last_chunk_end = list(last_chunk_end_df['Event End'])
-    last_chunk_end[0]=last_chunk_end[0]+2*K
-    
-    chunks_end = [x + K for x in chunks_end] #Add the time delta on the end time
-    chunks_start = [x - K for x in chunks_start] #Subtract the time delta from the start time
-    
-    chunks_start.insert(0, first_chunk_start[0])
-    chunks_end.insert(len(chunks_end), last_chunk_end[0])
-    
-    chunk_data = {'Chunk Start':chunks_start,'Chunk End': chunks_end}
+#Returns
+#chunkDF: pandas Dataframe with timings for audio chunks that encompass all the labels
+def find_label_chunks(todays_data, gap=max_time_between_labels, padding=num_padding_seconds, max_chunk_length=max_chunk_length):
+    created = pd.to_datetime(todays_data['Event Created Time'], utc=True).astype('datetime64[ns, UTC]')
+    ends = pd.to_datetime(todays_data['Event End'], utc=True).astype('datetime64[ns, UTC]')
+    created_ns = created.array.asi8
+    end_ns = np.where(ends.isna(), created_ns + note_duration*10**9, ends.array.asi8) #if the participant added a note, the end time will appear as nan
+    end_ns = np.maximum(end_ns, created_ns)
+
+    order = np.argsort(created_ns, kind='stable')
+    created_ns, end_ns = created_ns[order], end_ns[order]
+    padding_ns = int(round(padding*1e9))
+    merge_ns = max(int(round(gap*1e9)), 2*padding_ns) #labels closer than twice the padding would give overlapping chunks
+
+    #A new chunk starts wherever a label starts more than merge_ns after the latest end of all the labels before it
+    latest_end = np.maximum.accumulate(end_ns)
+    new_chunk = np.ones(len(created_ns), dtype=bool)
+    new_chunk[1:] = created_ns[1:] - latest_end[:-1] > merge_ns
+    first = np.flatnonzero(new_chunk)
+    last = np.append(first[1:], len(created_ns))[:len(first)] - 1
+    chunks_start = created_ns[first] - padding_ns
+    chunks_end = latest_end[last] + padding_ns
+
+    if max_chunk_length is not None:
+        chunks_start, chunks_end = split_long_chunks(created_ns, latest_end, first, last, chunks_start, chunks_end, padding_ns,
+                                                     int(round(max_chunk_length*1e9)))
+
+    chunk_data = {'Chunk Start': pd.to_datetime(chunks_start, utc=True), 'Chunk End': pd.to_datetime(chunks_end, utc=True)}
     chunkDF = pd.DataFrame(chunk_data)
-    
+
     return chunkDF #Dataframe with start and end times for the chunks
 
+#This function splits the chunks that are longer than max_length_ns between labels.  It is called by find_label_chunks
+#A new piece is started at a label once the current piece would grow longer than max_length_ns.  Each piece starts no earlier than the end of the piece before it,
+#so the pieces don't overlap, and pieces that would be empty are never emitted
+
+#Inputs
+#created_ns, latest_end: label start times and running maximum of the label end times (sorted by start, int64 ns)
+#first, last: index of the first and last label of each chunk
+#chunks_start, chunks_end: padded chunk times (int64 ns)
+#padding_ns: the padding added to the chunks (ns)
+#max_length_ns: maximum chunk length (ns)
+
+#Returns
+#chunks_start, chunks_end: the chunk times after splitting (int64 ns)
+def split_long_chunks(created_ns, latest_end, first, last, chunks_start, chunks_end, padding_ns, max_length_ns):
+    split_start = []
+    split_end = []
+    for i in range(len(first)):
+        if chunks_end[i] - chunks_start[i] <= max_length_ns:
+            split_start.append(chunks_start[i])
+            split_end.append(chunks_end[i])
+            continue
+        piece_start = chunks_start[i]
+        for j in range(first[i] + 1, last[i] + 1):
+            piece_end = latest_end[j-1] + padding_ns
+            #Labels nested in an earlier label don't move the latest end, so splitting before them would give an empty piece
+            if piece_end > piece_start and latest_end[j] + padding_ns - piece_start > max_length_ns:
+                split_start.append(piece_start)
+                split_end.append(piece_end)
+                piece_start = max(created_ns[j] - padding_ns, piece_end)
+        if chunks_end[i] > piece_start:
+            split_start.append(piece_start)
+            split_end.append(chunks_end[i])
+    return np.array(split_start, dtype=np.int64), np.array(split_end, dtype=np.int64)
+
+#This function converts a list or column of times to int64 ns since the epoch (UTC)
+def times_to_ns(times):
+    return pd.Series(pd.to_datetime(times, utc=True)).astype('datetime64[ns, UTC]').array.asi8
+
+#This function finds every (file, chunk) pair where the chunk overlaps the file, for any number of files and chunks at once, and clips each chunk to the file
+#The chunks are sorted by start time, so only the chunks between two binary searches are compared with each file
+
+#Inputs
+#file_start_ns, file_end_ns: arrays of file start and end times (int64 ns since the epoch)
+#chunk_start_ns, chunk_end_ns: arrays of chunk start and end times (int64 ns since the epoch)
+
+#Returns
+#file_index, chunk_index: arrays with the positions of the file and the chunk for each pair, sorted by file then chunk
+#start_ns, end_ns: the part of the chunk that falls within the file (int64 ns since the epoch)
+def chunk_file_pairs(file_start_ns, file_end_ns, chunk_start_ns, chunk_end_ns):
+    file_start_ns = np.asarray(file_start_ns, dtype=np.int64)
+    file_end_ns = np.asarray(file_end_ns, dtype=np.int64)
+    chunk_start_ns = np.asarray(chunk_start_ns, dtype=np.int64)
+    chunk_end_ns = np.asarray(chunk_end_ns, dtype=np.int64)
+
+    order = np.argsort(chunk_start_ns, kind='stable')
+    sorted_starts = chunk_start_ns[order]
+    latest_end = np.maximum.accumulate(chunk_end_ns[order]) if len(order) > 0 else chunk_end_ns
+
+    #Chunks that start before the file ends, and aren't among the leading chunks that all end before the file starts
+    lo = np.searchsorted(latest_end, file_start_ns, side='right')
+    hi = np.searchsorted(sorted_starts, file_end_ns, side='left')
+    counts = np.maximum(hi - lo, 0)
+    file_index = np.repeat(np.arange(len(file_start_ns)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    chunk_index = order[np.repeat(lo, counts) + offsets]
+
+    keep = (chunk_start_ns[chunk_index] < file_end_ns[file_index]) & (chunk_end_ns[chunk_index] > file_start_ns[file_index])
+    file_index, chunk_index = file_index[keep], chunk_index[keep]
+    pair_order = np.lexsort((chunk_index, file_index))
+    file_index, chunk_index = file_index[pair_order], chunk_index[pair_order]
+
+    #If only part of the chunk is in the file, adjust the chunk start and end time to stay within the file bounds
+    start_ns = np.clip(chunk_start_ns[chunk_index], file_start_ns[file_index], file_end_ns[file_index])
+    end_ns = np.clip(chunk_end_ns[chunk_index], file_start_ns[file_index], file_end_ns[file_index])
+    return file_index, chunk_index, start_ns, end_ns
+
+#This function lists the chunks that fall within each recorder file of a folder (or several folders, if their file indexes are combined)
+
+#Inputs
+#chunkDF: pandas dataframe returned by find_label_chunks
+#recorder_index: file index from load_file_index
+#utc_offset: time offset between the recorder clock and UTC (labels are timestamped in UTC) in hours
+#drift: manually calculated recorder clock drift (s)
+
+#Returns
+#chunk_table: dataframe with one row per (file, chunk) pair: the file name, the chunk's row in chunkDF, the UTC start and end of the part of the chunk in the file,
+#and the same times relative to the file start in s
+def chunk_assignment_table(chunkDF, recorder_index, utc_offset, drift=0):
+    names = sorted(recorder_index)
+    file_times = [file_start_end_times(recorder_index[name], utc_offset, drift) for name in names]
+    file_start_ns = times_to_ns([start for start, end in file_times])
+    file_end_ns = times_to_ns([end for start, end in file_times])
+
+    file_index, chunk_index, start_ns, end_ns = chunk_file_pairs(file_start_ns, file_end_ns, times_to_ns(chunkDF['Chunk Start']),
+                                                                 times_to_ns(chunkDF['Chunk End']))
+    chunk_data = {'Recorder file': [names[i] for i in file_index], 'Chunk': chunkDF.index[chunk_index],
+                  'Chunk Start': pd.to_datetime(start_ns, utc=True), 'Chunk End': pd.to_datetime(end_ns, utc=True),
+                  'Start relative recorder (s)': (start_ns - file_start_ns[file_index])/1e9,
+                  'End relative recorder (s)': (end_ns - file_start_ns[file_index])/1e9}
+    return pd.DataFrame(chunk_data)
+
+#This function compares the amount of audio that the chunks will decode with the total length of the recordings
+#Use it to tune the chunk gap and padding: larger values decode more audio, smaller values risk cutting off sounds near the labels
+
+#Inputs
+#chunkDF: pandas dataframe returned by find_label_chunks
+#recorder_index: the folder's file index from load_file_index
+#utc_offset: time offset between the recorder clock and UTC (labels are timestamped in UTC) in hours
+#drift: manually calculated recorder clock drift (s)
+
+#Returns
+#decoded_seconds: seconds of audio inside the chunks that fall within the recordings
+#recorded_seconds: total length of the recordings in s
+def chunk_coverage(chunkDF, recorder_index, utc_offset, drift=0):
+    chunk_table = chunk_assignment_table(chunkDF, recorder_index, utc_offset, drift)
+    decoded_seconds = (chunk_table['End relative recorder (s)'] - chunk_table['Start relative recorder (s)']).sum()
+    recorded_seconds = sum(entry['duration'] for entry in recorder_index.values())
+    return decoded_seconds, recorded_seconds
+
 #Inputs
 #file_start_time start time of recorder file
 #file_end_time end time of recorder file
@@ -79,41 +191,70 @@ def find_label_chunks(todays_data):
 #f_chunks_end Listof chunk end times that occur within the file, relative to the file end time
 
 #Given an audio file beginning at file_start_time and file_end_time, and chunk information, this function returns the chunks that fall within the specified event
+#Chunks that only partly overlap the file are clipped to the file, including chunks that start before the file and end after it
 def get_corresponding_chunks(file_start_time, file_end_time, chunks_start, chunks_end): #Given a list of targeted label-focused chunks, this function finds the chunks in corresponding to an event beginning at f_start_time and ending at f_end_time
-    #These lists will become lists of only the label-defined chunks that go with the given audio file
-    
-    f_chunks_start = np.array(chunks_start) 
-    f_chunks_end = np.array(chunks_end)
+    file_index, chunk_index, start_ns, end_ns = chunk_file_pairs(times_to_ns([file_start_time]), times_to_ns([file_end_time]),
+                                                                 times_to_ns(chunks_start), times_to_ns(chunks_end))
+    return pd.to_datetime(start_ns, utc=True), pd.to_datetime(end_ns, utc=True)
 
-    #Define boolean masks based on the chunk start and end time
 
-    #Check if the chunk started within the given file            
-    start_and_start = f_chunks_start > file_start_time #The chunk starts after the file starts
-    start_and_end = f_chunks_start < file_end_time #The chunk starts before the file ends
-    chunk_start_in_file = [a and b for a,b in zip(start_and_start, start_and_end)]
+#This exports the audio chunks that fall within one recorder file as .wav files.  It is called by convert_chunks_to_wav
+#Inputs
+#f: path to the recorder file
+#chunks_start: list of chunk start times in UTC
+#chunks_end: list of chunk end times in UTC
+#data_path: path to the folder containing the full audio files
+#utc_offset: time offset between the recorder clock and UTC (labels are timestamped in UTC) in hours
+#drift: manually calculated recorder clock drift (s)
+#streaming: if True, each chunk is read by seeking into the recorder file and decoding only the chunk's frames, so a full recording is never held in memory
+#recorder_index: the folder's file index from load_file_index, used for the file start time and length (loaded here if not given)
+
+#Returns
+#chunk_offset_dict: start time of each exported chunk relative to f, in s
+#chunk_duration_dict: duration of each exported chunk, in s
+def export_file_chunks(f, chunks_start, chunks_end, data_path, utc_offset, drift, streaming=False, recorder_index=None):
+    chunk_offset_dict = {}
+    chunk_duration_dict = {}
+
+    if recorder_index is None:
+        recorder_index = load_file_index(data_path, ('.mp3',))
+    file_start_time, file_end_time = file_start_end_times(recorder_index[os.path.basename(f)], utc_offset, drift)
+
+    f_chunks_start, f_chunks_end = get_corresponding_chunks(file_start_time, file_end_time, chunks_start, chunks_end)
+
+    if len(f_chunks_start) == 0: #No chunks fall in this file, so there is no need to decode it
+        return chunk_offset_dict, chunk_duration_dict
 
-    #Check if the chunk ends within the given file
-    end_and_start = f_chunks_end > file_start_time #The chunk ends after the file starts
-    end_and_end = f_chunks_end < file_end_time #The chunk ends before the file ends
-    chunk_end_in_file = [a and b for a,b in zip(end_and_start, end_and_end)] 
+    #Start and end times of the chunks relative to the file, in s
+    f_chunks_starts_sec = (f_chunks_start-file_start_time).total_seconds().tolist()
+    f_chunks_ends_sec = (f_chunks_end-file_start_time).total_seconds().tolist()
 
-    chunk_part_in_file = np.array([a or b for a,b in zip(chunk_start_in_file, chunk_end_in_file)])
-    chunk_full_in_file = np.array([a and b for a,b in zip(chunk_start_in_file, chunk_end_in_file)])
-    no_chunk_here = np.array([not(a) and not(b) for a,b, in zip(chunk_part_in_file, chunk_full_in_file)])
+    #Decode the recorder file once and cut every chunk that falls inside it from the same array
+    #In streaming mode, only the frames of each chunk are decoded instead
+    print("Exporting audio chunks around data labels for", f)
+    if not streaming:
+        y, sr = librosa.load(f, sr = 44100)
+        chunks, sr = crop_audio_many(y, sr, f_chunks_starts_sec, f_chunks_ends_sec)
+    fname = os.path.basename(f)
+    for i, (this_chunk_starts, this_chunk_ends) in enumerate(zip(f_chunks_starts_sec, f_chunks_ends_sec)):
+        string_start = hms_string(this_chunk_starts, include_sec_frac=True)
+        string_end = hms_string(this_chunk_ends, include_sec_frac=True)
 
-    #If the chunk was partially in the file, adjust the chunk start and end time to stay within the file bounds
-    for i, (s, e) in enumerate(zip(f_chunks_start, f_chunks_end)): #Define appropraite start and end times if only part of the chunk is in the file
-        if (not(chunk_full_in_file[i]) and chunk_start_in_file[i]):
-            f_chunks_end[i] = pd.Timestamp(datetime.timestamp(file_end_time), unit='s', tz='UTC')
-        elif (not(chunk_full_in_file[i]) and chunk_end_in_file[i]):
-            f_chunks_start[i]=pd.Timestamp(datetime.timestamp(file_start_time), unit='s', tz='UTC')
+        file_extension = string_start + '--' + string_end
+        export_path = data_path + "/AudioChunksByLabel/" + fname[:-4] + '_'+file_extension + '.wav'
+        print(export_path)
 
-    not_in_file = np.where(no_chunk_here == True)[0]
-    f_chunks_start = np.delete(f_chunks_start, not_in_file)
-    f_chunks_end = np.delete(f_chunks_end, not_in_file)
-                        
-    return f_chunks_start, f_chunks_end
+        if streaming:
+            chunk, sr = load_audio_section(f, this_chunk_starts, this_chunk_ends, sr=44100)
+        else:
+            chunk = chunks[i]
+        soundfile.write(export_path, chunk, sr)
 
+        #Add the offset and duration values to the corresponding dictionaries, in seconds
+        chunk_offset_dict[export_path[:-4]] = this_chunk_starts #Store the start time of the chunk relative to the file time
+        chunk_duration_dict[export_path[:-4]] = (this_chunk_ends)-(this_chunk_starts) #Store the chunk duration
+
+    return chunk_offset_dict, chunk_duration_dict
 
 #This exports the audio segments that contain the labels (from within a larger recording file) as .wav files
 #Inputs
@@ -121,6 +262,8 @@ def get_corresponding_chunks(file_start_time, file_end_time, chunks_start, chunk
 #data_path: path to the folder containing the full audio files
 #utc_offset: time offset between the recorder clock and UTC (labels are timestamped in UTC) in hours
 #drift: manually calculated recorder clock drift (s)
+#streaming: if True, each chunk is read by seeking into the recorder file and decoding only the chunk's frames, so a full recording is never held in memory
+#workers: number of processes to export files with in parallel (1 processes the files serially)
 
 #Returns
 #chunk_offset_dict
@@ -130,64 +273,34 @@ def get_corresponding_chunks(file_start_time, file_end_time, chunks_start, chunk
 #.wav files that have the sub-chunks of audio segments that contain all the labels present in all the recording files in data_path
 #Thes files are exported to a subdirectory of data_path called "AudioChunsksByLabel".
 
-def convert_chunks_to_wav(chunkDF, data_path, utc_offset, drift):
+def convert_chunks_to_wav(chunkDF, data_path, utc_offset, drift, streaming=False, workers=1):
 
-    files = []
-    for filename in os.listdir(data_path):
-        if filename.endswith(".mp3"): #The vidoes that have been rotated have the file extension c
-            files.append(os.path.join(data_path, filename))
+    #The start times and lengths of the files come from the folder's file index, so the files are only opened to decode the chunks
+    recorder_index = load_file_index(data_path, ('.mp3',))
+    files = [os.path.join(data_path, filename) for filename in recorder_index]
+    files.sort() #Process (and merge the results of) the files in a stable order
     print("found %d .mp3 files in %s"%(len(files),data_path))
+    decoded_seconds, recorded_seconds = chunk_coverage(chunkDF, recorder_index, utc_offset, drift)
+    print("%d chunks cover %.0f s of %.0f s recorded (%.1f%%)"%(len(chunkDF), decoded_seconds, recorded_seconds,
+                                                              100*decoded_seconds/recorded_seconds if recorded_seconds > 0 else 0))
     
     chunks_start = list(chunkDF['Chunk Start'])  
     chunks_end = list(chunkDF['Chunk End'])
     
+    #Create the AudioChunksByLabel directory if it doesn't exist
+    if not(os.path.isdir(data_path+"/AudioChunksByLabel")):
+        os.mkdir(data_path+"/AudioChunksByLabel")
+
     chunk_offset_dict = {} #Will be used to relate the start times of identified vocalization segments from label chunks to the file start time
     chunk_duration_dict = {}
-    
-    for j,f in enumerate(files): #For each audio file in the directory, calculate which chunks started and ended in the file and export
-        mod_time=os.path.getmtime(f)
-        audio = MP3(f)
-        
-        ##Convert the recorder time stamp to UTC, using information in the participant database
-        utc_offset_seconds = utc_offset*3600+drift #convert utc_offset (given in hours, to seconds)
-        seg_start = mod_time - utc_offset_seconds
-  
-        seg_start=datetime.fromtimestamp(seg_start)
-        file_start_time= seg_start.replace(tzinfo=timezonepytz('UTC'))
-        file_end_time = file_start_time+timedelta(seconds=audio.info.length)
-        
-        f_chunks_start, f_chunks_end = get_corresponding_chunks(file_start_time, file_end_time, chunks_start, chunks_end)    
-        f_chunks_duration = [a_i - b_i for a_i, b_i in zip(f_chunks_end, f_chunks_start)]
-
-        #Create the AudioChunksByLabel directory if it doesn't exist
-        if not(os.path.isdir(data_path+"/AudioChunksByLabel")):
-            os.mkdir(data_path+"/AudioChunksByLabel")
-        
-        #Export the defined audio chunks from the file
-        print("Exporting audio chunks around data labels for", f)
-        for i, (chunk_start, chunk_end) in enumerate(zip(f_chunks_start, f_chunks_end)):
-            fname = os.path.basename(f)
-
-            #Start and end times of chun relative to file
-            #Start and end itme in seconds
-            this_chunk_starts = (timedelta.total_seconds(chunk_start-file_start_time)) #chunk start time relative to file, in ms
-            this_chunk_ends = (timedelta.total_seconds(chunk_end-file_start_time)) #chunk end time relative to file, in ms
-
-            string_start = hms_string(this_chunk_starts, include_sec_frac=True)
-            string_end = hms_string(this_chunk_ends, include_sec_frac=True)
-
-            file_extension = string_start + '--' + string_end
-            export_path = data_path + "/AudioChunksByLabel/" + fname[:-4] + '_'+file_extension + '.wav'
-            print(export_path)
-
-            y, sr = librosa.load(f, sr = 44100)
-            chunk, sr = crop_audio(y, sr, this_chunk_starts, this_chunk_ends)
-            soundfile.write(export_path, chunk, sr)
-            
-            #Add the offset and duration values to the corresponding dictionaries, in seconds
-            chunk_offset_dict[export_path[:-4]] = this_chunk_starts #Store the start time of the chunk relative to the file time
-            chunk_duration_dict[export_path[:-4]] = (this_chunk_ends)-(this_chunk_starts) #Store the chunk duration
-            
+
+    #For each audio file in the directory, calculate which chunks started and ended in the file and export
+    results = map_over_files(export_file_chunks, files, workers=workers, chunks_start=chunks_start, chunks_end=chunks_end,
+                             data_path=data_path, utc_offset=utc_offset, drift=drift, streaming=streaming, recorder_index=recorder_index)
+    for f_offset_dict, f_duration_dict in results:
+        chunk_offset_dict.update(f_offset_dict)
+        chunk_duration_dict.update(f_duration_dict)
+
     return chunk_offset_dict, chunk_duration_dict
 
 #Find sub-sections of long audio recordings that contain labels and export them.  Calls the other subfunctions in this package in sequence.
@@ -198,6 +311,9 @@ def convert_chunks_to_wav(chunkDF, data_path, utc_offset, drift):
 #data_path: path to the folder containing the full audio files
 #utc_offset: time offset between the recorder clock and UTC (labels are timestamped in UTC) in hours
 #drift: manually calculated recorder clock drift (s)
+#streaming: if True, read only the frames of each chunk from the recorder files (see convert_chunks_to_wav)
+#workers: number of processes to export files with in parallel
+#gap, padding, max_chunk_length: how labels are grouped into chunks (see find_label_chunks)
 
 #Returns
 #chunk_offset_dict
@@ -207,7 +323,8 @@ def convert_chunks_to_wav(chunkDF, data_path, utc_offset, drift):
 #.wav files that have the sub-chunks of audio segments that contain all the labels present in all the recording files in data_path
 #Thes files are exported to a subdirectory of data_path called "AudioChunsksByLabel".
 
-def get_chunks(todays_data, data_path, utc_offset, drift):
-    chunkDF = find_label_chunks(todays_data)
-    chunk_offset_dict, chunk_duration_dict= convert_chunks_to_wav(chunkDF, data_path, utc_offset, drift)
+def get_chunks(todays_data, data_path, utc_offset, drift, streaming=False, workers=1, gap=max_time_between_labels, padding=num_padding_seconds,
+               max_chunk_length=max_chunk_length):
+    chunkDF = find_label_chunks(todays_data, gap=gap, padding=padding, max_chunk_length=max_chunk_length)
+    chunk_offset_dict, chunk_duration_dict= convert_chunks_to_wav(chunkDF, data_path, utc_offset, drift, streaming=streaming, workers=workers)
     return chunkDF, chunk_offset_dict
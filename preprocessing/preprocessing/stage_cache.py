@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Records which pipeline stages have already been run on a data folder, so that run_preprocessing can skip the stages
+whose inputs and parameters have not changed since their last run.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+cache_file_name = '.stage_cache.json' #Stored in the data folder being processed
+
+#This function reads the stage cache for a data folder
+
+#Inputs
+#data_path: path to the folder containing the data being processed
+
+#Returns
+#cache: dictionary mapping each stage name to the key it was last completed with (empty if the folder has not been processed)
+def load_stage_cache(data_path):
+    cache_path = os.path.join(data_path, cache_file_name)
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        print('Ignoring unreadable stage cache', cache_path)
+        return {}
+
+#This function writes the stage cache for a data folder
+def save_stage_cache(data_path, cache):
+    cache_path = os.path.join(data_path, cache_file_name)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, cache_path) #Replace in one step so an interrupted write can't leave a partial cache
+
+#This function writes every number in a key part as a float, so a parameter gives the same key whether it was given as an int or a float
+#(e.g. the default silence_thresh of -24 and --silence-thresh -24, which argparse reads as -24.0).  Booleans are left as they are, and so are
+#integers too large to be held exactly by a float (e.g. modification times in ns in the file fingerprints)
+def normalize_key_part(part):
+    if isinstance(part, dict):
+        return {key: normalize_key_part(value) for key, value in part.items()}
+    if isinstance(part, (list, tuple)):
+        return [normalize_key_part(value) for value in part]
+    if isinstance(part, (bool, np.bool_)):
+        return bool(part)
+    if isinstance(part, (int, np.integer)) and abs(int(part)) <= 2**53:
+        return float(part)
+    if isinstance(part, np.floating):
+        return float(part)
+    return part
+
+#This function combines everything a stage depends on (input fingerprints, upstream stage keys, and parameters) into a single key
+
+#Inputs
+#parts: any values that can be written as JSON (numbers, strings, lists, dictionaries)
+
+#Returns
+#A hex digest that changes whenever any of the parts change (but not when a number only changes type, see normalize_key_part)
+def stage_key(*parts):
+    text = json.dumps(normalize_key_part(parts), sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+#This function fingerprints a file
+
+#Inputs
+#path: path to the file
+#hash_contents: if True, the fingerprint includes a hash of the file contents; otherwise the size and modification time are used, which is much cheaper for long recordings
+
+#Returns
+#A list that changes when the file changes
+def file_fingerprint(path, hash_contents=False):
+    stat = os.stat(path)
+    if hash_contents:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return [os.path.basename(path), stat.st_size, digest.hexdigest()]
+    return [os.path.basename(path), stat.st_size, stat.st_mtime_ns]
+
+#This function fingerprints the files with the given extensions in a folder (not including subfolders)
+
+#Inputs
+#folder: path to the folder
+#extensions: tuple of file extensions to include, e.g. ('.mp3',)
+#hash_contents: see file_fingerprint
+
+#Returns
+#A list of file fingerprints, sorted by file name (empty if the folder does not exist)
+def folder_fingerprint(folder, extensions, hash_contents=False):
+    if not os.path.isdir(folder):
+        return []
+    names = sorted(name for name in os.listdir(folder) if name.endswith(extensions))
+    return [file_fingerprint(os.path.join(folder, name), hash_contents) for name in names]
+
+#This function fingerprints the contents of a dataframe (for example the labels of one participant)
+def dataframe_fingerprint(df):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(c) for c in df.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+#This function checks whether a stage can be skipped
+
+#Inputs
+#cache: the dictionary returned by load_stage_cache
+#stage: name of the stage
+#key: the key for the stage's current inputs and parameters, from stage_key
+#outputs: list of paths the stage produces
+
+#Returns
+#True if the stage last completed with the same key and all of its outputs still exist
+def stage_is_current(cache, stage, key, outputs):
+    return cache.get(stage) == key and all(os.path.exists(path) for path in outputs)
+
+#This function marks a stage as started.  The stage's previous entry is removed so that a run that is interrupted part way through the stage is not treated as complete
+def start_stage(data_path, cache, stage):
+    if stage in cache:
+        del cache[stage]
+        save_stage_cache(data_path, cache)
+
+#This function marks a stage as completed with the given key
+def finish_stage(data_path, cache, stage, key):
+    cache[stage] = key
+    save_stage_cache(data_path, cache)
@@ -3,6 +3,9 @@ import math
 import librosa
 import soundfile
 import os
+import time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from pydub import AudioSegment
 
 #Functions to allow for easy time manipulations with pandas library
@@ -17,25 +20,100 @@ def year(x):
 def seconds(x):
     return x.seconds
 
-#Function converts an audio file to a .wav file (PCM_16)
+#Function converts an audio file to a mono .wav file (PCM_16) at the file's own sampling rate
+#The sampling rate is read from the file header and the audio is decoded and written in blocks, so the file is decoded once and never held in memory as a whole.
+#Files that soundfile can't read are decoded once with librosa instead
 #Inputs
 #Filename: path the audio file
 #output_path: path specifying where to output the converted .wav file
+#block_frames: number of frames to decode and write at a time
 #Returns:
 #Path to which the converted file was saved
 #Exports
 #Converted wave_file to output_path.  If output_path is not specified, the converted file is saved to the same directory as the original
-def convert_wav(filename, output_path=None):
-    sound = AudioSegment.from_file(filename)
-    sr = sound.frame_rate
-    y, lsr = librosa.load(filename, sr = sr)
+def convert_wav(filename, output_path=None, block_frames=65536):
     if output_path == None:
         output_path = os.path.splitext(filename)[0]+'.wav'
         print(output_path)
-    soundfile.write(output_path, y, samplerate=sr, subtype='PCM_16')
+    try:
+        src = soundfile.SoundFile(filename)
+    except RuntimeError: #soundfile (libsndfile) can't decode this format
+        y, sr = librosa.load(filename, sr = None) #sr=None keeps the native sampling rate
+        soundfile.write(output_path, y, samplerate=sr, subtype='PCM_16')
+        return output_path
+    with src, soundfile.SoundFile(output_path, 'w', samplerate=src.samplerate, channels=1, subtype='PCM_16') as dst:
+        for block in src.blocks(blocksize=block_frames, dtype='float32', always_2d=True):
+            dst.write(block.mean(axis=1)) #Average the channels to mono, as librosa.load does
     return output_path
 
+#Function converts every audio file with the given extensions in a folder to .wav (see convert_wav), using several processes
+#Inputs
+#data_path: path to the folder with the audio files
+#extensions: tuple of extensions of the files to convert
+#workers: number of processes to convert files with in parallel (1 converts the files serially)
+#skip_existing: if True, files that already have a .wav file next to them are not converted again
+#Returns:
+#List of paths of the converted files, in the order of the sorted source file names
+def convert_folder_to_wav(data_path, extensions=('.mp3',), workers=1, skip_existing=True):
+    files = sorted(os.path.join(data_path, filename) for filename in os.listdir(data_path) if filename.endswith(extensions))
+    if skip_existing:
+        files = [f for f in files if not os.path.exists(os.path.splitext(f)[0]+'.wav')]
+    return map_over_files(convert_wav, files, workers=workers)
+
+#Function reads the audio between t_start and t_end from an audio file without decoding the rest of the file
+#The reader seeks to the first frame of the requested section and only decodes the frames up to t_end, so memory use is bounded by the length of the section rather than the length of the recording
+#Inputs
+#filename: path to the audio file
+#t_start: start time of the section in seconds
+#t_end: end time of the section in seconds
+#sr: sampling rate to return the section at (the section is resampled if the file has a different native rate)
+#block_frames: number of frames to decode at a time
+
+#Returns
+#y: mono array of time series data for the section
+#sr: sampling rate of y
+def load_audio_section(filename, t_start, t_end, sr=44100, block_frames=65536):
+    t_start = max(t_start, 0)
+    try:
+        snd = soundfile.SoundFile(filename)
+    except RuntimeError:
+        #libsndfile can't read this format; librosa falls back to a decoder that streams the file and only keeps the requested section
+        y, sr = librosa.load(filename, sr=sr, offset=t_start, duration=max(t_end-t_start, 0))
+        return y, sr
+
+    with snd:
+        native_sr = snd.samplerate
+        start_frame = min(int(round(t_start*native_sr)), snd.frames)
+        end_frame = min(int(round(t_end*native_sr)), snd.frames)
+        n_frames = max(end_frame-start_frame, 0)
+
+        y = np.empty(n_frames, dtype=np.float32)
+        snd.seek(start_frame)
+        pos = 0
+        for block in snd.blocks(blocksize=block_frames, frames=n_frames, dtype='float32', always_2d=True):
+            y[pos:pos+len(block)] = block.mean(axis=1) #Downmix to mono the same way librosa.load does
+            pos += len(block)
+        y = y[:pos]
+
+    if native_sr != sr:
+        y = librosa.resample(y, orig_sr=native_sr, target_sr=sr)
+    return y, sr
+
+#Function converts times in seconds to the indices of the nearest samples in an array of n samples recorded at sr
+#A time exactly halfway between two samples maps to the earlier sample, and times outside the array are clamped to the first/last sample
+#Inputs
+#t: time or array of times in seconds
+#sr: sampling rate
+#n: the number of samples in the array
+
+#Returns
+#Index or array of indices (int64)
+def time_to_sample_index(t, sr, n):
+    ind = np.ceil(np.asarray(t, dtype=np.float64)*sr - 0.5).astype(np.int64)
+    return np.clip(ind, 0, max(n-1, 0))
+
 #Function crops an array y sampled at sr
+#The crop is a view of y (no data is copied)
 #Inputs
 #y: array of time series data to crop
 #sr: samping rate at which y was recorded
@@ -48,16 +126,87 @@ def convert_wav(filename, output_path=None):
 
 def crop_audio(y, sr, t_start, t_end):
     n = len(y) #the number of indices in the array
-    t = range(n) #create a time array of the corresponding size
-    t = [t_val/sr for t_val in t] #create a time vector given the sampling rate information
-    #Find the indicies corresponding to the given start and end times
-    t=np.array(t)
-    start_ind=np.argmin(np.absolute(t-t_start))
-    end_ind = np.argmin(np.absolute(t-t_end))
+    #Find the indicies of the samples nearest to the given start and end times
+    start_ind = int(time_to_sample_index(t_start, sr, n))
+    end_ind = int(time_to_sample_index(t_end, sr, n))
 
     y_crop = y[start_ind: end_ind]
     return y_crop, sr
 
+#Function crops many sections out of an array y sampled at sr in one call
+#Inputs
+#y: array of time series data to crop
+#sr: samping rate at which y was recorded
+#t_starts: list or array of start times for the crops in seconds
+#t_ends: list or array of end times for the crops in seconds
+
+#Returns:
+#crops: list of arrays of cropped time series data (views of y), in the same order as t_starts
+#sr: sampling rate of the crops
+def crop_audio_many(y, sr, t_starts, t_ends):
+    n = len(y)
+    start_inds = time_to_sample_index(t_starts, sr, n)
+    end_inds = time_to_sample_index(t_ends, sr, n)
+    crops = [y[a:b] for a, b in zip(start_inds.tolist(), end_inds.tolist())]
+    return crops, sr
+
+#Function crops many sections out of an array y, with the same frame bounds as slicing a pydub AudioSegment (sound[start_ms:end_ms])
+#Each time is clamped to the length of the sound in whole ms, then converted to int(ms*sr/1000) frames, so the crops hold exactly the samples
+#that pydub would export (e.g. a segment that ends at the end of the file keeps its last sample)
+#Inputs
+#y: array of time series data to crop
+#sr: samping rate at which y was recorded
+#ms_starts: list or array of start times for the crops in ms
+#ms_ends: list or array of end times for the crops in ms
+
+#Returns:
+#crops: list of arrays of cropped time series data (views of y), in the same order as ms_starts
+#sr: sampling rate of the crops
+def crop_audio_ms(y, sr, ms_starts, ms_ends):
+    n = len(y)
+    length_ms = round(1000 * (n / sr)) #len(AudioSegment)
+
+    def frame_index(ms):
+        ms = np.minimum(np.asarray(ms, dtype=np.float64), length_ms)
+        return np.clip((ms * (sr / 1000.0)).astype(np.int64), 0, n)
+
+    crops = [y[a:b] for a, b in zip(frame_index(ms_starts).tolist(), frame_index(ms_ends).tolist())]
+    return crops, sr
+
+#Function calls func(f) and times it.  Used by map_over_files to report per-file timing
+#Returns
+#result: the value returned by func(f)
+#elapsed: time taken in seconds
+def timed_call(func, f):
+    t0 = time.time()
+    result = func(f)
+    return result, time.time() - t0
+
+#Function applies func to every file in files, fanning the files out over a pool of worker processes if workers > 1
+#Inputs
+#func: function that processes one file; it must be defined at the top level of a module so it can be sent to the worker processes
+#files: list of file paths
+#workers: number of worker processes.  With 1 (or None) the files are processed serially in this process
+#kwargs: additional keyword arguments passed to func
+
+#Returns
+#List of the values returned by func, in the same order as files (independent of the order in which the workers finish)
+def map_over_files(func, files, workers=1, **kwargs):
+    call = partial(timed_call, partial(func, **kwargs))
+    if workers is None or workers <= 1 or len(files) <= 1:
+        timed_results = map(call, files)
+        results = []
+        for f, (result, elapsed) in zip(files, timed_results):
+            print("Processed %s in %.1f s" % (f, elapsed))
+            results.append(result)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        timed_results = list(pool.map(call, files))
+    for f, (result, elapsed) in zip(files, timed_results):
+        print("Processed %s in %.1f s" % (f, elapsed))
+    return [result for result, elapsed in timed_results]
+
 #This function finds the time offsets relative to the original file for an outputted audio chunk file
 #Input f_time_range: an exported audio chunk file that has time information in the file name
 #Returns
@@ -6,31 +6,252 @@ Created on Thu Sep 10 14:52:21 2020
 @author: jnarain
 """
 
+import argparse
+import re
+import shutil
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from preprocessing.align_labels import *
+from preprocessing import get_audio_chunks
 from preprocessing.get_audio_chunks import *
 from preprocessing.find_vocalizations import *
 from preprocessing.assign_labels import *
+from preprocessing.stage_cache import *
 
-##Change these based on what day and whose data you are processing        
-data_path = '' #Path to a folder with the data you are processing.  The folder name should be the date of data collection in format: YYYYMMDD
-
-participant_id = '' #Should match the participant IDs in the labeling file and the participant_database file
+##Defaults for the command line options
 labels_path = 'label_data.csv'
 pt_dir_path = 'participant_database.csv'
+drift = 0
+segment_params = {'final_padding': 200, 'min_silence_len': 300, 'silence_thresh': -24, 'detector': 'pydub'} #Parameters passed to segment_data
+chunk_params = {'gap': get_audio_chunks.max_time_between_labels, 'padding': get_audio_chunks.num_padding_seconds,
+                'max_chunk_length': get_audio_chunks.max_chunk_length} #Parameters passed to get_chunks
 
-pt_db = pd.read_csv(pt_dir_path) #Database that contains DST start information for all participants
-pt_db=pt_db.set_index('Participant')
-selected_pt=pt_db.loc[participant_id]
-utc_offset = selected_pt['UTC_offset']
+day_folder_format = re.compile(r'^\d{8}$') #Data folders are named by the date of data collection in format: YYYYMMDD
 
-drift = 0
+#Removes the output folder of a stage before the stage is rerun, so later stages never pick up files left over from an earlier run
+def remove_stale_output(folder):
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+
+#Runs the full pipeline (align labels, export label chunks, segment by volume, match segments with labels) for one participant-day
+#Unless use_cache is False, each stage is skipped if it has already been run on the same inputs with the same parameters (see stage_cache)
+#The key for each stage includes the key of the stage before it, so changing a parameter reruns that stage and every stage after it, and nothing before it
+
+#Inputs
+#data_path: path to a folder with the data being processed.  The folder name should be the date of data collection in format: YYYYMMDD
+#participant_id: should match the participant IDs in the labeling file and the participant_database file
+#labels: path to the label .csv file, a dataframe already read from it, or the dictionary returned by load_labels
+#utc_offset: offset between the recorder clock and UTC time in hours
+#drift: calculated drift between the recorder clock and the time server (in s)
+#workers: number of processes used for chunking and segmenting the files of this day
+#segment_params: dictionary of keyword arguments for segment_data (defaults to segment_params above)
+#chunk_params: dictionary of keyword arguments for get_chunks (defaults to chunk_params above)
+#use_cache: whether to skip stages whose inputs and parameters are unchanged
+#link_mode: how matched segments are placed in the label folders: 'copy', 'hardlink', 'symlink', or 'manifest' (see assign_labels)
+#streaming: if True, read only the frames of each chunk from the recorder files instead of decoding whole recordings (see get_chunks).  This only changes
+#how much memory chunking takes, not its output, so it is not part of the stage keys
+def process_participant_day(data_path, participant_id, labels, utc_offset, drift=0, workers=1, segment_params=segment_params, use_cache=True,
+                            link_mode='copy', chunk_params=chunk_params, streaming=False):
+    token = 'Volume' #Added to incorporate in folder name for reference
+    day = os.path.split(data_path)[1]
+    path_to_labels = data_path + '/formattedLabels' + day + '.csv'
+    path_to_chunks = data_path + '/AudioChunksByLabel'
+    path_to_df = data_path + '/AudioSegments_' + token + '_' + day + '.csv'
+    path_to_segs = data_path + '/AudioSegments_' + token
+    path_to_auto_segs = data_path + '/AutoSegments_' + token
+
+    if isinstance(labels, dict):
+        labels = labels[participant_id]
+    elif not isinstance(labels, pd.DataFrame):
+        labels = load_labels(labels)[participant_id]
+    pt_labels = labels.loc[labels['Participant ID'] == participant_id]
+
+    cache = load_stage_cache(data_path) if use_cache else {}
+
+    align_key = stage_key('align', dataframe_fingerprint(pt_labels), folder_fingerprint(data_path, ('.mp3',)), float(utc_offset), float(drift))
+    chunks_key = stage_key('chunks', align_key, chunk_params)
+    segment_key = stage_key('segment', chunks_key, segment_params, token)
+    assign_key = stage_key('assign', segment_key, align_key, token, link_mode)
+
+    parsedLabelDF = None
+    if stage_is_current(cache, 'align', align_key, [path_to_labels]):
+        print('Labels already aligned for', data_path)
+    else:
+        start_stage(data_path, cache, 'align')
+        parsedLabelDF, alignedLabelDF = align_data(pt_labels, participant_id, data_path, utc_offset, drift = drift) #Align the label and recorder data.  The returned dataframes have the timings of labels relative to the recorder files
+        finish_stage(data_path, cache, 'align', align_key)
+
+    if stage_is_current(cache, 'chunks', chunks_key, [path_to_chunks]):
+        print('Label chunks already exported for', data_path)
+    else:
+        start_stage(data_path, cache, 'chunks')
+        if parsedLabelDF is None:
+            parsedLabelDF, alignedLabelDF = align_data(pt_labels, participant_id, data_path, utc_offset, drift = drift)
+        remove_stale_output(path_to_chunks)
+        chunkDF, chunk_offset_dict = get_chunks(parsedLabelDF, data_path, utc_offset, drift = drift, streaming = streaming, workers = workers, **chunk_params) #Remove any sections of audio that don't have labels to speed up later steps
+        finish_stage(data_path, cache, 'chunks', chunks_key)
+
+    if stage_is_current(cache, 'segment', segment_key, [path_to_df, path_to_segs]):
+        print('Segments already exported for', data_path)
+    else:
+        start_stage(data_path, cache, 'segment')
+        remove_stale_output(path_to_segs)
+        if segment_data(data_path, token = token, workers = workers, **segment_params) is None: #Segment the data using volume
+            raise SystemExit('No segments were written for ' + data_path) #The stage is left unfinished, so the day is segmented again next time
+        finish_stage(data_path, cache, 'segment', segment_key)
+
+    if stage_is_current(cache, 'assign', assign_key, [path_to_auto_segs]):
+        print('Labels already assigned for', data_path)
+    else:
+        start_stage(data_path, cache, 'assign')
+        remove_stale_output(path_to_auto_segs)
+        assign_labels(data_path, path_to_df, path_to_labels, token, link_mode=link_mode) #Match the segments with labels
+        finish_stage(data_path, cache, 'assign', assign_key)
+
+#Finds the YYYYMMDD data folders directly inside folder
+#Returns a sorted list of paths
+def find_day_folders(folder):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if day_folder_format.match(name) and os.path.isdir(os.path.join(folder, name)))
+
+#Finds the participant-days to process under root
+#The data for each participant is expected in root/<participant_id>/<YYYYMMDD>.  root may also be a single YYYYMMDD folder, or a folder of
+#YYYYMMDD folders, if only one participant is being processed
+
+#Inputs
+#root: path to the data root
+#participant_ids: list of participants to process.  If empty, every subfolder of root that contains YYYYMMDD folders is treated as a participant
+
+#Returns
+#List of (participant_id, data_path) pairs
+def find_participant_days(root, participant_ids=None):
+    root = os.path.normpath(root)
+    if not participant_ids:
+        participant_ids = sorted(name for name in os.listdir(root) if len(find_day_folders(os.path.join(root, name))) > 0)
+
+    if day_folder_format.match(os.path.basename(root)):
+        if len(participant_ids) != 1:
+            raise SystemExit('A single day folder was given; specify exactly one participant')
+        return [(participant_ids[0], root)]
+
+    jobs = []
+    for participant_id in participant_ids:
+        participant_root = os.path.join(root, participant_id)
+        if not os.path.isdir(participant_root):
+            if len(participant_ids) != 1:
+                print('No folder for participant', participant_id, 'in', root)
+                continue
+            participant_root = root
+        jobs.extend((participant_id, day) for day in find_day_folders(participant_root))
+    return jobs
+
+#Processes many participant-days, with at most max_concurrent of them running at once
+#The label file and participant database are read once, and each participant-day is only sent the (already parsed) labels for its participant
+
+#Inputs
+#root: path to the data root (see find_participant_days)
+#participant_ids: list of participants to process (all participants found under root if empty)
+#labels_path: path to the label .csv file
+#pt_dir_path: path to the participant database .csv file
+#label_cache_path: optional path to keep the parsed label table at, so later runs don't re-parse the label .csv file (see load_labels)
+#drift: calculated drift between the recorder clock and the time server (in s)
+#max_concurrent: number of participant-days processed at the same time
+#workers: number of processes used within each participant-day (used when max_concurrent is 1)
+#segment_params: dictionary of keyword arguments for segment_data
+#chunk_params: dictionary of keyword arguments for get_chunks
+#use_cache: whether to skip stages whose inputs and parameters are unchanged
+#link_mode: how matched segments are placed in the label folders (see assign_labels)
+#streaming: read only the frames of each chunk from the recorder files (see process_participant_day)
+
+#Returns
+#failed: list of (participant_id, data_path, error) for the participant-days that could not be processed
+def run_batch(root, participant_ids=None, labels_path=labels_path, pt_dir_path=pt_dir_path, label_cache_path=None, drift=drift, max_concurrent=1, workers=1,
+              segment_params=segment_params, use_cache=True, link_mode='copy', chunk_params=chunk_params, streaming=False):
+    if max_concurrent > 1 and workers > 1:
+        print('Warning: workers=%d is ignored when max_concurrent > 1; each participant-day runs in a single process' % workers)
+    jobs = find_participant_days(root, participant_ids)
+    print("found %d participant-days in %s" % (len(jobs), root))
+
+    pt_db = pd.read_csv(pt_dir_path) #Database that contains DST start information for all participants
+    pt_db = pt_db.set_index('Participant')
+
+    labels_by_participant = load_labels(labels_path, cache_path=label_cache_path)
+
+    failed = []
+    runnable = []
+    for participant_id, data_path in jobs:
+        if participant_id not in labels_by_participant:
+            failed.append((participant_id, data_path, 'There is no label data for the selected participant'))
+        elif participant_id not in pt_db.index:
+            failed.append((participant_id, data_path, 'The participant is not in the participant database'))
+        else:
+            runnable.append((participant_id, data_path))
+
+    def job_args(participant_id, data_path):
+        return (data_path, participant_id, labels_by_participant[participant_id], pt_db.loc[participant_id]['UTC_offset'], drift)
+
+    if max_concurrent <= 1:
+        for participant_id, data_path in runnable:
+            print('Processing', participant_id, data_path)
+            try:
+                process_participant_day(*job_args(participant_id, data_path), workers=workers, segment_params=segment_params, use_cache=use_cache,
+                                        link_mode=link_mode, chunk_params=chunk_params, streaming=streaming)
+            except (Exception, SystemExit) as e:
+                failed.append((participant_id, data_path, str(e)))
+    else:
+        #Processes inside each participant-day are not nested in the pool, so each day runs serially
+        with ProcessPoolExecutor(max_workers=max_concurrent) as pool:
+            futures = {pool.submit(process_participant_day, *job_args(participant_id, data_path),
+                                   segment_params=segment_params, use_cache=use_cache, link_mode=link_mode,
+                                   chunk_params=chunk_params, streaming=streaming): (participant_id, data_path)
+                       for participant_id, data_path in runnable}
+            for future in as_completed(futures):
+                participant_id, data_path = futures[future]
+                try:
+                    future.result()
+                    print('Finished', participant_id, data_path)
+                except (Exception, SystemExit) as e:
+                    failed.append((participant_id, data_path, str(e)))
+
+    for participant_id, data_path, error in failed:
+        print('Failed', participant_id, data_path, ':', error)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Align labels, segment, and match segments with labels for many participant-days')
+    parser.add_argument('root', help='data root: root/<participant_id>/<YYYYMMDD>, or a single YYYYMMDD folder')
+    parser.add_argument('-p', '--participants', nargs='*', default=None, help='participant IDs to process (default: all found under root)')
+    parser.add_argument('--labels', default=labels_path, help='path to the label .csv file')
+    parser.add_argument('--label-cache', default=None, help='path to keep the parsed label table at between runs')
+    parser.add_argument('--participant-db', default=pt_dir_path, help='path to the participant database .csv file')
+    parser.add_argument('--drift', type=float, default=drift, help='recorder clock drift (s)')
+    parser.add_argument('-j', '--max-concurrent', type=int, default=1, help='number of participant-days processed at once')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='processes per participant-day (only used when --max-concurrent is 1)')
+    parser.add_argument('--min-silence-len', type=int, default=segment_params['min_silence_len'], help='minimum length between non-silent regions (ms)')
+    parser.add_argument('--silence-thresh', type=float, default=segment_params['silence_thresh'], help='audio quieter than this is considered silence (dB)')
+    parser.add_argument('--final-padding', type=int, default=segment_params['final_padding'], help='amount to pad segments (ms)')
+    parser.add_argument('--detector', choices=('pydub', 'numpy'), default=segment_params['detector'],
+                        help='non-silence detector: pydub.silence.detect_nonsilent or the vectorized detect_nonsilent_np')
+    parser.add_argument('--chunk-gap', type=float, default=chunk_params['gap'], help='labels closer together than this are exported in one chunk (s)')
+    parser.add_argument('--chunk-padding', type=float, default=chunk_params['padding'], help='audio kept before and after each chunk of labels (s)')
+    parser.add_argument('--max-chunk-length', type=float, default=chunk_params['max_chunk_length'], help='split chunks longer than this between labels (s)')
+    parser.add_argument('--streaming', action='store_true', help='read only the labelled chunks from the recorder files instead of decoding whole recordings (less memory)')
+    parser.add_argument('--link-mode', choices=link_modes, default='copy', help='how matched segments are placed in the label folders')
+    parser.add_argument('--no-cache', action='store_true', help='rerun every stage even if its inputs and parameters are unchanged')
+    args = parser.parse_args()
+    if args.max_concurrent > 1 and args.workers > 1:
+        parser.error('--workers only applies when --max-concurrent is 1 (participant-days running at once each use a single process)')
 
-parsedLabelDF, alignedLabelDF = align_data(labels_path, participant_id, data_path, utc_offset, drift = drift) #Align the label and recorder data.  The returned dataframes have the timings of labels relative to the recorder files
-chunkDF, chunk_offset_dict = get_chunks(parsedLabelDF, data_path, utc_offset, drift = drift) #Remove any sections of audio that don't have labels to speed up later steps
+    params = {'final_padding': args.final_padding, 'min_silence_len': args.min_silence_len, 'silence_thresh': args.silence_thresh,
+              'detector': args.detector}
+    chunks = {'gap': args.chunk_gap, 'padding': args.chunk_padding, 'max_chunk_length': args.max_chunk_length}
+    failed = run_batch(args.root, args.participants, labels_path=args.labels, pt_dir_path=args.participant_db, label_cache_path=args.label_cache,
+                       drift=args.drift, max_concurrent=args.max_concurrent, workers=args.workers,
+                       segment_params=params, use_cache=not args.no_cache, link_mode=args.link_mode, chunk_params=chunks, streaming=args.streaming)
+    if failed:
+        raise SystemExit(1)
 
-token = segment_data(data_path, final_padding = 200, min_silence_len=300, silence_thresh=-24) #Segment the data using volume
-token = 'Volume' #Added to incorporate in folder name for reference
-path_to_df =  data_path + '/AudioSegments_' + token + '_' + os.path.split(data_path)[1] + '.csv'
-path_to_segs = data_path + "/AudioSegments_" + token
-assign_labels(data_path, path_to_df, data_path+'/formattedLabels'+os.path.split(data_path)[-1]+'.csv', token) #Match the segments with labels
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Downloads the dataset archives and preprocesses them at the same time.  Each stage hands its results to the next through a bounded queue:
+downloads -> archive extraction -> process_participant_day (see run_preprocessing), so a participant-day is processed as soon as its folder has
+been extracted, and a stage that gets ahead of the next one waits instead of filling the disk or memory
+"""
+
+import os
+import sys
+import time
+import queue
+import struct
+import zipfile
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) #downloader.py is in the repository root
+from downloader import make_session, sync_file, filename_from_link, load_manifest, save_manifest, MANIFEST_NAME
+from run_preprocessing import *
+
+queue_size = 2 #Archives (or participant-days) that can wait between two stages before the stage feeding them pauses
+extended_timestamp_id = 0x5455 #Zip extra field with the member's modification time as a unix timestamp
+
+#This function finds the modification time to give an extracted file
+#The recorder file time stamps are used to align the labels, so they have to survive extraction.  The unix timestamp in the extended timestamp field is used
+#if the archive has one; otherwise the (local, 2 s resolution) zip date_time is used
+
+#Inputs
+#info: the member's zipfile.ZipInfo
+
+#Returns
+#modification time in s since the epoch
+def member_mtime(info):
+    extra = info.extra
+    while len(extra) >= 4:
+        field_id, size = struct.unpack('<HH', extra[:4])
+        if field_id == extended_timestamp_id and size >= 5 and extra[4] & 1:
+            return struct.unpack('<i', extra[5:9])[0]
+        extra = extra[4+size:]
+    return time.mktime(info.date_time + (0, 0, -1))
+
+#This function finds where zipfile extracts a member of an archive to (the separators are converted the same way zipfile converts them)
+#Returns None for a name that zipfile would have to rewrite to keep it inside dest: an absolute path, a drive letter, or a '..' component
+def member_path(name, dest):
+    arcname = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    drive, arcname = os.path.splitdrive(arcname)
+    parts = arcname.split(os.path.sep)
+    if drive or arcname.startswith(os.path.sep) or os.path.pardir in parts:
+        return None
+    return os.path.join(dest, *[part for part in parts if part not in ('', os.path.curdir)])
+
+#This function extracts an archive one folder at a time, and yields each participant-day folder as soon as all of its files have been extracted
+#Files that are already extracted (same size and modification time) are left alone, so rerunning doesn't invalidate the stage cache of processed days
+#An archive with a member name that would be extracted outside dest is rejected (zipfile.BadZipFile) before anything is extracted
+
+#Inputs
+#archive: path to a .zip file
+#dest: folder to extract to
+
+#Returns (yields)
+#(participant_id, data_path) for each YYYYMMDD folder in the archive.  The participant ID is the name of the folder that contains the day folder,
+#or the archive name if the day folders are at the top of the archive
+def extract_days(archive, dest):
+    with zipfile.ZipFile(archive) as zf:
+        folders = {}
+        for info in zf.infolist():
+            path = member_path(info.filename, dest)
+            if path is None:
+                raise zipfile.BadZipFile('Unsafe member name %r' % info.filename)
+            if not info.is_dir():
+                folders.setdefault(os.path.dirname(os.path.relpath(path, dest)), []).append(info)
+
+        for folder, members in folders.items():
+            for info in members:
+                path = member_path(info.filename, dest)
+                mtime = member_mtime(info)
+                if os.path.exists(path) and os.path.getsize(path) == info.file_size and int(os.path.getmtime(path)) == int(mtime):
+                    continue
+                path = zf.extract(info, dest)
+                os.utime(path, (mtime, mtime))
+
+            if day_folder_format.match(os.path.basename(folder)):
+                parent = os.path.basename(os.path.dirname(folder))
+                participant_id = parent if parent else os.path.splitext(os.path.basename(archive))[0]
+                yield participant_id, os.path.join(dest, folder)
+
+#This function downloads the links on a pool of threads, putting each finished file on archive_queue
+#A worker waits while the queue is full before starting its next download, so downloads pause when extraction falls behind
+
+#Inputs
+#links: list of download links
+#folder: folder to download to (the download manifest is kept here, see downloader.download_all)
+#archive_queue: queue that receives the path of each downloaded file, then None once every download has finished
+#workers: number of downloads at once
+#checksums: optional dictionary of filename -> expected checksum
+#stop: optional threading.Event; once it is set, downloads that haven't started yet are skipped
+
+#Returns
+#failed: list of (filename, error) for the files that could not be downloaded
+def download_stage(links, folder, archive_queue, workers=4, checksums=None, stop=None):
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    checksums = checksums or {}
+    session = make_session(workers)
+    lock = threading.Lock()
+    failed = []
+
+    def fetch(link):
+        if stop is not None and stop.is_set():
+            return
+        filename = filename_from_link(link)
+        path = os.path.join(folder, filename)
+        skipped = False
+        try:
+            row, received, skipped = sync_file(session, link, path, manifest.get(filename), checksums.get(filename))
+        except Exception as e:
+            row = {'filename': filename, 'size': 0, 'checksum': '', 'status': 'failed'}
+            failed.append((filename, str(e)))
+        with lock:
+            manifest[filename] = row
+            save_manifest(manifest_path, manifest)
+        if row['status'] == 'ok':
+            print('Downloaded' if not skipped else 'Already downloaded', filename)
+            archive_queue.put(path)
+        elif row['status'] == 'corrupt':
+            failed.append((filename, 'checksum does not match'))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fetch, links))
+    finally:
+        archive_queue.put(None) #Always tell the extraction stage there is nothing more coming, so it can't wait forever
+    return failed
+
+#This function extracts the downloaded archives, putting each participant-day on day_queue as soon as its folder is extracted
+#Downloads that are not .zip files (e.g. the label file) are left where they are
+
+#Inputs
+#archive_queue: queue of downloaded file paths, ending with None
+#dest: folder to extract to
+#day_queue: queue that receives (participant_id, data_path) for each extracted participant-day, then None
+#stop: optional threading.Event; once it is set, the stage stops extracting after the current folder
+def extract_stage(archive_queue, dest, day_queue, stop=None):
+    try:
+        while True:
+            archive = archive_queue.get()
+            if archive is None or (stop is not None and stop.is_set()):
+                break
+            if not zipfile.is_zipfile(archive):
+                continue
+            try:
+                for participant_id, data_path in extract_days(archive, dest):
+                    if stop is not None and stop.is_set():
+                        break
+                    day_queue.put((participant_id, data_path))
+            except (zipfile.BadZipFile, OSError) as e:
+                print("Couldn't extract", archive, ':', e)
+    finally:
+        day_queue.put(None)
+
+#This function empties a queue without waiting, so a stage blocked on putting to it can go on
+def drain_queue(q):
+    while True:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            return
+
+#This function stops the download and extraction stages and waits for them to finish
+#The queues are emptied until both threads have exited, since a stage may be waiting for room in a queue that nothing will read any more
+def stop_stages(stop, threads, queues):
+    stop.set()
+    while any(thread.is_alive() for thread in threads):
+        for q in queues:
+            drain_queue(q)
+        for thread in threads:
+            thread.join(timeout=0.1)
+
+#Downloads, extracts, and preprocesses the dataset with the three stages running at the same time
+
+#Inputs
+#links: list of download links
+#download_folder: folder to download the archives to
+#extract_folder: folder to extract the archives to
+#labels_path: path to the label .csv file
+#pt_dir_path: path to the participant database .csv file
+#label_cache_path: optional path to keep the parsed label table at (see load_labels)
+#drift: calculated drift between the recorder clock and the time server (in s)
+#download_workers: number of downloads at once
+#max_concurrent: number of participant-days processed at the same time
+#checksums: optional dictionary of filename -> expected checksum
+#segment_params, chunk_params, use_cache, link_mode, streaming: see process_participant_day
+
+#Returns
+#failed: list of (name, error) for the downloads and participant-days that failed
+def run_streaming(links, download_folder, extract_folder, labels_path=labels_path, pt_dir_path=pt_dir_path, label_cache_path=None, drift=drift,
+                  download_workers=4, max_concurrent=1, checksums=None, segment_params=segment_params, chunk_params=chunk_params, use_cache=True,
+                  link_mode='copy', streaming=False):
+    pt_db = pd.read_csv(pt_dir_path) #Database that contains DST start information for all participants
+    pt_db = pt_db.set_index('Participant')
+    labels_by_participant = load_labels(labels_path, cache_path=label_cache_path)
+
+    archive_queue = queue.Queue(maxsize=queue_size)
+    day_queue = queue.Queue(maxsize=queue_size)
+    download_failed = []
+    stop = threading.Event()
+    downloader_thread = threading.Thread(target=lambda: download_failed.extend(download_stage(links, download_folder, archive_queue, download_workers,
+                                                                                              checksums, stop)))
+    extractor_thread = threading.Thread(target=extract_stage, args=(archive_queue, extract_folder, day_queue, stop))
+    downloader_thread.start()
+    extractor_thread.start()
+
+    failed = []
+    running = {}
+    slots = threading.Semaphore(max_concurrent) #Only take a participant-day off the queue when a process is free, so extraction waits for processing
+
+    def finished(future):
+        participant_id, data_path = running.pop(future)
+        try:
+            future.result()
+            print('Finished', participant_id, data_path)
+        except (Exception, SystemExit) as e:
+            failed.append((participant_id + ' ' + data_path, str(e)))
+        slots.release()
+
+    try:
+        #The worker processes are started with 'spawn': forking this process while the download and extraction threads hold locks could deadlock the workers
+        with ProcessPoolExecutor(max_workers=max_concurrent, mp_context=multiprocessing.get_context('spawn')) as pool:
+            while True:
+                slots.acquire()
+                job = day_queue.get()
+                if job is None:
+                    slots.release()
+                    break
+                participant_id, data_path = job
+                if participant_id not in labels_by_participant or participant_id not in pt_db.index:
+                    failed.append((participant_id + ' ' + data_path, 'The participant has no labels or is not in the participant database'))
+                    slots.release()
+                    continue
+                print('Processing', participant_id, data_path)
+                future = pool.submit(process_participant_day, data_path, participant_id, labels_by_participant[participant_id],
+                                     pt_db.loc[participant_id]['UTC_offset'], drift, segment_params=segment_params, use_cache=use_cache,
+                                     link_mode=link_mode, chunk_params=chunk_params, streaming=streaming)
+                running[future] = (participant_id, data_path)
+                future.add_done_callback(finished)
+    finally:
+        stop_stages(stop, (downloader_thread, extractor_thread), (archive_queue, day_queue)) #Also when processing fails (e.g. BrokenProcessPool)
+
+    failed = download_failed + failed
+    for name, error in failed:
+        print('Failed', name, ':', error)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Download the dataset archives and preprocess each participant-day as soon as it is extracted')
+    parser.add_argument('links', help='.csv file with the download links (data_links.csv, written by data_collect.py)')
+    parser.add_argument('--download-folder', default='downloads', help='folder to download the archives to')
+    parser.add_argument('--extract-folder', default='data', help='folder to extract the archives to')
+    parser.add_argument('--labels', default=labels_path, help='path to the label .csv file')
+    parser.add_argument('--label-cache', default=None, help='path to keep the parsed label table at between runs')
+    parser.add_argument('--participant-db', default=pt_dir_path, help='path to the participant database .csv file')
+    parser.add_argument('--drift', type=float, default=drift, help='recorder clock drift (s)')
+    parser.add_argument('-d', '--download-workers', type=int, default=4, help='number of downloads at once')
+    parser.add_argument('-j', '--max-concurrent', type=int, default=1, help='number of participant-days processed at once')
+    parser.add_argument('--link-mode', choices=link_modes, default='copy', help='how matched segments are placed in the label folders')
+    parser.add_argument('--detector', choices=('pydub', 'numpy'), default=segment_params['detector'], help='non-silence detector (see run_preprocessing)')
+    parser.add_argument('--streaming', action='store_true', help='read only the labelled chunks from the recorder files (less memory)')
+    parser.add_argument('--no-cache', action='store_true', help='rerun every stage even if its inputs and parameters are unchanged')
+    args = parser.parse_args()
+
+    links_df = pd.read_csv(args.links)
+    checksums = {}
+    if 'checksum' in links_df.columns:
+        checksums = {filename_from_link(link): checksum for link, checksum in zip(links_df.links, links_df.checksum) if isinstance(checksum, str)}
+    failed = run_streaming(list(links_df.links), args.download_folder, args.extract_folder, labels_path=args.labels, pt_dir_path=args.participant_db,
+                           label_cache_path=args.label_cache, drift=args.drift, download_workers=args.download_workers,
+                           max_concurrent=args.max_concurrent, checksums=checksums, use_cache=not args.no_cache, link_mode=args.link_mode,
+                           segment_params=dict(segment_params, detector=args.detector), streaming=args.streaming)
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
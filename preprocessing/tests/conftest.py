@@ -0,0 +1,5 @@
+import os
+import sys
+
+#The preprocessing modules are imported the way run_preprocessing.py imports them (from the preprocessing folder)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
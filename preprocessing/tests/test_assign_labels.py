@@ -0,0 +1,85 @@
+import os
+import numpy as np
+import pandas as pd
+from preprocessing.assign_labels import match_segments_to_labels, allowedDelayConfident, allowedDelayTentative
+
+sample_label_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'label_data_sample.csv')
+
+#The rule chain of assign_labels before it was vectorized, kept as the reference: dense segment x label comparison matrices and a loop over
+#the segments.  Returns the index of the matched label for each segment, or -1
+def reference_match(seg_start_list, seg_end_list, label_start_list, label_end_list, allowed_delay_confident=allowedDelayConfident,
+                    allowed_delay_tentative=allowedDelayTentative):
+    start_comparison = np.zeros((len(seg_start_list), len(label_start_list)))
+    end_comparison = np.zeros((len(seg_start_list), len(label_start_list)))
+    for i in range(len(label_start_list)):
+        start_comparison[:, i] = seg_start_list - label_start_list[i]
+        end_comparison[:, i] = seg_start_list - label_end_list[i]
+    col_index_start = np.argmin(np.absolute(start_comparison), axis=1)
+    min_value_start = np.array([start_comparison[i, col_ind] for i, col_ind in enumerate(col_index_start)])
+    col_index_end = np.argmin(np.absolute(end_comparison), axis=1)
+    min_value_end = np.array([end_comparison[i, col_ind] for i, col_ind in enumerate(col_index_end)])
+
+    matched = []
+    for i in range(len(seg_start_list)):
+        start_and_start = seg_start_list[i] > label_start_list
+        start_and_end = seg_start_list[i] < label_end_list
+        end_and_start = seg_end_list[i] > label_start_list
+        end_and_end = seg_end_list[i] < label_end_list
+        seg_start_in_label = [a and b for a, b in zip(start_and_start, start_and_end)]
+        seg_end_in_label = [a and b for a, b in zip(end_and_start, end_and_end)]
+        seg_full_in_label = np.array([a and b for a, b in zip(seg_start_in_label, seg_end_in_label)])
+        seg_fully_in_label_indices = [j for j, x in enumerate(seg_full_in_label) if x]
+        seg_end_in_label_indices = [j for j, x in enumerate(seg_end_in_label) if x]
+        seg_start_in_label_indices = [j for j, x in enumerate(seg_start_in_label) if x]
+
+        if len(seg_fully_in_label_indices) > 0:
+            matched.append(seg_fully_in_label_indices[0])
+        elif len(seg_end_in_label_indices) > 0:
+            matched.append(seg_end_in_label_indices[0])
+        elif (min_value_start[i] < 0) and (abs(min_value_start[i]) <= allowed_delay_confident):
+            matched.append(col_index_start[i])
+        elif abs(min_value_end[i]) <= allowed_delay_tentative:
+            matched.append(col_index_start[i])
+        elif len(seg_start_in_label_indices) > 0 and abs(end_comparison[i, seg_start_in_label_indices[0]]) <= allowed_delay_tentative:
+            matched.append(seg_start_in_label_indices[0])
+        else:
+            matched.append(-1)
+    return np.array(matched, dtype=np.int64)
+
+def check_same(seg_start, seg_end, label_start, label_end, err_msg=''):
+    order = np.argsort(label_start, kind='stable') #assign_labels passes the labels sorted by start time
+    label_start, label_end = label_start[order], label_end[order]
+    expected = reference_match(seg_start, seg_end, label_start, label_end)
+    np.testing.assert_array_equal(match_segments_to_labels(seg_start, seg_end, label_start, label_end), expected, err_msg=err_msg)
+
+def test_random_overlapping_labels():
+    for seed in range(3000):
+        rng = np.random.default_rng(seed)
+        n_labels = int(rng.integers(1, 15))
+        n_segments = int(rng.integers(1, 40))
+        if seed % 2: #Times on a coarse grid, so starts, ends, and distances tie often
+            label_start = rng.integers(0, 60, n_labels).astype(float)
+            label_end = label_start + rng.integers(0, 20, n_labels)
+            seg_start = rng.integers(0, 80, n_segments).astype(float)
+            seg_end = seg_start + rng.integers(0, 6, n_segments)
+        else:
+            label_start = rng.uniform(0, 200, n_labels)
+            label_end = label_start + rng.exponential(10, n_labels)
+            seg_start = rng.uniform(-10, 220, n_segments)
+            seg_end = seg_start + rng.exponential(2, n_segments)
+        check_same(seg_start, seg_end, label_start, label_end, 'seed %d' % seed)
+
+def test_sample_data():
+    labelDF = pd.read_csv(sample_label_file)
+    created = pd.to_datetime(labelDF['Event Created Time'], utc=True)
+    ends = pd.to_datetime(labelDF['Event End'], utc=True)
+    origin = created.min() - pd.Timedelta(seconds=30) #Times relative to a recorder file that started 30 s before the first label
+    label_start = (created - origin).dt.total_seconds().to_numpy()
+    label_end = (ends - origin).dt.total_seconds().to_numpy()
+    seg_start = np.arange(0, 60, 0.25)
+    for duration in (0.1, 0.5, 2.0):
+        check_same(seg_start, seg_start + duration, label_start, label_end)
+
+def test_no_labels_or_segments():
+    assert len(match_segments_to_labels(np.zeros(0), np.zeros(0), np.array([1.0]), np.array([2.0]))) == 0
+    np.testing.assert_array_equal(match_segments_to_labels(np.array([1.0]), np.array([2.0]), np.zeros(0), np.zeros(0)), [-1])
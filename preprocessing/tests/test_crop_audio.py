@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from preprocessing_general import crop_audio_ms
+from preprocessing.find_vocalizations import pad_segment
+
+@pytest.mark.parametrize('sr', [8000, 22050, 44100, 48000])
+@pytest.mark.parametrize('channels', [1, 2])
+def test_matches_pydub_slicing(sr, channels):
+    rng = np.random.default_rng(sr + channels)
+    for _ in range(20):
+        y = rng.integers(-3000, 3000, (int(rng.integers(1, 3*sr)), channels)).astype(np.int16)
+        sound = AudioSegment(data=y.tobytes(), sample_width=2, frame_rate=sr, channels=channels)
+        file_length = sound.duration_seconds*1000
+        pairs = [pad_segment(a, a + rng.uniform(0, 500), int(rng.choice([0, 50])), file_length) for a in rng.uniform(0, file_length, 10)]
+        pairs += [pad_segment(0, file_length, 50, file_length), pad_segment(7, 500, 0, file_length)]
+        crops, crop_sr = crop_audio_ms(y, sr, [a for a, b in pairs], [b for a, b in pairs])
+        assert crop_sr == sr
+        for (start, end), crop in zip(pairs, crops):
+            assert crop.tobytes() == sound[start:end].raw_data
+
+def test_segment_at_end_of_file_keeps_last_sample():
+    y = np.arange(88237, dtype=np.int16)[:, np.newaxis]
+    crops, sr = crop_audio_ms(y, 44100, [0], [len(y)/44100*1000])
+    assert len(crops[0]) == 88237
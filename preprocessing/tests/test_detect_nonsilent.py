@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent
+from preprocessing.find_vocalizations import detect_nonsilent_np
+
+#Sample audio: bursts of noise at random levels separated by stretches of near silence
+def sample_audio(rng, sr, channels, seconds):
+    n = int(sr*seconds)
+    y = rng.normal(0, 30, (n, channels))
+    position = 0
+    while position < n:
+        length = int(rng.integers(1, int(0.4*sr)))
+        if rng.random() < 0.5:
+            y[position:position+length] = rng.normal(0, rng.choice([300, 3000, 12000]), (len(y[position:position+length]), channels))
+        position += length
+    return np.clip(np.round(y), -32768, 32767).astype(np.int16)
+
+def pydub_nonsilent(y, sr, **kwargs):
+    sound = AudioSegment(data=y.tobytes(), sample_width=2, frame_rate=sr, channels=y.shape[1])
+    return detect_nonsilent(sound, **kwargs)
+
+def check_parity(y, sr, min_silence_len, silence_thresh, seek_step):
+    expected = pydub_nonsilent(y, sr, min_silence_len=min_silence_len, silence_thresh=silence_thresh, seek_step=seek_step)
+    result = detect_nonsilent_np(y, sr, min_silence_len=min_silence_len, silence_thresh=silence_thresh, seek_step=seek_step)
+    assert [[int(start), int(end)] for start, end in result] == expected
+
+@pytest.mark.parametrize('sr', [8000, 22050, 44100])
+@pytest.mark.parametrize('channels', [1, 2])
+@pytest.mark.parametrize('seek_step', [1, 7, 10])
+def test_matches_pydub(sr, channels, seek_step):
+    rng = np.random.default_rng(sr + 10*channels + seek_step)
+    for _ in range(3):
+        y = sample_audio(rng, sr, channels, rng.uniform(0.5, 3))
+        check_parity(y, sr, int(rng.choice([50, 150, 400])), float(rng.choice([-50, -40, -24])), seek_step)
+
+def test_small_blocks_match_pydub():
+    rng = np.random.default_rng(0)
+    y = sample_audio(rng, 16000, 2, 2)
+    expected = pydub_nonsilent(y, 16000, min_silence_len=150, silence_thresh=-40)
+    assert detect_nonsilent_np(y, 16000, 150, -40, block_frames=1000) == expected
+
+@pytest.mark.parametrize('channels', [1, 2])
+def test_empty(channels):
+    check_parity(np.zeros((0, channels), dtype=np.int16), 44100, 150, -50, 1)
+
+@pytest.mark.parametrize('seek_step', [1, 10])
+def test_all_silent(seek_step):
+    check_parity(np.zeros((44100, 1), dtype=np.int16), 44100, 150, -50, seek_step)
+
+def test_all_loud():
+    rng = np.random.default_rng(1)
+    check_parity(rng.normal(0, 5000, (22050, 2)).astype(np.int16), 22050, 150, -50, 1)
+
+@pytest.mark.parametrize('seconds', [0.05, 0.149])
+def test_shorter_than_min_silence_len(seconds):
+    rng = np.random.default_rng(2)
+    check_parity(sample_audio(rng, 44100, 1, seconds), 44100, 150, -50, 1)
+
+def test_mono_vector_input():
+    rng = np.random.default_rng(3)
+    y = sample_audio(rng, 22050, 1, 1.5)
+    expected = pydub_nonsilent(y, 22050, min_silence_len=100, silence_thresh=-40)
+    assert detect_nonsilent_np(y[:, 0], 22050, 100, -40) == expected
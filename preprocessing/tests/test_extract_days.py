@@ -0,0 +1,40 @@
+import os
+import zipfile
+import pytest
+from run_streaming import extract_days, member_mtime
+
+def write_archive(path, names):
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name in names:
+            info = zipfile.ZipInfo(name, date_time=(2023, 5, 1, 12, 30, 4))
+            zf.writestr(info, name.encode())
+    return str(path)
+
+def test_extracts_days_with_member_times(tmp_path):
+    names = ['P01/20230501/a.wav', 'P01/20230501/b.wav', 'P01/./20230502/c.wav', 'P01/notes.txt']
+    archive = write_archive(tmp_path/'P01.zip', names)
+    dest = str(tmp_path/'out')
+    days = list(extract_days(archive, dest))
+    assert [participant for participant, _ in days] == ['P01', 'P01']
+    assert [os.path.basename(os.path.normpath(path)) for _, path in days] == ['20230501', '20230502']
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            path = os.path.join(dest, *[part for part in info.filename.split('/') if part != '.'])
+            assert int(os.path.getmtime(path)) == int(member_mtime(info))
+
+    #A second run leaves the extracted files alone (the changed bytes of a file with the same size and time stay)
+    path = os.path.join(dest, 'P01', '20230502', 'c.wav')
+    mtime = os.path.getmtime(path)
+    with open(path, 'r+b') as f:
+        f.write(b'X')
+    os.utime(path, (mtime, mtime))
+    assert len(list(extract_days(archive, dest))) == 2
+    with open(path, 'rb') as f:
+        assert f.read(1) == b'X'
+
+@pytest.mark.parametrize('name', ['../evil.wav', 'P01/../../evil.wav', '/tmp/evil.wav'])
+def test_rejects_unsafe_member_names(tmp_path, name):
+    archive = write_archive(tmp_path/'P01.zip', ['P01/20230501/a.wav', name])
+    with pytest.raises(zipfile.BadZipFile):
+        list(extract_days(archive, str(tmp_path/'out')))
+    assert not os.path.exists(tmp_path/'out')
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+from preprocessing.get_audio_chunks import find_label_chunks
+
+base = pd.Timestamp('2020-09-10 12:00:00', tz='UTC')
+
+def labels_frame(intervals):
+    return pd.DataFrame({'Event Created Time': [base + pd.Timedelta(seconds=start) for start, end in intervals],
+                         'Event End': [base + pd.Timedelta(seconds=end) for start, end in intervals]})
+
+def chunk_seconds(chunkDF):
+    start = (chunkDF['Chunk Start'] - base).dt.total_seconds().to_numpy()
+    end = (chunkDF['Chunk End'] - base).dt.total_seconds().to_numpy()
+    return start, end
+
+def check_chunks(intervals, start, end, context=''):
+    assert np.all(start < end), context
+    assert np.all(start[1:] >= end[:-1]), context #sorted and not overlapping
+    for label_start, label_end in intervals: #the chunks together cover every label
+        inside = (start < label_end) & (end > label_start)
+        covered = np.clip(np.minimum(end[inside], label_end) - np.maximum(start[inside], label_start), 0, None).sum()
+        assert covered == pytest.approx(label_end - label_start), context
+
+def test_nested_label_does_not_give_empty_chunk():
+    intervals = [(0, 100), (10, 30), (20, 200)]
+    start, end = chunk_seconds(find_label_chunks(labels_frame(intervals), gap=100, padding=0, max_chunk_length=60))
+    assert list(zip(start, end)) == [(0, 100), (100, 200)]
+    check_chunks(intervals, start, end)
+
+def test_random_labels():
+    for seed in range(300):
+        rng = np.random.default_rng(seed)
+        n = rng.integers(1, 30)
+        starts = np.sort(rng.integers(0, 2000, n)).astype(float)
+        intervals = list(zip(starts, starts + rng.integers(1, 300, n)))
+        gap = float(rng.choice([0, 10, 100]))
+        padding = float(rng.choice([0, 5, 20]))
+        max_chunk_length = rng.choice([None, 30.0, 60.0, 200.0])
+        start, end = chunk_seconds(find_label_chunks(labels_frame(intervals), gap=gap, padding=padding, max_chunk_length=max_chunk_length))
+        check_chunks(intervals, start, end, 'seed %d' % seed)
@@ -0,0 +1,12 @@
+import numpy as np
+from preprocessing.stage_cache import stage_key
+
+def test_number_type_does_not_change_key():
+    assert stage_key({'silence_thresh': -24}) == stage_key({'silence_thresh': -24.0})
+    assert stage_key('chunks', {'gap': 100, 'padding': 20, 'max_chunk_length': None}) == \
+           stage_key('chunks', {'gap': 100.0, 'padding': np.float64(20), 'max_chunk_length': None})
+
+def test_changed_values_change_key():
+    assert stage_key({'silence_thresh': -24}) != stage_key({'silence_thresh': -25.0})
+    assert stage_key({'streaming': True}) != stage_key({'streaming': 1})
+    assert stage_key(['file.mp3', 10, 1700000000123456789]) != stage_key(['file.mp3', 10, 1700000000123456790]) #mtime in ns
@@ -0,0 +1,71 @@
+import os
+import re
+import sys
+import threading
+import http.server
+import pytest
+
+#downloader.py and data_collect.py are in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#A local file server for the download tests.  It answers Range requests like Zenodo, and can be told to drop the first transfer of each file halfway
+#through (flaky) or to ignore Range headers.  Every request is recorded as (filename, Range header)
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_empty(self, code, content_range=None):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        if content_range is not None:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        name = self.path.split('files/')[-1].split('?')[0]
+        range_header = self.headers.get('Range')
+        with server.lock:
+            server.requests.append((name, range_header))
+        data = server.files.get(name)
+        if data is None:
+            return self.send_empty(404)
+        start = 0
+        match = re.match(r'bytes=(\d+)-', range_header or '')
+        if match and not server.ignore_range:
+            start = int(match.group(1))
+            if start >= len(data):
+                return self.send_empty(416, 'bytes */%d' % len(data))
+        body = data[start:]
+        self.send_response(206 if start > 0 else 200)
+        self.send_header('Content-Length', str(len(body)))
+        if start > 0:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(data) - 1, len(data)))
+        self.end_headers()
+        with server.lock:
+            drop = server.flaky and name not in server.dropped
+            if drop:
+                server.dropped.add(name)
+        if drop:
+            self.wfile.write(body[:len(body)//2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+@pytest.fixture
+def file_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.files = {'P%02d.zip' % k: os.urandom(200000 + 1000*k) for k in range(1, 5)}
+    server.flaky = False
+    server.ignore_range = False
+    server.dropped = set()
+    server.requests = []
+    server.lock = threading.Lock()
+    server.base_url = 'http://127.0.0.1:%d/records/5786860/files/' % server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
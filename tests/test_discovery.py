@@ -0,0 +1,90 @@
+import os
+import json
+import threading
+import http.server
+import pytest
+import downloader
+from downloader import parse_record_json, parse_record_html, discover_files, make_session
+
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def read_fixture(name):
+    with open(os.path.join(fixtures, name)) as f:
+        return f.read()
+
+@pytest.mark.parametrize('name', ['zenodo_record_current.json', 'zenodo_record_entries.json'])
+def test_parse_record_json(name):
+    files = parse_record_json(json.loads(read_fixture(name)))
+    assert list(files.filename[:2]) == ['P01.zip', 'P02.zip']
+    assert list(files.links[:2]) == ['https://zenodo.org/api/records/5786860/files/P01.zip/content',
+                                     'https://zenodo.org/api/records/5786860/files/P02.zip/content']
+    assert list(files['size'][:2]) == [104857600, 52428800]
+    assert files.checksum[0] == 'md5:0cc175b9c0f1b6a831c399e269772661'
+
+def test_parse_record_json_legacy():
+    files = parse_record_json(json.loads(read_fixture('zenodo_record_legacy.json')))
+    #The file without a link is left out; "filename"/"filesize" and "download" links are read like "key"/"size" and "self"
+    assert list(files.filename) == ['P01.zip', 'P02.zip']
+    assert list(files.links) == ['https://zenodo.org/api/files/6a1c1f0e-2b1d-4d5e-9a0b-1c2d3e4f5a6b/P01.zip',
+                                 'https://zenodo.org/record/5786860/files/P02.zip?download=1']
+    assert list(files['size']) == [104857600, 52428800]
+
+def test_parse_record_json_without_files():
+    files = parse_record_json({'id': 1})
+    assert len(files) == 0 and list(files.columns) == ['links', 'filename', 'size', 'checksum']
+
+def test_parse_record_html():
+    files = parse_record_html(read_fixture('zenodo_record_page.html'), 'https://zenodo.org/records/5786860')
+    #Preview links, the archive of all files, and repeated download buttons are ignored
+    assert list(files.links) == ['https://zenodo.org/records/5786860/files/P01.zip?download=1',
+                                 'https://zenodo.org/records/5786860/files/P02.zip?download=1',
+                                 'https://zenodo.org/records/5786860/files/dataset%20file%20directory.csv?download=1']
+    assert list(files.filename) == ['P01.zip', 'P02.zip', 'dataset file directory.csv']
+
+def test_parse_record_html_legacy():
+    files = parse_record_html(read_fixture('zenodo_record_page_legacy.html'), 'https://zenodo.org/record/5786860')
+    assert list(files.links) == ['https://zenodo.org/record/5786860/files/P01.zip?download=1',
+                                 'https://zenodo.org/api/records/5786860/files/P02.zip/content']
+
+#A local server that answers the records API and record page requests with the fixtures
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        response = self.server.responses.get(self.path)
+        if response is None:
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = response.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def zenodo(monkeypatch):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.responses = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:%d' % server.server_port
+    monkeypatch.setattr(downloader, 'ZENODO_API', base + '/api/records/')
+    monkeypatch.setattr(downloader, 'ZENODO_RECORD', base + '/records/')
+    yield server, base
+    server.shutdown()
+    server.server_close()
+
+def test_discover_files_uses_api(zenodo):
+    server, base = zenodo
+    server.responses['/api/records/5786860'] = read_fixture('zenodo_record_current.json')
+    files = discover_files('5786860', make_session(1), timeout=5)
+    assert list(files.filename) == ['P01.zip', 'P02.zip', 'dataset_file_directory.csv']
+    assert files.checksum.notna().all()
+
+def test_discover_files_falls_back_to_page(zenodo):
+    server, base = zenodo
+    server.responses['/records/5786860'] = read_fixture('zenodo_record_page.html') #The API request gets a 500
+    files = discover_files('5786860', make_session(1), timeout=5)
+    assert list(files.filename) == ['P01.zip', 'P02.zip', 'dataset file directory.csv']
+    assert files.links[0] == base + '/records/5786860/files/P01.zip?download=1'
@@ -0,0 +1,66 @@
+import os
+from downloader import download_all, download_file, make_session
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_download_all(file_server, tmp_path):
+    links = [file_server.base_url + name + '?download=1' for name in sorted(file_server.files)]
+    assert download_all(links, str(tmp_path), workers=3) == []
+    for name, data in file_server.files.items():
+        assert read(tmp_path / name) == data
+        assert not os.path.exists(str(tmp_path / name) + '.part')
+
+def test_dropped_transfers_resume(file_server, tmp_path):
+    file_server.flaky = True
+    links = [file_server.base_url + name for name in sorted(file_server.files)]
+    assert download_all(links, str(tmp_path), workers=2, backoff=0, chunk_size=4096) == []
+    for name, data in file_server.files.items():
+        assert read(tmp_path / name) == data
+        ranges = [range_header for requested, range_header in file_server.requests if requested == name]
+        #The retry only asks for what wasn't written before the connection dropped (at most the last, incomplete chunk is fetched again)
+        assert len(ranges) == 2 and ranges[0] is None
+        offset = int(ranges[1][len('bytes='):-1])
+        assert len(data)//2 - 4096 < offset <= len(data)//2
+
+def test_resume_from_part_file(file_server, tmp_path):
+    data = file_server.files['P01.zip']
+    path = str(tmp_path / 'P01.zip')
+    with open(path + '.part', 'wb') as f:
+        f.write(data[:12345])
+    received = download_file(make_session(1), file_server.base_url + 'P01.zip', path, backoff=0)
+    assert read(path) == data
+    assert received == len(data) - 12345
+    assert file_server.requests == [('P01.zip', 'bytes=12345-')]
+
+def test_complete_part_file(file_server, tmp_path):
+    data = file_server.files['P02.zip']
+    path = str(tmp_path / 'P02.zip')
+    with open(path + '.part', 'wb') as f:
+        f.write(data)
+    assert download_file(make_session(1), file_server.base_url + 'P02.zip', path, backoff=0) == 0 #The server answers 416
+    assert read(path) == data
+
+def test_part_file_longer_than_file(file_server, tmp_path):
+    data = file_server.files['P02.zip']
+    path = str(tmp_path / 'P02.zip')
+    with open(path + '.part', 'wb') as f:
+        f.write(b'x'*(len(data) + 10))
+    assert download_file(make_session(1), file_server.base_url + 'P02.zip', path, backoff=0) == len(data)
+    assert read(path) == data #The server answers 416 with a different length, so the download starts again from 0
+    assert file_server.requests == [('P02.zip', 'bytes=%d-' % (len(data) + 10)), ('P02.zip', None)]
+
+def test_server_ignoring_range(file_server, tmp_path):
+    file_server.ignore_range = True
+    data = file_server.files['P03.zip']
+    path = str(tmp_path / 'P03.zip')
+    with open(path + '.part', 'wb') as f:
+        f.write(b'x'*5000)
+    download_file(make_session(1), file_server.base_url + 'P03.zip', path, backoff=0)
+    assert read(path) == data #The partial file is replaced by the full response
+
+def test_missing_file_is_not_retried(file_server, tmp_path):
+    failed = download_all([file_server.base_url + 'missing.zip'], str(tmp_path), workers=1, backoff=0)
+    assert [name for name, error in failed] == ['missing.zip']
+    assert file_server.requests == [('missing.zip', None)]
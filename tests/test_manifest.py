@@ -0,0 +1,66 @@
+import os
+import pandas as pd
+from downloader import download_all, file_checksum, load_manifest, MANIFEST_NAME
+
+def links_for(file_server, names):
+    return [file_server.base_url + name + '?download=1' for name in names]
+
+def test_second_run_skips_valid_files(file_server, tmp_path):
+    names = sorted(file_server.files)
+    assert download_all(links_for(file_server, names), str(tmp_path), workers=2) == []
+    manifest = load_manifest(str(tmp_path / MANIFEST_NAME))
+    assert sorted(manifest) == names
+    for name in names:
+        assert manifest[name]['status'] == 'ok'
+        assert manifest[name]['size'] == len(file_server.files[name])
+        assert manifest[name]['checksum'] == file_checksum(str(tmp_path / name))
+
+    del file_server.requests[:]
+    assert download_all(links_for(file_server, names), str(tmp_path), workers=2) == []
+    assert file_server.requests == [] #Nothing is downloaded again
+
+def test_wrong_checksum_is_removed(file_server, tmp_path):
+    failed = download_all(links_for(file_server, ['P01.zip']), str(tmp_path), checksums={'P01.zip': 'md5:' + '0'*32})
+    assert [name for name, error in failed] == ['P01.zip']
+    assert not os.path.exists(str(tmp_path / 'P01.zip'))
+    assert load_manifest(str(tmp_path / MANIFEST_NAME))['P01.zip']['status'] == 'corrupt'
+
+    #The next run downloads it again
+    del file_server.requests[:]
+    download_all(links_for(file_server, ['P01.zip']), str(tmp_path))
+    assert [name for name, range_header in file_server.requests] == ['P01.zip']
+
+def test_expected_checksum_accepts_matching_file(file_server, tmp_path):
+    path = tmp_path / 'reference.zip'
+    path.write_bytes(file_server.files['P02.zip'])
+    expected = {'P02.zip': file_checksum(str(path))}
+    assert download_all(links_for(file_server, ['P02.zip']), str(tmp_path), checksums=expected) == []
+    assert load_manifest(str(tmp_path / MANIFEST_NAME))['P02.zip']['checksum'] == expected['P02.zip']
+
+def test_changed_size_is_downloaded_again(file_server, tmp_path):
+    download_all(links_for(file_server, ['P03.zip']), str(tmp_path))
+    with open(str(tmp_path / 'P03.zip'), 'ab') as f:
+        f.write(b'extra')
+    del file_server.requests[:]
+    download_all(links_for(file_server, ['P03.zip']), str(tmp_path))
+    assert len(file_server.requests) == 1
+    assert (tmp_path / 'P03.zip').read_bytes() == file_server.files['P03.zip']
+
+def test_verify_rehashes_same_size_changes(file_server, tmp_path):
+    download_all(links_for(file_server, ['P04.zip']), str(tmp_path))
+    data = bytearray(file_server.files['P04.zip'])
+    data[100] ^= 0xff
+    (tmp_path / 'P04.zip').write_bytes(bytes(data)) #Same size, different contents
+
+    del file_server.requests[:]
+    download_all(links_for(file_server, ['P04.zip']), str(tmp_path))
+    assert file_server.requests == [] #Without verify the manifest entry is trusted
+    download_all(links_for(file_server, ['P04.zip']), str(tmp_path), verify=True)
+    assert len(file_server.requests) == 1
+    assert (tmp_path / 'P04.zip').read_bytes() == file_server.files['P04.zip']
+
+def test_manifest_file_format(file_server, tmp_path):
+    download_all(links_for(file_server, ['P01.zip', 'missing.zip']), str(tmp_path), backoff=0)
+    df = pd.read_csv(str(tmp_path / MANIFEST_NAME))
+    assert list(df.columns) == ['filename', 'size', 'checksum', 'status']
+    assert dict(zip(df.filename, df.status)) == {'P01.zip': 'ok', 'missing.zip': 'failed'}